@@ -0,0 +1,159 @@
+"""
+分析模式比較腳本
+比較 single (單次分析) 與 per-dimension (各維度並行評分) 模式的耗時與評分一致性
+
+使用方式:
+    python benchmark_analysis_modes.py -i sample_fa_report.txt -b openai -m gpt-4o
+    python benchmark_analysis_modes.py -i r1.txt r2.pdf --repeat 3 --json results.json
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+from fa_report_analyzer_v2 import FAReportAnalyzer
+
+
+def run_once(analyzer, report_content, images):
+    """執行一次分析, 返回 (耗時秒數, 結果或 None, 錯誤訊息或 None)"""
+    start = time.perf_counter()
+    try:
+        result = analyzer.analyze_with_ai(report_content, images)
+        return time.perf_counter() - start, result, None
+    except Exception as e:
+        return time.perf_counter() - start, None, str(e)
+
+
+def compare_results(baseline, candidate, dimensions):
+    """比較兩次分析結果的總分、等級與各維度分數差異"""
+    dim_diffs = {}
+    for name in dimensions:
+        try:
+            a = float(baseline['dimension_scores'][name]['score'])
+            b = float(candidate['dimension_scores'][name]['score'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        dim_diffs[name] = abs(a - b)
+
+    return {
+        'total_diff': abs(float(baseline['total_score']) - float(candidate['total_score'])),
+        'grade_match': baseline.get('grade') == candidate.get('grade'),
+        'dimension_mae': sum(dim_diffs.values()) / len(dim_diffs) if dim_diffs else None,
+        'dimension_diffs': dim_diffs,
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較 single 與 per-dimension 分析模式的耗時與評分一致性')
+    parser.add_argument('-i', '--input', nargs='+', required=True, help='FA 報告檔案路徑 (可多個)')
+    parser.add_argument('-b', '--backend', default='ollama', choices=['ollama', 'openai', 'anthropic'],
+                        help='AI 後端 (預設: ollama)')
+    parser.add_argument('-m', '--model', help='模型名稱')
+    parser.add_argument('-k', '--api-key', help='API Key')
+    parser.add_argument('--base-url', help='API Base URL')
+    parser.add_argument('--skip-images', action='store_true', help='跳過圖片分析')
+    parser.add_argument('--repeat', type=int, default=1, help='每份報告每種模式的執行次數 (預設: 1)')
+    parser.add_argument('--json', dest='json_output', help='將詳細結果輸出為 JSON 檔案')
+    args = parser.parse_args()
+
+    common = dict(backend=args.backend, model=args.model, api_key=args.api_key,
+                  base_url=args.base_url, skip_images=args.skip_images, use_cache=False)
+    analyzers = {
+        'single': FAReportAnalyzer(analysis_mode='single', **common),
+        'per-dimension': FAReportAnalyzer(analysis_mode='per-dimension', **common),
+    }
+    reader = analyzers['single']
+    print(f"後端: {args.backend}, 模型: {reader.model}, 每種模式執行 {args.repeat} 次")
+
+    latencies = {mode: [] for mode in analyzers}
+    failures = {mode: 0 for mode in analyzers}
+    comparisons = []
+    details = []
+
+    for input_file in args.input:
+        path = Path(input_file)
+        print(f"\n=== {path.name} ===")
+        try:
+            report_content, images = reader._read_report_for_analysis(str(path))
+        except Exception as e:
+            print(f"✗ 讀取失敗: {e}")
+            continue
+
+        for run in range(1, args.repeat + 1):
+            results = {}
+            for mode, analyzer in analyzers.items():
+                elapsed, result, error = run_once(analyzer, report_content, images)
+                if result is None:
+                    failures[mode] += 1
+                    print(f"  [{run}] {mode:<14} 失敗 ({elapsed:.2f}s): {error}")
+                    continue
+                latencies[mode].append(elapsed)
+                results[mode] = result
+                print(f"  [{run}] {mode:<14} {elapsed:7.2f}s  總分 {result['total_score']}  等級 {result['grade']}")
+
+            entry = {'file': str(path), 'run': run,
+                     'latency': {mode: latencies[mode][-1] for mode in results},
+                     'results': results}
+            if len(results) == len(analyzers):
+                comparison = compare_results(results['single'], results['per-dimension'], reader.dimensions)
+                comparisons.append(comparison)
+                entry['comparison'] = comparison
+                print(f"      總分差 {comparison['total_diff']:.1f}, 等級一致: {'是' if comparison['grade_match'] else '否'}")
+            details.append(entry)
+
+    print("\n" + "=" * 60)
+    print("耗時統計 (秒)")
+    print("=" * 60)
+    print(f"{'模式':<16}{'次數':>6}{'失敗':>6}{'平均':>10}{'p50':>10}{'p95':>10}")
+    summary = {'latency': {}, 'agreement': {}}
+    for mode, values in latencies.items():
+        mean = sum(values) / len(values) if values else None
+        stats = {'runs': len(values), 'failures': failures[mode], 'mean': mean,
+                 'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+        summary['latency'][mode] = stats
+        fmt = lambda v: f"{v:>10.2f}" if v is not None else f"{'-':>10}"
+        print(f"{mode:<16}{stats['runs']:>6}{stats['failures']:>6}{fmt(mean)}{fmt(stats['p50'])}{fmt(stats['p95'])}")
+
+    single_mean = summary['latency']['single']['mean']
+    per_dim_mean = summary['latency']['per-dimension']['mean']
+    if single_mean and per_dim_mean:
+        print(f"\nper-dimension 相對 single 的加速比: {single_mean / per_dim_mean:.2f}x")
+
+    if comparisons:
+        mae_values = [c['dimension_mae'] for c in comparisons if c['dimension_mae'] is not None]
+        summary['agreement'] = {
+            'pairs': len(comparisons),
+            'mean_total_diff': sum(c['total_diff'] for c in comparisons) / len(comparisons),
+            'max_total_diff': max(c['total_diff'] for c in comparisons),
+            'grade_match_rate': sum(c['grade_match'] for c in comparisons) / len(comparisons),
+            'mean_dimension_mae': sum(mae_values) / len(mae_values) if mae_values else None,
+        }
+        agreement = summary['agreement']
+        print("\n評分一致性")
+        print(f"  比較組數:         {agreement['pairs']}")
+        print(f"  總分平均差:       {agreement['mean_total_diff']:.2f}")
+        print(f"  總分最大差:       {agreement['max_total_diff']:.2f}")
+        print(f"  等級一致率:       {agreement['grade_match_rate'] * 100:.1f}%")
+        if agreement['mean_dimension_mae'] is not None:
+            print(f"  維度分數平均差:   {agreement['mean_dimension_mae']:.2f}")
+
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'details': details}, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ 詳細結果已儲存至: {args.json_output}")
+
+    return 0 if comparisons else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
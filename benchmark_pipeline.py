@@ -0,0 +1,376 @@
+"""
+分析流程效能測試腳本
+產生指定大小與圖片數量的模擬 FA 報告 (.txt/.pdf/.docx/.pptx), 以本機模擬伺服器
+(llm_stub_server.py, 可模擬延遲與 token 生成速度) 作為 LLM 後端執行完整的批次分析流程,
+輸出吞吐量、各階段耗時百分位數與記憶體峰值。
+
+模擬報告與模擬伺服器的回應都是固定的, 相同參數的結果可互相比較;
+-b ollama 以模擬伺服器的 /api/chat 測試 Ollama 路徑 (num_ctx 調整與預先載入);
+--stream 測試串流與提前結束生成, 首個 token 時間列為 first_token 階段。
+加上 --baseline 時與先前的結果比較, 吞吐量或各階段 p95 退步超過容許範圍即返回 1。
+
+使用方式:
+    python benchmark_pipeline.py --reports 8 --pages 10 --images 4
+    python benchmark_pipeline.py --formats pdf pptx --latency 0.5 --tokens-per-second 80 --json bench.json
+    python benchmark_pipeline.py -b ollama --stream --trailing-tokens 200
+    python benchmark_pipeline.py --baseline bench.json --tolerance 0.2
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import contextlib
+import tempfile
+import subprocess
+from pathlib import Path
+
+from fa_report_analyzer_v2 import FAReportAnalyzer
+
+
+FORMATS = ['txt', 'pdf', 'docx', 'pptx']
+
+SECTIONS = ["基本資訊", "問題描述", "分析方法與流程", "數據與證據", "根因分析", "改善對策"]
+
+SENTENCES = [
+    "樣品於高溫高濕測試 {n} 小時後出現漏電流異常, 失效率為 {p}%。",
+    "以 X-ray 與 C-SAM 檢查封裝, 第 {n} 號樣品在焊點位置發現空洞。",
+    "IV 曲線量測顯示 Pin {n} 對地阻抗下降至 {p} kΩ, 與良品差異明顯。",
+    "經 decap 後以 OM/SEM 觀察, 晶片表面第 {n} 區有金屬遷移痕跡。",
+    "EDX 分析偵測到氯元素殘留, 含量約 {p} wt%, 推測來自清洗製程。",
+    "比對同批次 {n} 顆良品, 未發現相同的異常現象。",
+    "根據 5 Why 分析, 根本原因為迴焊溫度曲線第 {n} 段升溫過快。",
+    "短期對策為調整爐溫設定並全檢庫存品, 長期對策為更新製程規範第 {n} 版。",
+]
+
+
+def synthetic_pages(rng: random.Random, index: int, pages: int, chars_per_page: int):
+    """產生報告各頁文字 (含重複的頁首/頁尾與頁碼, 與真實報告相同)"""
+    result = []
+    for page in range(1, pages + 1):
+        lines = [f"FA-REPORT-{index:04d} 失效分析報告", f"【{SECTIONS[(page - 1) % len(SECTIONS)]}】"]
+        length = 0
+        while length < chars_per_page:
+            line = rng.choice(SENTENCES).format(n=rng.randint(1, 999), p=round(rng.uniform(0.1, 99), 1))
+            lines.append(line)
+            length += len(line)
+        lines += ["機密文件 - 僅供內部使用", f"第 {page} 頁 / 共 {pages} 頁"]
+        result.append(lines)
+    return result
+
+
+def synthetic_image(rng: random.Random, size: int) -> bytes:
+    """產生有資訊量的圖片 (漸層加雜訊, 不會被當作裝飾性或重複圖片)"""
+    from PIL import Image
+
+    width, height = size, size * 3 // 4
+    base = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+    image = Image.blend(base, noise, 0.5)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85)
+    return output.getvalue()
+
+
+def write_txt(path: Path, pages, images):
+    path.write_text("\n\n".join("\n".join(lines) for lines in pages), encoding='utf-8')
+
+
+def write_pdf(path: Path, pages, images):
+    import fitz  # PyMuPDF
+
+    document = fitz.open()
+    for page_num, lines in enumerate(pages):
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(40, 40, 555, 480), "\n".join(lines), fontname="china-t", fontsize=9)
+        for image in images[page_num::len(pages)]:
+            page.insert_image(fitz.Rect(120, 500, 480, 770), stream=image)
+    document.save(str(path))
+    document.close()
+
+
+def write_docx(path: Path, pages, images):
+    from docx import Document
+    from docx.shared import Inches
+
+    document = Document()
+    for page_num, lines in enumerate(pages):
+        for line in lines:
+            document.add_paragraph(line)
+        for image in images[page_num::len(pages)]:
+            document.add_picture(io.BytesIO(image), width=Inches(4))
+        document.add_page_break()
+    document.save(str(path))
+
+
+def write_pptx(path: Path, pages, images):
+    from pptx import Presentation
+    from pptx.util import Inches, Pt
+
+    presentation = Presentation()
+    layout = presentation.slide_layouts[6]  # 空白版面
+    for page_num, lines in enumerate(pages):
+        slide = presentation.slides.add_slide(layout)
+        frame = slide.shapes.add_textbox(Inches(0.3), Inches(0.3), Inches(5.2), Inches(6.8)).text_frame
+        frame.word_wrap = True
+        frame.text = lines[0]
+        for line in lines[1:]:
+            paragraph = frame.add_paragraph()
+            paragraph.text = line
+            paragraph.font.size = Pt(9)
+        for image in images[page_num::len(pages)]:
+            slide.shapes.add_picture(io.BytesIO(image), Inches(5.6), Inches(1.5), width=Inches(4))
+    presentation.save(str(path))
+
+
+WRITERS = {'txt': write_txt, 'pdf': write_pdf, 'docx': write_docx, 'pptx': write_pptx}
+
+
+def generate_reports(workdir: Path, formats, reports: int, pages: int, chars_per_page: int,
+                     images: int, image_size: int, seed: int):
+    """產生模擬報告, 返回文件路徑列表 (各格式輪流)"""
+    rng = random.Random(seed)
+    files = []
+    for index in range(reports):
+        fmt = formats[index % len(formats)]
+        report_pages = synthetic_pages(rng, index, pages, chars_per_page)
+        report_images = [synthetic_image(rng, image_size) for _ in range(images)] if fmt != 'txt' else []
+        path = workdir / f"report_{index:04d}.{fmt}"
+        WRITERS[fmt](path, report_pages, report_images)
+        files.append(path)
+    return files
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_server(port: int, latency: float, tokens_per_second: float, trailing_tokens: int = 0):
+    """在獨立行程啟動模擬伺服器 (不與受測流程競爭 CPU 與記憶體)"""
+    command = [sys.executable, str(Path(__file__).with_name('llm_stub_server.py')),
+               '--port', str(port), '--latency', str(latency)]
+    if tokens_per_second:
+        command += ['--tokens-per-second', str(tokens_per_second)]
+    if trailing_tokens:
+        command += ['--trailing-tokens', str(trailing_tokens)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("模擬伺服器啟動失敗")
+
+
+class quiet_output:
+    """暫時將 stdout 導向 /dev/null (包含解析子行程的輸出)"""
+
+    def __enter__(self):
+        sys.stdout.flush()
+        self.saved = os.dup(1)
+        self.devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(self.devnull, 1)
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout.flush()
+        os.dup2(self.saved, 1)
+        os.close(self.saved)
+        os.close(self.devnull)
+        return False
+
+
+def peak_memory_mb():
+    """本行程與子行程 (解析行程) 的記憶體峰值 (MB)"""
+    import resource
+
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOS 單位為 bytes, Linux 為 KB
+    return {
+        'main': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def stage_statistics(records):
+    """各階段耗時的平均與百分位數 (秒)"""
+    stages = {}
+    for record in records:
+        for stage, seconds in record['stages'].items():
+            stages.setdefault(stage, []).append(seconds)
+        stages.setdefault('total', []).append(record['elapsed'])
+    return {stage: {'mean': round(sum(values) / len(values), 4),
+                    'p50': round(percentile(values, 50), 4),
+                    'p95': round(percentile(values, 95), 4),
+                    'p99': round(percentile(values, 99), 4),
+                    'n': len(values)}
+            for stage, values in stages.items()}
+
+
+def compare_with_baseline(result, baseline, tolerance, min_seconds=0.05):
+    """返回退步項目的說明列表"""
+    regressions = []
+    old, new = baseline['throughput']['reports_per_second'], result['throughput']['reports_per_second']
+    if old and new < old * (1 - tolerance):
+        regressions.append(f"吞吐量 {new:.2f} 報告/秒 (基準 {old:.2f})")
+    for stage, stats in result['stages'].items():
+        old_stats = baseline['stages'].get(stage)
+        # 太短的階段受計時誤差影響較大, 不比較
+        if not old_stats or old_stats['p95'] < min_seconds:
+            continue
+        if stats['p95'] > old_stats['p95'] * (1 + tolerance):
+            regressions.append(f"{stage} p95 {stats['p95']:.3f}s (基準 {old_stats['p95']:.3f}s)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以模擬 LLM 後端測試 FA 報告分析流程的吞吐量、各階段耗時與記憶體')
+    parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS,
+                        help='報告格式 (預設: 全部, 輪流產生)')
+    parser.add_argument('--reports', type=int, default=8, help='報告數量 (預設: 8)')
+    parser.add_argument('--pages', type=int, default=10, help='每份報告頁數 (預設: 10)')
+    parser.add_argument('--chars-per-page', type=int, default=600, help='每頁字元數 (預設: 600)')
+    parser.add_argument('--images', type=int, default=4, help='每份報告圖片數 (txt 除外, 預設: 4)')
+    parser.add_argument('--image-size', type=int, default=1024, help='圖片寬度 px (預設: 1024)')
+    parser.add_argument('--seed', type=int, default=0, help='模擬報告的隨機種子 (預設: 0)')
+    parser.add_argument('-b', '--backend', default='openai', choices=['openai', 'anthropic', 'ollama'],
+                        help='模擬的 API 格式 (預設: openai)')
+    parser.add_argument('--mode', default='single', choices=['single', 'per-dimension', 'mapreduce'],
+                        help='分析模式 (預設: single)')
+    parser.add_argument('--concurrency', type=int, help='同時進行的 LLM 請求數 (預設: 依後端)')
+    parser.add_argument('--parse-workers', type=int, help='解析文件的行程數 (預設: CPU 核心數)')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='使用 asyncio 批次模式')
+    parser.add_argument('--stream', action='store_true', help='使用串流回應 (JSON 完整時提前結束生成)')
+    parser.add_argument('--latency', type=float, default=0.2, help='模擬伺服器每個請求的延遲秒數 (預設: 0.2)')
+    parser.add_argument('--tokens-per-second', type=float, default=200,
+                        help='模擬的輸出 token 生成速度 (預設: 200, 0 表示不模擬)')
+    parser.add_argument('--trailing-tokens', type=int, default=0,
+                        help='串流回應在 JSON 之後附加的說明文字量, 提前結束生成可省下的部分 (預設: 0)')
+    parser.add_argument('--workdir', help='模擬報告與輸出的資料夾 (預設: 暫存資料夾, 結束後刪除)')
+    parser.add_argument('--json', dest='json_output', help='將結果輸出為 JSON 檔案 (可作為 --baseline)')
+    parser.add_argument('--baseline', help='先前 --json 輸出的結果, 用於偵測效能退步')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='與基準比較的容許比例 (預設: 0.2)')
+    parser.add_argument('--min-stage-seconds', type=float, default=0.05,
+                        help='基準 p95 低於此秒數的階段不比較 (預設: 0.05)')
+    parser.add_argument('--verbose', action='store_true', help='顯示分析流程的輸出')
+    args = parser.parse_args()
+
+    temp_dir = None if args.workdir else tempfile.TemporaryDirectory(prefix='fa_bench_')
+    workdir = Path(args.workdir or temp_dir.name)
+    input_dir = workdir / 'reports'
+    input_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"產生 {args.reports} 份模擬報告 ({', '.join(args.formats)}), 每份 {args.pages} 頁, "
+          f"{args.images} 張圖片...")
+    files = generate_reports(input_dir, args.formats, args.reports, args.pages, args.chars_per_page,
+                             args.images, args.image_size, args.seed)
+    input_bytes = sum(path.stat().st_size for path in files)
+
+    port = free_port()
+    server = start_stub_server(port, args.latency, args.tokens_per_second, args.trailing_tokens)
+    base_url = f"http://127.0.0.1:{port}" + ('/v1' if args.backend == 'openai' else '')
+    # Ollama 不需要 API key, 模型名稱由模擬伺服器原樣回傳
+    credentials = {'model': 'stub'} if args.backend == 'ollama' else {'api_key': 'benchmark'}
+    metrics_log = workdir / 'metrics.jsonl'
+    if metrics_log.exists():
+        metrics_log.unlink()
+
+    try:
+        with quiet_output() if not args.verbose else contextlib.nullcontext():
+            analyzer = FAReportAnalyzer(backend=args.backend, base_url=base_url, **credentials,
+                                        use_cache=False, analysis_mode=args.mode, stream=args.stream,
+                                        metrics_log=str(metrics_log))
+            start = time.perf_counter()
+            summary = analyzer.analyze_batch([str(path) for path in files], str(workdir / 'output'),
+                                             concurrency=args.concurrency,
+                                             parse_workers=args.parse_workers,
+                                             use_async=args.use_async)
+            elapsed = time.perf_counter() - start
+        # 在模擬伺服器結束前取得, 子行程的峰值只包含已結束的解析行程
+        memory = peak_memory_mb()
+    finally:
+        server.terminate()
+        server.wait()
+
+    with open(metrics_log, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    result = {
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('json_output', 'baseline', 'tolerance', 'min_stage_seconds',
+                                'verbose', 'workdir')},
+        'succeeded': summary['succeeded'],
+        'failed': summary['failed'],
+        'elapsed': round(elapsed, 3),
+        'throughput': {
+            'reports_per_second': round(len(files) / elapsed, 3),
+            'input_mb_per_second': round(input_bytes / 1024 / 1024 / elapsed, 3),
+        },
+        'input_mb': round(input_bytes / 1024 / 1024, 2),
+        'stages': stage_statistics(records),
+        'tokens': {
+            'prompt': sum(r['counters'].get('prompt_tokens', 0) for r in records),
+            'completion': sum(r['counters'].get('completion_tokens', 0) for r in records),
+        },
+        'early_stops': sum(r['counters'].get('early_stops', 0) for r in records),
+        'peak_memory_mb': memory,
+    }
+
+    print("\n" + "=" * 60)
+    print(f"報告: {len(files)} 份 ({result['input_mb']} MB), 成功 {result['succeeded']}, "
+          f"失敗 {result['failed']}, 耗時 {result['elapsed']:.2f} 秒")
+    print(f"吞吐量: {result['throughput']['reports_per_second']:.2f} 報告/秒, "
+          f"{result['throughput']['input_mb_per_second']:.2f} MB/秒")
+    if args.stream:
+        print(f"串流提前結束生成: {result['early_stops']} 個請求")
+    print(f"記憶體峰值: 主行程 {result['peak_memory_mb']['main']} MB, "
+          f"解析行程 {result['peak_memory_mb']['children']} MB")
+    print("=" * 60)
+    print(f"{'階段':<12}{'次數':>6}{'平均':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, stats in sorted(result['stages'].items(), key=lambda item: -item[1]['mean']):
+        print(f"{stage:<12}{stats['n']:>6}{stats['mean']:>10.3f}{stats['p50']:>10.3f}"
+              f"{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ 結果已儲存至: {args.json_output}")
+
+    if temp_dir:
+        temp_dir.cleanup()
+
+    if result['failed']:
+        return 1
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != result['config']:
+            print("\n⚠️  基準的測試參數與本次不同, 比較結果僅供參考")
+        regressions = compare_with_baseline(result, baseline, args.tolerance, args.min_stage_seconds)
+        if regressions:
+            print(f"\n✗ 與基準相比效能退步 (容許 {args.tolerance * 100:.0f}%):")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"\n✓ 未超出基準的容許範圍 ({args.tolerance * 100:.0f}%)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+啟動時間測試腳本
+以 python -X importtime 測量各情境的匯入耗時 (扣除 Python 本身啟動的匯入), 列出最慢的套件,
+超過 --threshold-ms 即返回 1, 可用於 CI 檢查是否又在模組層級匯入了大型套件。
+上限包含情境中匯入的後端 SDK; 後端 SDK 一欄另外列出其耗時, 方便找出超過上限的原因。
+
+情境:
+    import   僅匯入 fa_report_analyzer_v2
+    help     執行 fa_report_analyzer_v2.py --help
+    ollama   建立 Ollama 後端的分析器 (不預先載入模型) 並讀取一份 .txt 報告
+             (後端 SDK 在第一次送出請求時才匯入, 此情境不應載入 ollama 套件)
+
+使用方式:
+    python benchmark_startup.py
+    python benchmark_startup.py --scenarios import help --repeat 10 --threshold-ms 200
+    python benchmark_startup.py --json startup.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+
+SCRIPT = Path(__file__).resolve().parent / 'fa_report_analyzer_v2.py'
+
+# 各後端 SDK 的套件名稱 (情境中實際匯入的後端套件另外列出耗時, 仍計入上限)
+BACKEND_PACKAGES = ['ollama', 'openai', 'anthropic']
+
+
+def scenario_command(name: str, report: Path):
+    """各情境的 Python 參數"""
+    if name == 'baseline':
+        return ['-c', 'pass']
+    if name == 'import':
+        return ['-c', 'import fa_report_analyzer_v2']
+    if name == 'help':
+        return [str(SCRIPT), '--help']
+    if name == 'ollama':
+        code = ("from fa_report_analyzer_v2 import FAReportAnalyzer\n"
+                "a = FAReportAnalyzer(backend='ollama', use_cache=False, ollama_warmup=False)\n"
+                f"a._read_report_for_analysis({str(report)!r})\n")
+        return ['-c', code]
+    raise ValueError(f"未知的情境: {name}")
+
+
+def parse_importtime(stderr: str):
+    """解析 -X importtime 的輸出, 返回 {頂層模組: 累計微秒}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('  '):  # 巢狀匯入已計入上層模組的累計時間
+            continue
+        name = name.strip()
+        modules[name] = modules.get(name, 0) + int(cumulative)
+    return modules
+
+
+def run_scenario(name: str, report: Path):
+    """執行一次情境, 返回 (匯入耗時微秒 {模組: 微秒}, 總耗時秒數)"""
+    command = [sys.executable, '-X', 'importtime'] + scenario_command(name, report)
+    start = time.perf_counter()
+    proc = subprocess.run(command, capture_output=True, text=True, cwd=SCRIPT.parent)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"情境 {name} 執行失敗:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以 -X importtime 測量 fa_report_analyzer_v2 的啟動耗時')
+    parser.add_argument('--scenarios', nargs='+', default=['import', 'help', 'ollama'],
+                        choices=['import', 'help', 'ollama'], help='測試情境 (預設: 全部)')
+    parser.add_argument('--repeat', type=int, default=5, help='每個情境的執行次數, 取中位數 (預設: 5)')
+    parser.add_argument('--threshold-ms', type=float, default=200,
+                        help='匯入耗時上限 (毫秒, 包含後端 SDK; 預設: 200)')
+    parser.add_argument('--top', type=int, default=8, help='列出最慢的頂層模組數 (預設: 8)')
+    parser.add_argument('--json', dest='json_output', help='將結果輸出為 JSON 檔案')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = Path(workdir) / 'startup_report.txt'
+        report.write_text("失效分析報告\n樣品於高溫高濕測試後出現漏電流異常。\n", encoding='utf-8')
+
+        # Python 啟動本身 (site 等) 的匯入, 各情境都會扣除
+        baseline_modules = set()
+        for _ in range(args.repeat):
+            modules, _ = run_scenario('baseline', report)
+            baseline_modules.update(modules)
+
+        results = {}
+        for name in args.scenarios:
+            totals, sdk_totals, walls, slowest = [], [], [], {}
+            for _ in range(args.repeat):
+                modules, elapsed = run_scenario(name, report)
+                added = {m: us for m, us in modules.items() if m not in baseline_modules}
+                sdk = sum(us for m, us in added.items() if m in BACKEND_PACKAGES)
+                totals.append(sum(added.values()) / 1000)
+                sdk_totals.append(sdk / 1000)
+                walls.append(elapsed * 1000)
+                for module, us in added.items():
+                    slowest.setdefault(module, []).append(us / 1000)
+            results[name] = {
+                'import_ms': round(statistics.median(totals), 1),
+                'backend_sdk_ms': round(statistics.median(sdk_totals), 1),
+                'wall_ms': round(statistics.median(walls), 1),
+                'slowest': {module: round(statistics.median(values), 1)
+                            for module, values in sorted(slowest.items(),
+                                                         key=lambda item: -statistics.median(item[1]))[:args.top]},
+            }
+
+    print(f"{'情境':<10}{'匯入 (ms)':>12}{'後端 SDK (ms)':>16}{'總耗時 (ms)':>14}")
+    failed = []
+    for name, stats in results.items():
+        if stats['import_ms'] > args.threshold_ms:
+            failed.append(name)
+        print(f"{name:<10}{stats['import_ms']:>12.1f}{stats['backend_sdk_ms']:>16.1f}{stats['wall_ms']:>14.1f}"
+              f"{'  ✗ 超過上限' if name in failed else ''}")
+        for module, ms in stats['slowest'].items():
+            print(f"    {module:<30}{ms:>10.1f}")
+
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump({'threshold_ms': args.threshold_ms, 'repeat': args.repeat, 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n✓ 結果已儲存至: {args.json_output}")
+
+    if failed:
+        print(f"\n✗ 匯入耗時超過 {args.threshold_ms:.0f} ms: {', '.join(failed)}")
+        return 1
+    print(f"\n✓ 所有情境的匯入耗時均低於 {args.threshold_ms:.0f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
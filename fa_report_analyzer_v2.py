@@ -3,39 +3,2489 @@ FA Report Analyzer v2.0 - 失效分析報告評估工具
 支援地端 Ollama 模型、OpenAI API 和圖片解析功能
 """
 
+import re
 import json
 import base64
-import anthropic
+import importlib.util
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional, Any
 import sys
 import io
+import math
+import threading
+import contextvars
 
-try:
-    import pandas as pd
-except ImportError:
-    print("需要安裝 pandas: pip install pandas --break-system-packages")
-    sys.exit(1)
+# 依賴套件只檢查是否已安裝, 實際用到的後端與文件格式才匯入 (避免每次啟動都載入全部套件)
+HAS_PANDAS = importlib.util.find_spec('pandas') is not None
+HAS_PIL = importlib.util.find_spec('PIL') is not None
+HAS_OLLAMA = importlib.util.find_spec('ollama') is not None
+HAS_OPENAI = importlib.util.find_spec('openai') is not None
+HAS_ANTHROPIC = importlib.util.find_spec('anthropic') is not None
 
-# 可選依賴
-try:
-    from PIL import Image
-    HAS_PIL = True
-except ImportError:
-    HAS_PIL = False
 
-try:
-    import ollama
-    HAS_OLLAMA = True
-except ImportError:
-    HAS_OLLAMA = False
+# 支援的報告文件副檔名
+SUPPORTED_SUFFIXES = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.txt', '.pdf',
+                      '.doc', '.docx', '.ppt', '.pptx']
 
-try:
-    from openai import OpenAI
-    HAS_OPENAI = True
-except ImportError:
-    HAS_OPENAI = False
+# 批次模式下各後端同時進行的 LLM 請求上限
+BACKEND_CONCURRENCY = {
+    'ollama': 2,      # 地端 GPU 同時處理過多請求反而變慢
+    'openai': 8,
+    'anthropic': 4,
+}
+
+
+# 各後端單次請求最多送出的圖片數量
+IMAGE_LIMITS = {
+    'ollama': 5,
+    'openai': 10,
+    'anthropic': 20,  # Claude 支持較多圖片
+}
+
+# 各後端送出圖片的最長邊 (px), 接近各模型內部縮圖後的尺寸
+IMAGE_MAX_EDGE = {
+    'ollama': 1120,
+    'openai': 2048,
+    'anthropic': 1568,
+}
+
+# 各後端單次請求的圖片總傳輸量上限 (bytes, base64 編碼前)
+IMAGE_PAYLOAD_BUDGET = {
+    'ollama': 8 * 1024 * 1024,
+    'openai': 16 * 1024 * 1024,
+    'anthropic': 20 * 1024 * 1024,
+}
+
+# 讀取報告時保留的圖片原始資料上限 (MB)
+DEFAULT_MAX_IMAGE_MB = 64
+
+# 與失效分析相關的關鍵字, 出現在同頁文字中的圖片會優先送給模型
+ANALYSIS_KEYWORDS = [
+    'SEM', 'FIB', 'TEM', 'EDS', 'EDX', 'X-ray', 'C-SAM', 'decap', 'cross section',
+    'IV curve', 'I-V', 'failure', 'defect', 'crack', 'burn',
+    '截面', '剖面', '切片', '失效', '異常', '燒毀', '裂', '腐蝕', '短路', '開路', '漏電',
+    '缺陷', '根因',
+]
+
+# 各評估維度的評分細項
+DIMENSION_CRITERIA = {
+    "基本資訊完整性": [
+        "產品資訊(型號、批號、製造日期)",
+        "客戶資訊與投訴內容",
+        "FA 編號與日期",
+        "負責工程師資訊",
+    ],
+    "問題描述與定義": [
+        "失效現象描述的清晰度",
+        "失效模式的準確性",
+        "問題範圍與影響評估",
+        "失效率數據",
+    ],
+    "分析方法與流程": [
+        "分析方法的適當性(如:光學檢查、SEM、FIB、X-ray等)",
+        "分析步驟的邏輯性與完整性",
+        "實驗設計的合理性",
+        "分析設備使用的正確性",
+    ],
+    "數據與證據支持": [
+        "分析數據的充分性",
+        "圖片/圖表的清晰度與標註",
+        "量化數據的準確性",
+        "對照組/比較樣本的使用",
+    ],
+    "根因分析": [
+        "根本原因的深度與準確度",
+        "因果關係的邏輯推導",
+        "5-Why 或 Fishbone 分析的應用",
+        "排除其他可能原因的論證",
+    ],
+    "改善對策": [
+        "短期與長期對策的完整性",
+        "對策的可行性與有效性",
+        "預防措施的提出",
+        "驗證計畫",
+    ],
+}
+
+# 支援的分析模式
+ANALYSIS_MODES = ['single', 'mapreduce', 'per-dimension', 'auto']
+
+# 'per-dimension' 模式下需要附上圖片評分的維度 (其餘維度僅送文字以節省 token)
+IMAGE_DIMENSIONS = {"分析方法與流程", "數據與證據支持"}
+
+# 分析模式為 'auto' 時, 報告預估 token 數超過此值即改用 map-reduce 分段分析
+MAP_REDUCE_THRESHOLD = {
+    'ollama': 6000,       # Ollama 預設 context 較小, 過長內容會被靜默截斷
+    'openai': 60000,
+    'anthropic': 100000,
+}
+
+# Ollama 模型常駐時間 (批次期間保持載入, 避免每份報告重新冷啟動)
+OLLAMA_KEEP_ALIVE = '30m'
+
+# Ollama num_ctx 的範圍: 依提示詞長度以 2 的次方向上取整 (變更 num_ctx 會使 Ollama 重新載入模型)
+OLLAMA_MIN_CTX = 8192
+OLLAMA_MAX_CTX = 32768
+
+# Ollama 回應的最多 token 數 (與其他後端的 max_tokens 相同)
+OLLAMA_NUM_PREDICT = 4000
+
+# Ollama 回應中的耗時欄位 (奈秒) 與對應的指標階段
+OLLAMA_TIMING_FIELDS = {
+    'ollama_load': 'load_duration',
+    'ollama_prompt_eval': 'prompt_eval_duration',
+    'ollama_eval': 'eval_duration',
+}
+
+# AI 分析結果快取的預設位置
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "fa_report_analyzer" / "analysis"
+
+# 轉換後文件 (.ppt → .pptx) 快取的預設位置
+DEFAULT_CONVERSION_CACHE_DIR = Path.home() / ".cache" / "fa_report_analyzer" / "converted"
+
+# LibreOffice 工作者設定檔 (UserInstallation) 的預設位置
+DEFAULT_OFFICE_PROFILE_DIR = Path.home() / ".cache" / "fa_report_analyzer" / "libreoffice"
+
+# LibreOffice 的常見安裝位置 (PATH 中的 soffice / libreoffice 優先)
+LIBREOFFICE_PATHS = [
+    '/Applications/LibreOffice.app/Contents/MacOS/soffice',  # macOS
+    '/usr/bin/libreoffice',  # Linux
+    '/usr/lib/libreoffice/program/soffice',
+    'C:\\Program Files\\LibreOffice\\program\\soffice.exe',  # Windows
+]
+
+# LibreOffice 轉換逾時: 每次呼叫的啟動時間加上每個文件的轉換時間 (秒)
+LIBREOFFICE_STARTUP_TIMEOUT = 60
+LIBREOFFICE_FILE_TIMEOUT = 30
+
+
+# LLM 後端可直接接受的圖片格式
+LLM_IMAGE_MIMES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
+
+
+def sniff_image_mime(data: bytes) -> str:
+    """依檔頭判斷圖片的 MIME 類型 (不依賴副檔名或來源文件的標記)"""
+    head = bytes(data[:64])
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'BM'):
+        return 'image/bmp'
+    if head.startswith((b'II*\x00', b'MM\x00*')):
+        return 'image/tiff'
+    if head[40:44] == b' EMF':
+        return 'image/emf'
+    if head.startswith((b'\xd7\xcd\xc6\x9a', b'\x01\x00\x09\x00', b'\x02\x00\x09\x00')):
+        return 'image/wmf'
+    if head.startswith(b'\x00\x00\x00\x0cjP  ') or head.startswith(b'\xff\x4f\xff\x51'):
+        return 'image/jp2'
+    return 'application/octet-stream'
+
+
+class ImageRecord:
+    """報告中提取的單張圖片
+
+    保留原始二進制資料, base64 只在組裝各後端請求時才產生,
+    避免每張圖片同時以 bytes 與 base64 字串佔用記憶體。
+    """
+
+    __slots__ = ('data', 'mime', 'width', 'height', 'page', 'occurrences')
+
+    def __init__(self, data: bytes, page: int = 1, mime: str = None,
+                 width: int = None, height: int = None, occurrences: int = 1):
+        self.data = bytes(data)
+        self.mime = mime or sniff_image_mime(self.data)
+        self.page = page
+        # 同一張圖片在文件中被引用的頁數 (只提取一次, 供 _ImageSelector 判斷重複)
+        self.occurrences = occurrences
+        self.width = width
+        self.height = height
+        if width is None and HAS_PIL:
+            from PIL import Image
+
+            # Image.open 只讀取檔頭, 不會解碼整張圖片
+            try:
+                with Image.open(io.BytesIO(self.data)) as image:
+                    self.width, self.height = image.size
+            except Exception:
+                pass
+
+    @classmethod
+    def coerce(cls, image: Any) -> 'ImageRecord':
+        """將舊版圖片字典 {'data': <base64>, ...} 轉為 ImageRecord"""
+        if isinstance(image, cls):
+            return image
+        return cls(base64.b64decode(image['data']), page=image.get('page', 1))
+
+    @property
+    def format(self) -> str:
+        """圖片格式 (例如 'jpeg', 'png')"""
+        return self.mime.split('/')[-1]
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def is_supported(self) -> bool:
+        """LLM 後端是否可直接接受此格式"""
+        return self.mime in LLM_IMAGE_MIMES
+
+    def b64(self) -> str:
+        """產生 base64 字串 (每次呼叫重新編碼, 不保留在記憶體中)"""
+        with _metric_stage('encode'):
+            return base64.b64encode(self.data).decode('ascii')
+
+    def to_dict(self) -> Dict:
+        """轉為舊版圖片字典 {'type': 'image', 'data': <base64>, 'format', 'page'} (read_report 的返回格式)"""
+        return {'type': 'image', 'data': self.b64(), 'format': self.format, 'page': self.page}
+
+    def to_supported(self) -> Optional['ImageRecord']:
+        """將 TIFF/BMP/EMF 等格式轉為 PNG, 無法轉換時返回 None"""
+        if self.is_supported:
+            return self
+        if not HAS_PIL:
+            return None
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(self.data)) as image:
+                image.load()
+                if image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                    image = image.convert('RGB')
+                output = io.BytesIO()
+                image.save(output, format='PNG')
+                return ImageRecord(output.getvalue(), page=self.page, mime='image/png',
+                                   width=image.width, height=image.height)
+        except Exception:
+            return None
+
+    def __repr__(self) -> str:
+        return (f"ImageRecord(mime={self.mime!r}, size={self.size}, "
+                f"dims={self.width}x{self.height}, page={self.page})")
+
+
+class _JSONStreamScanner:
+    """串流回應的增量 JSON 掃描器
+
+    逐段接收模型輸出, 追蹤最外層 JSON 物件的括號深度 (忽略字串內的括號),
+    在物件結束時即可停止生成; 在出現 '{' 之前若回應以拒絕語句開頭則標記為拒絕。
+    """
+
+    REFUSAL_PREFIXES = ("I'm sorry", "I’m sorry", "I am sorry", "I cannot", "I can't",
+                        "I can’t", "I'm unable", "I am unable", "Sorry",
+                        "抱歉", "很抱歉", "我無法", "我不能")
+    # 只在回應開頭的這些字元內判斷是否為拒絕
+    REFUSAL_WINDOW = 120
+
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.start = None   # 最外層 '{' 的位置
+        self.end = None     # 對應 '}' 之後的位置
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.refused = False
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def json_text(self) -> Optional[str]:
+        """完整的最外層 JSON 物件文字 (尚未結束時為 None)"""
+        return self.text[self.start:self.end] if self.complete else None
+
+    def feed(self, chunk: str):
+        offset = self.length
+        self.parts.append(chunk)
+        self.length += len(chunk)
+        if self.complete or self.refused:
+            return
+
+        for index, ch in enumerate(chunk):
+            if self.start is None:
+                if ch == '{':
+                    self.start = offset + index
+                    self.depth = 1
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = offset + index + 1
+                    return
+
+        if self.start is None:
+            head = self.text[:self.REFUSAL_WINDOW].lstrip()
+            self.refused = head.startswith(self.REFUSAL_PREFIXES)
+
+
+# Anthropic 結構化輸出所用的工具名稱
+RESULT_TOOL_NAME = "submit_fa_evaluation"
+
+
+def build_result_schema(dimensions) -> Dict:
+    """分析結果的 JSON schema
+
+    各後端的結構化輸出 (Ollama format / OpenAI json_schema / Anthropic 工具) 與
+    結果驗證都由此產生; 分維度模式的子請求使用其中的 dimension_scores 項目與總評欄位。
+    """
+    dimension_score = {
+        "type": "object",
+        "properties": {
+            "score": {"type": "number"},
+            "percentage": {"type": "number"},
+            "comment": {"type": "string"},
+        },
+        "required": ["score", "percentage", "comment"],
+        "additionalProperties": False,
+    }
+    improvement = {
+        "type": "object",
+        "properties": {
+            "priority": {"type": "string", "enum": ["高", "中", "低"]},
+            "item": {"type": "string"},
+            "suggestion": {"type": "string"},
+        },
+        "required": ["priority", "item", "suggestion"],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {
+            "total_score": {"type": "number"},
+            "grade": {"type": "string", "enum": ["A", "B", "C", "D", "F"]},
+            "dimension_scores": {
+                "type": "object",
+                "properties": {name: dimension_score for name in dimensions},
+                "required": list(dimensions),
+                "additionalProperties": False,
+            },
+            "strengths": {"type": "array", "items": {"type": "string"}},
+            "improvements": {"type": "array", "items": improvement},
+            "summary": {"type": "string"},
+        },
+        "required": ["total_score", "grade", "dimension_scores", "strengths", "improvements", "summary"],
+        "additionalProperties": False,
+    }
+
+
+def sub_schema(schema: Dict, fields: List[str]) -> Dict:
+    """取出 schema 中的部分欄位組成新的物件 schema"""
+    return {
+        "type": "object",
+        "properties": {name: schema["properties"][name] for name in fields},
+        "required": list(fields),
+        "additionalProperties": False,
+    }
+
+
+def repair_json(text: str) -> str:
+    """修復常見的 JSON 格式錯誤 (供嚴格解析失敗時使用)
+
+    - 字串內未跳脫的換行與 tab
+    - 物件/陣列結尾多餘的逗號
+    - Python 的 True / False / None
+    - 回應被截斷時未結束的字串與未關閉的括號
+    """
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == '\n':
+                ch = '\\n'
+            elif ch == '\t':
+                ch = '\\t'
+            elif ch == '\r':
+                continue
+            out.append(ch)
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            # 移除結尾多餘的逗號
+            while out and out[-1] in ' \t\r\n':
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            if stack:
+                stack.pop()
+        out.append(ch)
+
+    # 截斷的回應: 結束字串並關閉所有括號
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    repaired = ''.join(out).rstrip()
+    if stack:
+        repaired = re.sub(r'[,:]\s*$', '', repaired)
+        # 截斷在鍵名之後 ("key") 時一併移除
+        repaired = re.sub(r',\s*"[^"]*"\s*$', '', repaired)
+        repaired += ''.join(reversed(stack))
+
+    # Python 常數只在字串之外替換, 字串內容 (例如 "True, None]") 保持不變
+    literals = {'True': 'true', 'False': 'false', 'None': 'null'}
+    return ''.join(
+        part if part.startswith('"') else
+        re.sub(r'(?<=[:\[,\s])(True|False|None)(?=\s*[,}\]])', lambda m: literals[m.group(1)], part)
+        for part in re.split(r'("(?:[^"\\]|\\.)*")', repaired))
+
+
+def schema_problems(data, schema: Dict, path: str = '$') -> List[str]:
+    """檢查資料是否符合 schema, 並就地將數字字串 (例如 "85.5") 轉為數字
+
+    列舉值 (enum) 忽略前後空白與大小寫 (例如 " b" 視為 "B", 並就地修正);
+    additionalProperties 為 False 時, schema 未定義的欄位也列為問題。
+
+    Returns:
+        問題列表 (空列表表示符合)
+    """
+    expected = schema.get('type')
+    if expected == 'object':
+        if not isinstance(data, dict):
+            return [f"{path} 應為物件"]
+        problems = [f"{path}.{name} 缺少" for name in schema.get('required', []) if name not in data]
+        properties = schema.get('properties', {})
+        if schema.get('additionalProperties') is False:
+            problems.extend(f"{path}.{name} 不在 schema 中" for name in data if name not in properties)
+        for name, prop in properties.items():
+            if name not in data:
+                continue
+            if prop.get('type') == 'number' and isinstance(data[name], str):
+                try:
+                    data[name] = float(data[name].strip().rstrip('%分').strip())
+                except ValueError:
+                    pass
+            if 'enum' in prop and isinstance(data[name], str) and data[name] not in prop['enum']:
+                matches = [value for value in prop['enum']
+                           if isinstance(value, str) and value.casefold() == data[name].strip().casefold()]
+                if matches:
+                    data[name] = matches[0]
+            problems.extend(schema_problems(data[name], prop, f"{path}.{name}"))
+        return problems
+    if expected == 'array':
+        if not isinstance(data, list):
+            return [f"{path} 應為陣列"]
+        problems = []
+        for index, item in enumerate(data):
+            problems.extend(schema_problems(item, schema.get('items', {}), f"{path}[{index}]"))
+        return problems
+    if expected == 'number' and (isinstance(data, bool) or not isinstance(data, (int, float))):
+        return [f"{path} 應為數字"]
+    if expected == 'string' and not isinstance(data, str):
+        return [f"{path} 應為字串"]
+    if 'enum' in schema and data not in schema['enum']:
+        return [f"{path} 應為 {' / '.join(map(str, schema['enum']))} 之一"]
+    return []
+
+
+class RateLimitScheduler:
+    """LLM 請求排程器: 速率限制、重試與指數退避
+
+    同一組 (後端, base_url, api_key) 在行程內共用一個排程器 (見 get_scheduler),
+    依設定的每分鐘請求數/token 數與伺服器回傳的 rate-limit 標頭控制送出速度,
+    遇到 429、5xx 或連線錯誤時以帶抖動的指數退避重試。
+    """
+
+    # 可重試的 HTTP 狀態碼 (529 為 Anthropic 的 overloaded)
+    RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+    # 可重試的例外類別名稱 (各 SDK 與 httpx 的連線/逾時錯誤)
+    RETRY_ERRORS = ('RateLimitError', 'APIConnectionError', 'APITimeoutError',
+                    'InternalServerError', 'OverloadedError', 'ServiceUnavailableError',
+                    'ConnectError', 'ReadError', 'WriteError', 'RemoteProtocolError',
+                    'ReadTimeout', 'ConnectTimeout', 'PoolTimeout')
+
+    def __init__(self,
+                 name: str,
+                 max_retries: int = 5,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 requests_per_minute: int = None,
+                 tokens_per_minute: int = None):
+        """初始化排程器
+
+        Args:
+            name: 顯示用名稱
+            max_retries: 最多重試次數
+            base_delay: 第一次重試的基礎等待秒數
+            max_delay: 單次等待的上限秒數
+            requests_per_minute: 每分鐘請求數上限 (None 表示不限制)
+            tokens_per_minute: 每分鐘 token 數上限 (None 表示不限制)
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._window = []             # 最近 60 秒內送出的 (時間, token 數)
+        self._blocked_until = 0.0     # 伺服器要求暫停到此時間 (monotonic)
+        self.stats = {'requests': 0, 'retries': 0, 'throttled_seconds': 0.0}
+
+    def _reserve(self, tokens: int) -> float:
+        """嘗試登記一次請求, 返回需要等待的秒數 (0 表示已登記, 可立即送出)"""
+        import time
+
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            self._window = [(t, n) for t, n in self._window if now - t < 60]
+            wait = 0.0
+            if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+                wait = max(wait, 60 - (now - self._window[0][0]))
+            if self.tokens_per_minute and self._window:
+                used = sum(n for _, n in self._window)
+                if used + tokens > self.tokens_per_minute:
+                    # 等到足夠的舊請求移出視窗; 單一請求超過上限時等視窗清空後送出
+                    released = 0
+                    for t, n in self._window:
+                        released += n
+                        if used - released + tokens <= self.tokens_per_minute:
+                            wait = max(wait, 60 - (now - t))
+                            break
+                    else:
+                        wait = max(wait, 60 - (now - self._window[-1][0]))
+            if wait > 0:
+                return wait
+
+            self._window.append((now, tokens))
+            self.stats['requests'] += 1
+            return 0.0
+
+    def update_from_headers(self, headers):
+        """依伺服器回傳的 rate-limit 標頭調整送出速度
+
+        支援 retry-after, OpenAI 的 x-ratelimit-* 與 Anthropic 的 anthropic-ratelimit-*。
+        剩餘額度用完時暫停到重置時間。
+        """
+        import time
+
+        if not headers:
+            return
+
+        def header(name):
+            value = headers.get(name)
+            return value.strip() if isinstance(value, str) else value
+
+        # 未設定上限時採用伺服器公布的上限, 並保留 5% 餘裕以免剛好觸發 429
+        for kind, attr in (('requests', 'requests_per_minute'), ('tokens', 'tokens_per_minute')):
+            if getattr(self, attr) is None:
+                limit = header(f'x-ratelimit-limit-{kind}') \
+                    or header(f'anthropic-ratelimit-{kind}-limit')
+                try:
+                    if limit is not None and int(float(limit)) > 0:
+                        setattr(self, attr, max(int(int(float(limit)) * 0.95), 1))
+                except ValueError:
+                    pass
+
+        pause = 0.0
+        retry_after = _parse_retry_after(header('retry-after'))
+        if retry_after is not None:
+            pause = retry_after
+
+        for kind in ('requests', 'tokens'):
+            remaining = header(f'x-ratelimit-remaining-{kind}') \
+                or header(f'anthropic-ratelimit-{kind}-remaining')
+            reset = header(f'x-ratelimit-reset-{kind}') \
+                or header(f'anthropic-ratelimit-{kind}-reset')
+            try:
+                exhausted = remaining is not None and int(float(remaining)) <= 0
+            except ValueError:
+                exhausted = False
+            if exhausted and reset:
+                pause = max(pause, _parse_reset_time(reset) or 0.0)
+
+        if pause > 0:
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+
+    def is_retryable(self, error: Exception) -> bool:
+        status = getattr(error, 'status_code', None)
+        if status is None:
+            status = getattr(getattr(error, 'response', None), 'status_code', None)
+        if isinstance(status, int):
+            return status in self.RETRY_STATUS
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        return any(cls.__name__ in self.RETRY_ERRORS for cls in type(error).__mro__)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """計算重試前的等待秒數: 優先使用 retry-after, 否則為帶抖動的指數退避"""
+        import random
+
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        self.update_from_headers(headers)
+        retry_after = _parse_retry_after(headers.get('retry-after')) if headers else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _count(self, name: str, value: float = 1):
+        """累加統計 (排程器由多個執行緒共用, 需在鎖內更新)"""
+        with self._lock:
+            self.stats[name] += value
+
+    def call(self, func, tokens: int = 0):
+        """依速率限制送出請求, 失敗時重試
+
+        Args:
+            func: 送出請求的函數 (不需參數)
+            tokens: 此請求預估使用的 token 數
+        """
+        import time
+
+        attempt = 0
+        while True:
+            wait = self._reserve(tokens)
+            while wait > 0:
+                self._count('throttled_seconds', wait)
+                time.sleep(wait)
+                wait = self._reserve(tokens)
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self._count('retries')
+                _metric_count('retries')
+                print(f"⚠️  {self.name} 請求失敗 ({type(e).__name__}: {e}), "
+                      f"{delay:.1f} 秒後重試 ({attempt}/{self.max_retries})")
+                time.sleep(delay)
+
+    async def acall(self, func, tokens: int = 0):
+        """call 的非同步版本 (func 返回 awaitable)"""
+        import asyncio
+
+        attempt = 0
+        while True:
+            wait = self._reserve(tokens)
+            while wait > 0:
+                self._count('throttled_seconds', wait)
+                await asyncio.sleep(wait)
+                wait = self._reserve(tokens)
+            try:
+                return await func()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self._count('retries')
+                _metric_count('retries')
+                print(f"⚠️  {self.name} 請求失敗 ({type(e).__name__}: {e}), "
+                      f"{delay:.1f} 秒後重試 ({attempt}/{self.max_retries})")
+                await asyncio.sleep(delay)
+
+
+def _parse_retry_after(value) -> Optional[float]:
+    """解析 retry-after 標頭 (秒數或 HTTP 日期)"""
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        retry_at = parsedate_to_datetime(value)
+        return max((retry_at - datetime.now(tz=retry_at.tzinfo)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_reset_time(value: str) -> Optional[float]:
+    """解析 rate-limit 重置時間, 返回距今秒數
+
+    支援 OpenAI 的時間長度 ("1s", "6m0s", "20ms") 與 Anthropic 的 RFC 3339 時間。
+    """
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if parts and ''.join(n + u for n, u in parts) == value.replace(' ', ''):
+        scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+        return sum(float(n) * scale[u] for n, u in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return max((reset_at - datetime.now(tz=reset_at.tzinfo)).total_seconds(), 0.0)
+    except ValueError:
+        return None
+
+
+_SCHEDULERS = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_scheduler(backend: str, base_url: str = None, api_key: str = None,
+                  **config) -> RateLimitScheduler:
+    """取得行程內共用的排程器 (相同後端、端點與 API key 共用速率限制)
+
+    config 中不為 None 的設定會更新既有排程器。
+    """
+    with _SCHEDULERS_LOCK:
+        key = (backend, base_url, api_key)
+        scheduler = _SCHEDULERS.get(key)
+        if scheduler is None:
+            scheduler = RateLimitScheduler(backend, **{k: v for k, v in config.items() if v is not None})
+            _SCHEDULERS[key] = scheduler
+        else:
+            for name, value in config.items():
+                if value is not None:
+                    setattr(scheduler, name, value)
+        return scheduler
+
+
+# 行程內共用的 LLM 客戶端 (見 get_client / get_async_client)
+_CLIENT_POOL = {}
+_ASYNC_CLIENT_POOLS = None
+_CLIENT_POOL_LOCK = threading.Lock()
+
+
+def _create_client(backend: str, base_url: str, api_key: str, pool_size: int,
+                   timeout: float, use_async: bool = False):
+    """建立保持連線 (HTTP keep-alive) 的 LLM 客戶端"""
+    import httpx
+
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+
+    if backend == "ollama":
+        import ollama
+        client_class = ollama.AsyncClient if use_async else ollama.Client
+        return client_class(host=base_url, timeout=timeout, limits=limits)
+
+    if backend == "openai":
+        import openai
+        if use_async:
+            http_client = openai.DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+            client_class = openai.AsyncOpenAI
+        else:
+            http_client = openai.DefaultHttpxClient(limits=limits, timeout=timeout)
+            client_class = openai.OpenAI
+        # 重試由 RateLimitScheduler 統一處理
+        return client_class(api_key=api_key, base_url=base_url, timeout=timeout,
+                            max_retries=0, http_client=http_client)
+
+    if backend == "anthropic":
+        import anthropic
+        if use_async:
+            http_client = anthropic.DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+            client_class = anthropic.AsyncAnthropic
+        else:
+            http_client = anthropic.DefaultHttpxClient(limits=limits, timeout=timeout)
+            client_class = anthropic.Anthropic
+        return client_class(api_key=api_key, base_url=base_url, timeout=timeout,
+                            max_retries=0, http_client=http_client)
+
+    raise ValueError(f"不支援的後端: {backend}")
+
+
+def get_client(backend: str, base_url: str = None, api_key: str = None,
+               pool_size: int = 10, timeout: float = 600):
+    """取得行程內共用的 LLM 客戶端
+
+    相同 (後端, base_url, api_key) 的分析器共用同一個客戶端與連線池, 避免每次建立
+    分析器都重新進行 TCP/TLS 連線。客戶端可在多個執行緒間共用; pool_size 與 timeout
+    以第一次建立時的設定為準。
+    """
+    key = (backend, base_url, api_key)
+    with _CLIENT_POOL_LOCK:
+        client = _CLIENT_POOL.get(key)
+        if client is None:
+            client = _create_client(backend, base_url, api_key, pool_size, timeout)
+            _CLIENT_POOL[key] = client
+        return client
+
+
+def get_async_client(backend: str, base_url: str = None, api_key: str = None,
+                     pool_size: int = 10, timeout: float = 600):
+    """取得目前事件迴圈共用的非同步 LLM 客戶端
+
+    非同步連線綁定在建立時的事件迴圈上, 因此每個事件迴圈各有一組客戶端。
+    """
+    import asyncio
+    import weakref
+
+    global _ASYNC_CLIENT_POOLS
+    loop = asyncio.get_running_loop()
+    key = (backend, base_url, api_key)
+    with _CLIENT_POOL_LOCK:
+        if _ASYNC_CLIENT_POOLS is None:
+            _ASYNC_CLIENT_POOLS = weakref.WeakKeyDictionary()
+        clients = _ASYNC_CLIENT_POOLS.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = _create_client(backend, base_url, api_key, pool_size, timeout,
+                                    use_async=True)
+            clients[key] = client
+        return client
+
+
+async def aclose_async_clients():
+    """關閉目前事件迴圈共用的非同步客戶端連線 (需在事件迴圈結束前呼叫)"""
+    import asyncio
+    import inspect
+
+    loop = asyncio.get_running_loop()
+    with _CLIENT_POOL_LOCK:
+        clients = _ASYNC_CLIENT_POOLS.pop(loop, {}) if _ASYNC_CLIENT_POOLS is not None else {}
+    for client in clients.values():
+        # OpenAI / Anthropic 為 close(), Ollama 為內部 httpx.AsyncClient 的 aclose()
+        close = getattr(client, 'close', None) or getattr(getattr(client, '_client', None), 'aclose', None)
+        if close:
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                pass
+
+
+def close_clients():
+    """關閉所有共用的同步客戶端連線"""
+    with _CLIENT_POOL_LOCK:
+        for client in _CLIENT_POOL.values():
+            close = getattr(client, 'close', None) or getattr(getattr(client, '_client', None), 'close', None)
+            if close:
+                try:
+                    close()
+                except Exception:
+                    pass
+        _CLIENT_POOL.clear()
+
+
+class _UsageCounter:
+    """累計 LLM 請求的 token 用量與提示詞快取命中 (可跨執行緒共用)"""
+
+    FIELDS = ('requests', 'input_tokens', 'output_tokens', 'cached_tokens', 'cache_write_tokens')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = dict.fromkeys(self.FIELDS, 0)
+
+    def record(self, usage: Dict):
+        with self._lock:
+            self._totals['requests'] += 1
+            for field in self.FIELDS[1:]:
+                self._totals[field] += usage.get(field) or 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            totals = dict(self._totals)
+        totals['cache_hit_rate'] = (round(totals['cached_tokens'] / totals['input_tokens'], 4)
+                                    if totals['input_tokens'] else 0.0)
+        return totals
+
+    @classmethod
+    def diff(cls, after: Dict, before: Dict) -> Dict:
+        """兩次 snapshot 之間的用量 (例如單次批次分析)"""
+        delta = {field: after.get(field, 0) - before.get(field, 0) for field in cls.FIELDS}
+        delta['cache_hit_rate'] = (round(delta['cached_tokens'] / delta['input_tokens'], 4)
+                                   if delta['input_tokens'] else 0.0)
+        return delta
+
+
+class ReportMetrics:
+    """單一報告的各階段耗時與計數 (可跨執行緒共用)
+
+    階段 (秒, 同名階段累加; 並行請求的 llm 為各請求耗時的總和):
+        read 讀取報告, convert .ppt 轉換, pdf_text / pdf_images PDF 文字與圖片提取,
+        image_prep 圖片格式轉換與重新壓縮, encode 圖片 base64 編碼,
+        llm LLM 請求 (含回應解析), analyze AI 分析整體, write 輸出評估報告
+    計數:
+        bytes_read, images, image_bytes, images_sent, image_bytes_sent,
+        requests, prompt_tokens, completion_tokens, cached_tokens, retries
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, data: Dict):
+        """合併其他行程 (例如批次模式的解析行程) 回傳的 to_dict() 結果"""
+        for stage, seconds in (data.get('stages') or {}).items():
+            self.add_time(stage, seconds)
+        for name, value in (data.get('counters') or {}).items():
+            self.count(name, value)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'stages': {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+                'counters': dict(self.counters),
+            }
+
+
+# 目前處理中報告的指標 (由 FAReportAnalyzer._report_metrics 設定)
+_CURRENT_METRICS = contextvars.ContextVar('fa_report_metrics', default=None)
+
+
+class _metric_stage:
+    """將區塊的耗時記錄到目前報告的指標 (沒有處理中的報告時不記錄)"""
+
+    __slots__ = ('stage', 'metrics', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        import time
+
+        self.metrics = _CURRENT_METRICS.get()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        import time
+
+        if self.metrics is not None:
+            self.metrics.add_time(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def _metric_count(name: str, value: float = 1):
+    """累加目前報告的計數"""
+    metrics = _CURRENT_METRICS.get()
+    if metrics is not None and value:
+        metrics.count(name, value)
+
+
+def _metric_time(stage: str, seconds: float):
+    """記錄後端回報的耗時 (例如 Ollama 的模型載入時間) 到目前報告的指標"""
+    metrics = _CURRENT_METRICS.get()
+    if metrics is not None and seconds:
+        metrics.add_time(stage, seconds)
+
+
+class MetricsSink:
+    """輸出每份報告的指標: JSON-lines 記錄與 Prometheus 文字格式 (文件或 HTTP 端點)
+
+    Prometheus 指標為此行程啟動以來的累計值:
+        fa_reports_total{status}              處理的報告數
+        fa_report_stage_seconds_{sum,count}   各階段耗時
+        fa_report_<計數>_total                 讀取位元組、圖片、token 與重試次數
+    """
+
+    def __init__(self, jsonl_path: str = None, prom_file: str = None, prom_port: int = None,
+                 prom_host: str = '127.0.0.1'):
+        """初始化輸出
+
+        Args:
+            jsonl_path: JSON-lines 記錄文件 (每份報告一行, 附加寫入)
+            prom_file: Prometheus 文字格式文件 (供 node_exporter textfile collector 讀取)
+            prom_port: 在此連接埠提供 /metrics HTTP 端點
+            prom_host: /metrics 端點綁定的位址 (預設只接受本機連線; '0.0.0.0' 開放所有介面)
+        """
+        self.jsonl_path = jsonl_path
+        self.prom_file = prom_file
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._reports = {}
+        self._stage_sum = {}
+        self._stage_count = {}
+        self._counters = {}
+        self._server = None
+        if jsonl_path:
+            Path(jsonl_path).parent.mkdir(parents=True, exist_ok=True)
+        if prom_port:
+            self._serve(prom_host, prom_port)
+
+    def emit(self, record: Dict):
+        """記錄一份報告的指標"""
+        with self._lock:
+            status = record.get('status', 'ok')
+            self._reports[status] = self._reports.get(status, 0) + 1
+            for stage, seconds in record['stages'].items():
+                self._stage_sum[stage] = self._stage_sum.get(stage, 0.0) + seconds
+                self._stage_count[stage] = self._stage_count.get(stage, 0) + 1
+            for name, value in record['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+        with self._write_lock:
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self.prom_file:
+                self._write_prom_file()
+
+    def render(self) -> str:
+        """Prometheus 文字格式"""
+        with self._lock:
+            lines = ["# HELP fa_reports_total FA reports processed.",
+                     "# TYPE fa_reports_total counter"]
+            lines += [f'fa_reports_total{{status="{status}"}} {count}'
+                      for status, count in sorted(self._reports.items())]
+            lines += ["# HELP fa_report_stage_seconds Time spent per processing stage.",
+                      "# TYPE fa_report_stage_seconds summary"]
+            for stage in sorted(self._stage_sum):
+                lines.append(f'fa_report_stage_seconds_sum{{stage="{stage}"}} {self._stage_sum[stage]:.6f}')
+                lines.append(f'fa_report_stage_seconds_count{{stage="{stage}"}} {self._stage_count[stage]}')
+            for name in sorted(self._counters):
+                lines.append(f"# TYPE fa_report_{name}_total counter")
+                lines.append(f"fa_report_{name}_total {self._counters[name]}")
+        return "\n".join(lines) + "\n"
+
+    def _write_prom_file(self):
+        """先寫入暫存檔再替換, 讓 collector 不會讀到寫到一半的文件"""
+        import os
+
+        text = self.render()
+        tmp_path = f"{self.prom_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, self.prom_file)
+
+    def _serve(self, host: str, port: int):
+        """在背景執行緒提供 /metrics 端點"""
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = sink.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"✓ Prometheus 指標端點: http://{host}:{port}/metrics")
+
+    def close(self):
+        """停止 /metrics 端點並釋放連接埠"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class AnalysisCache:
+    """AI 分析結果的磁碟快取
+
+    以報告文字、圖片內容、提示詞、後端與模型名稱的雜湊值作為鍵值,
+    相同輸入的報告可直接取得先前的分析結果, 不需要再次呼叫 LLM。
+    文件的 mtime 為寫入時間 (判斷是否過期), atime 為最近使用時間 (容量淘汰)。
+    """
+
+    # 每寫入多少筆檢查一次容量
+    EVICT_INTERVAL = 50
+    # 超過此秒數的暫存檔視為中斷的寫入 (行程被終止等) 並移除
+    STALE_TMP_SECONDS = 3600
+
+    def __init__(self,
+                 cache_dir: str = None,
+                 max_entries: int = 5000,
+                 max_size_mb: float = 500,
+                 max_age_days: float = 30):
+        """初始化快取
+
+        Args:
+            cache_dir: 快取資料夾 (預設: ~/.cache/fa_report_analyzer/analysis)
+            max_entries: 最多保留的結果數量
+            max_size_mb: 快取資料夾容量上限 (MB)
+            max_age_days: 結果保留天數, 超過即視為失效
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.max_entries = max_entries
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self._writes = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def make_key(report_content: str, images: List['ImageRecord'], prompt: str,
+                 backend: str, model: str, variant: str = None) -> str:
+        """計算快取鍵值 (SHA-256)
+
+        Args:
+            variant: 分析設定的識別 (分析模式、圖片前處理、結構化輸出等), 設定不同的結果分開快取;
+                圖片以前處理之前的內容計算, 前處理的設定需包含在 variant 中
+        """
+        import hashlib
+
+        digest = hashlib.sha256()
+        parts = (backend, model, report_content, prompt) + ((variant,) if variant else ())
+        for part in parts:
+            data = (part or "").encode('utf-8')
+            # 加上長度前綴, 避免不同欄位串接後產生相同內容
+            digest.update(len(data).to_bytes(8, 'big'))
+            digest.update(data)
+        for img in images or []:
+            digest.update(len(img.data).to_bytes(8, 'big'))
+            digest.update(img.data)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """讀取快取結果, 不存在或已過期時返回 None"""
+        import os
+        import time
+
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime > self.max_age:
+                path.unlink()
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            # 只更新存取時間 (atime), 讓容量淘汰時優先移除最久未使用的結果;
+            # mtime 保留為寫入時間, 讀取不會延長結果的保留期限
+            os.utime(path, (time.time(), stat.st_mtime))
+            return result
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, result: Dict):
+        """寫入快取結果 (先寫入暫存檔再替換, 避免並行寫入產生不完整的文件)"""
+        import os
+        import tempfile
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._writes += 1
+        if self._writes % self.EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """移除過期的結果與中斷寫入留下的暫存檔, 並依最近使用時間淘汰超出數量或容量上限的結果"""
+        import time
+
+        now = time.time()
+        for path in self.cache_dir.glob("*.tmp"):
+            try:
+                # 較新的暫存檔可能是其他行程正在寫入的結果, 不移除
+                if now - path.stat().st_mtime > self.STALE_TMP_SECONDS:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+                if now - stat.st_mtime > self.max_age:
+                    path.unlink()
+                    continue
+                entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+            except FileNotFoundError:
+                continue
+
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        total_size = 0
+        for index, (_, size, path) in enumerate(entries):
+            total_size += size
+            if index >= self.max_entries or total_size > self.max_size:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        """清除所有快取結果"""
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class JobQueue:
+    """批次分析的持久化工作佇列 (SQLite)
+
+    每份報告一筆工作, 記錄文件雜湊值、狀態、嘗試次數、時間與分析結果 JSON。
+    程式中斷後以相同佇列重新執行會跳過已完成的報告; 同一台主機上的多個行程可同時使用
+    同一個佇列, 工作以交易領取, 不會重複處理。佇列使用 SQLite WAL 模式, 不支援 NFS/SMB
+    等網路檔案系統, 因此只能在單一主機上使用。
+
+    狀態: pending → running → done / failed (失敗次數未達上限時會重新領取)。
+    失敗的工作在 retry_at 之後才能重新領取, 等待時間隨嘗試次數加倍 (指數退避)。
+    running 工作的租約過期, 或同一主機上領取它的行程已結束時, 視為中斷並重新領取。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE,
+            hash TEXT NOT NULL,
+            output TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            lease_until REAL,
+            enqueued_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            elapsed REAL,
+            error TEXT,
+            result TEXT,
+            retry_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+    """
+
+    # 重試等待時間的上限 (秒)
+    MAX_RETRY_DELAY = 3600
+
+    def __init__(self, db_path: str, lease_seconds: float = 3600, max_attempts: int = 3,
+                 retry_delay: float = 30):
+        """初始化佇列
+
+        Args:
+            db_path: SQLite 資料庫路徑
+            lease_seconds: 領取工作的租約秒數, 超過仍未完成即視為中斷
+            max_attempts: 每份報告最多嘗試次數
+            retry_delay: 第一次失敗後的重試等待秒數, 之後每次失敗加倍 (最多 MAX_RETRY_DELAY)
+        """
+        self.db_path = str(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            # WAL 模式讓讀取不會阻擋其他行程的寫入
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            # 舊版佇列沒有 retry_at 欄位
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'retry_at' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN retry_at REAL")
+
+    def _connect(self):
+        """建立連線 (每次操作使用獨立連線, 可在多執行緒與多行程中使用)"""
+        import sqlite3
+        from contextlib import closing, contextmanager
+
+        @contextmanager
+        def connection():
+            with closing(sqlite3.connect(self.db_path, timeout=60, isolation_level=None)) as conn:
+                conn.row_factory = sqlite3.Row
+                yield conn
+
+        return connection()
+
+    @staticmethod
+    def file_hash(path: Path) -> str:
+        """文件內容的 SHA-256"""
+        import hashlib
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def worker_id() -> str:
+        import os
+        import socket
+        import threading
+
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def enqueue(self, output_files: Dict[Path, str]) -> int:
+        """加入工作; 已存在且內容未變更的報告保留原狀態, 內容變更的報告重新分析
+
+        Returns:
+            新加入或重設的工作數量
+        """
+        import time
+
+        hashes = {path: self.file_hash(path) for path in output_files}
+        now = time.time()
+        added = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for path, output in output_files.items():
+                key = str(path.resolve())
+                row = conn.execute("SELECT hash FROM jobs WHERE path = ?", (key,)).fetchone()
+                if row is None:
+                    conn.execute("INSERT INTO jobs (path, hash, output, enqueued_at) VALUES (?, ?, ?, ?)",
+                                 (key, hashes[path], output, now))
+                    added += 1
+                elif row['hash'] != hashes[path]:
+                    conn.execute("""UPDATE jobs SET hash = ?, output = ?, status = 'pending', attempts = 0,
+                                    worker = NULL, lease_until = NULL, enqueued_at = ?, started_at = NULL,
+                                    finished_at = NULL, elapsed = NULL, error = NULL, result = NULL,
+                                    retry_at = NULL WHERE path = ?""", (hashes[path], output, now, key))
+                    added += 1
+            conn.execute("COMMIT")
+        return added
+
+    def recover(self) -> int:
+        """將同一主機上已結束行程遺留的 running 工作改回 pending
+
+        Returns:
+            恢復的工作數量
+        """
+        import os
+        import socket
+
+        host = socket.gethostname()
+        recovered = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for row in conn.execute("SELECT id, worker FROM jobs WHERE status = 'running'").fetchall():
+                worker_host, _, rest = (row['worker'] or '').partition(':')
+                pid = rest.partition(':')[0]
+                if worker_host != host or not pid.isdigit():
+                    continue
+                try:
+                    os.kill(int(pid), 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except PermissionError:
+                    continue
+                conn.execute("UPDATE jobs SET status = 'pending', worker = NULL, lease_until = NULL "
+                             "WHERE id = ?", (row['id'],))
+                recovered += 1
+            conn.execute("COMMIT")
+        return recovered
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """領取下一個工作 (待處理、租約過期或已到重試時間的失敗工作), 沒有工作時返回 None"""
+        import time
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""SELECT * FROM jobs
+                                  WHERE status = 'pending'
+                                     OR (status = 'running' AND lease_until < ?)
+                                     OR (status = 'failed' AND attempts < ?
+                                         AND (retry_at IS NULL OR retry_at <= ?))
+                                  ORDER BY status = 'failed', id LIMIT 1""",
+                               (now, self.max_attempts, now)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("""UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?,
+                            lease_until = ?, started_at = ?, error = NULL WHERE id = ?""",
+                         (worker, now + self.lease_seconds, now, row['id']))
+            conn.execute("COMMIT")
+        job = dict(row)
+        job['attempts'] += 1
+        return job
+
+    def complete(self, job_id: int, result: Dict, elapsed: float):
+        import time
+
+        with self._connect() as conn:
+            conn.execute("""UPDATE jobs SET status = 'done', finished_at = ?, elapsed = ?, result = ?,
+                            error = NULL, lease_until = NULL WHERE id = ?""",
+                         (time.time(), elapsed, json.dumps(result, ensure_ascii=False), job_id))
+
+    def fail(self, job_id: int, error: Exception, elapsed: float):
+        """記錄失敗, 重試時間為 retry_delay * 2^(嘗試次數 - 1) 秒之後"""
+        import time
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("""UPDATE jobs SET status = 'failed', finished_at = ?, elapsed = ?, error = ?,
+                            lease_until = NULL,
+                            retry_at = ? + MIN(?, ? * (1 << MAX(attempts - 1, 0))) WHERE id = ?""",
+                         (now, elapsed, str(error), now, self.MAX_RETRY_DELAY, self.retry_delay, job_id))
+
+    def next_retry(self) -> Optional[float]:
+        """最早可重試的失敗工作的時間 (time.time()), 沒有可重試的工作時返回 None"""
+        with self._connect() as conn:
+            row = conn.execute("""SELECT MIN(COALESCE(retry_at, 0)) AS retry_at FROM jobs
+                                  WHERE status = 'failed' AND attempts < ?""",
+                               (self.max_attempts,)).fetchone()
+        return row['retry_at']
+
+    def counts(self) -> Dict[str, int]:
+        """各狀態的工作數量"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def jobs(self, paths: List[Path] = None) -> List[Dict]:
+        """列出工作 (結果 JSON 已解析), 可限定報告路徑"""
+        with self._connect() as conn:
+            rows = [dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY id")]
+        if paths is not None:
+            wanted = {str(path.resolve()) for path in paths}
+            rows = [row for row in rows if row['path'] in wanted]
+        for row in rows:
+            row['result'] = json.loads(row['result']) if row['result'] else None
+        return rows
+
+
+class ConversionCache:
+    """轉換後文件 (例如 .ppt → .pptx) 的磁碟快取
+
+    以來源文件內容與目標格式的雜湊值作為鍵值, 相同的舊版文件再次分析時直接使用
+    先前的轉換結果, 不必再啟動 LibreOffice; 超出容量上限時淘汰最久未使用的文件。
+    批次預先轉換的文件以 pin() 保留到 release() 為止, 不會在批次進行中被淘汰。
+    """
+
+    def __init__(self, cache_dir: str = None, max_size_mb: float = 2048):
+        """初始化快取
+
+        Args:
+            cache_dir: 快取資料夾 (預設: ~/.cache/fa_report_analyzer/converted)
+            max_size_mb: 快取資料夾容量上限 (MB)
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CONVERSION_CACHE_DIR
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self._pinned = set()
+
+    def pin(self, keys):
+        """保留指定鍵值的文件, 在 release() 之前不會被淘汰 (仍計入容量)"""
+        self._pinned.update(keys)
+
+    def release(self):
+        """解除所有保留並依容量上限淘汰"""
+        self._pinned.clear()
+        if self.cache_dir.exists():
+            self.evict()
+
+    @staticmethod
+    def make_key(source: str, target: str) -> str:
+        """計算快取鍵值 (來源文件內容與目標格式的 SHA-256)"""
+        import hashlib
+
+        digest = hashlib.sha256(target.encode('utf-8') + b'\0')
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, key: str, target: str) -> Path:
+        return self.cache_dir / f"{key}.{target}"
+
+    def get(self, key: str, target: str) -> Optional[str]:
+        """取得快取的轉換結果, 不存在時返回 None"""
+        import os
+
+        path = self._path(key, target)
+        try:
+            # 更新存取時間, 讓容量淘汰時優先移除最久未使用的文件
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return str(path)
+
+    def put(self, key: str, produced: str, target: str) -> str:
+        """將轉換產生的文件移入快取 (先移到暫存檔再替換, 避免並行讀取到不完整的文件)
+
+        Returns:
+            快取中的文件路徑
+        """
+        import os
+        import shutil
+        import tempfile
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.move(produced, tmp_path)
+            os.replace(tmp_path, self._path(key, target))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+        return str(self._path(key, target))
+
+    def evict(self):
+        """依最近使用時間淘汰超出容量上限的文件 (保留中的文件優先計入容量且不淘汰)"""
+        pinned = set(self._pinned)
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.suffix == '.tmp':
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path.stem in pinned, stat.st_mtime, stat.st_size, path))
+
+        entries.sort(key=lambda entry: entry[:2], reverse=True)
+        total_size = 0
+        for index, (is_pinned, _, size, path) in enumerate(entries):
+            total_size += size
+            # 至少保留最近使用的一個文件 (剛寫入、即將被讀取)
+            if not is_pinned and index > 0 and total_size > self.max_size:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def clear(self):
+        """清除所有快取文件"""
+        if not self.cache_dir.exists():
+            return
+        for path in self.cache_dir.iterdir():
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+_LIBREOFFICE_BINARY = None  # None 表示尚未偵測, '' 表示未安裝
+
+
+def find_libreoffice() -> Optional[str]:
+    """尋找 LibreOffice 執行檔 (每個行程只偵測一次, 不啟動子行程)"""
+    global _LIBREOFFICE_BINARY
+    import os
+    import shutil
+
+    if _LIBREOFFICE_BINARY is None:
+        candidates = [shutil.which('soffice'), shutil.which('libreoffice')] + LIBREOFFICE_PATHS
+        _LIBREOFFICE_BINARY = next((path for path in candidates if path and os.path.exists(path)), '')
+    return _LIBREOFFICE_BINARY or None
+
+
+class OfficeConverter:
+    """以 LibreOffice headless 批次轉換舊版 Office 文件 (例如 .ppt → .pptx)
+
+    同一個 LibreOffice 設定檔 (UserInstallation) 無法同時被多個行程使用, 每個工作者以
+    鎖定檔取得獨立的設定檔槽位; 設定檔在轉換之間保留, 只有第一次啟動需要初始化。
+    各工作者從共用佇列一次取出多個文件, 合併為一次呼叫以分攤 LibreOffice 的啟動時間。
+    設定 cache 時, 轉換結果存入 ConversionCache, 快取命中的文件不會再啟動 LibreOffice。
+    """
+
+    def __init__(self, workers: int = None, batch_size: int = 8,
+                 profile_dir: str = None, binary: str = None,
+                 cache: ConversionCache = None):
+        """
+        Args:
+            workers: 同時執行的 LibreOffice 數量 (預設: CPU 核心數的一半, 最多 4)
+            batch_size: 每次呼叫最多轉換的文件數
+            profile_dir: 工作者設定檔的資料夾 (預設: ~/.cache/fa_report_analyzer/libreoffice)
+            binary: LibreOffice 執行檔 (預設: 自動偵測)
+            cache: 轉換結果的快取 (None 表示不快取, 輸出至 output_dir)
+        """
+        import os
+
+        self.binary = binary or find_libreoffice()
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 1) // 2))
+        self.batch_size = batch_size
+        self.profile_dir = Path(profile_dir) if profile_dir else DEFAULT_OFFICE_PROFILE_DIR
+        self.cache = cache
+
+    @property
+    def available(self) -> bool:
+        return bool(self.binary)
+
+    def convert(self, paths: List[str], target: str = 'pptx',
+                output_dir: str = None, pin: bool = False) -> Dict[str, Optional[str]]:
+        """轉換多個文件
+
+        Args:
+            paths: 來源文件路徑列表
+            target: 目標格式 (LibreOffice --convert-to 的參數)
+            output_dir: 未設定快取時的輸出資料夾 (預設: 與來源文件相同的資料夾)
+            pin: 在快取中保留這些文件的轉換結果, 直到 ConversionCache.release()
+
+        Returns:
+            {來源路徑: 轉換後的路徑, 失敗為 None}
+        """
+        import math
+        import queue
+        import threading
+
+        results = {str(path): None for path in paths}
+        keys = {}
+        if self.cache is not None:
+            for path in results:
+                try:
+                    keys[path] = self.cache.make_key(path, target)
+                except OSError:
+                    continue
+                results[path] = self.cache.get(keys[path], target)
+            if pin:
+                self.cache.pin(keys.values())
+
+        todo, seen = [], set()
+        for path, converted in results.items():
+            if converted is not None:
+                continue
+            if keys.get(path) in seen:
+                continue  # 內容相同的文件只轉換一次
+            if path in keys:
+                seen.add(keys[path])
+            todo.append(path)
+        if not todo or not self.available:
+            return results
+
+        pending = queue.Queue()
+        for path in todo:
+            pending.put(path)
+        workers = min(self.workers, len(todo))
+        # 平均分配給各工作者, 避免一個工作者取走全部文件
+        chunk = min(self.batch_size, math.ceil(len(todo) / workers))
+        threads = [threading.Thread(target=self._worker,
+                                    args=(pending, chunk, target, output_dir, keys, results),
+                                    daemon=True)
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for path, key in keys.items():
+            if results[path] is None:
+                results[path] = self.cache.get(key, target)
+        return results
+
+    def _worker(self, pending, chunk: int, target: str, output_dir: str, keys: Dict, results: Dict):
+        import queue
+
+        profile = self._claim_profile()
+        try:
+            while True:
+                batch, stems = [], set()
+                while len(batch) < chunk:
+                    try:
+                        path = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    stem = Path(path).stem
+                    if stem in stems:
+                        # 同名文件在同一次呼叫中會互相覆蓋, 留給下一次呼叫
+                        pending.put(path)
+                        break
+                    stems.add(stem)
+                    batch.append(path)
+                if not batch:
+                    return
+                results.update(self._run(profile, batch, target, output_dir, keys))
+        finally:
+            self._release_profile(profile)
+
+    def _run(self, profile: Path, batch: List[str], target: str, output_dir: str,
+             keys: Dict) -> Dict[str, Optional[str]]:
+        """以指定的設定檔執行一次 LibreOffice, 轉換一批文件"""
+        import shutil
+        import subprocess
+        import tempfile
+
+        converted = {}
+        # 先輸出到暫存資料夾, 確認產生的文件屬於哪個來源後再移到輸出資料夾
+        with tempfile.TemporaryDirectory(prefix='fa_convert_') as outdir:
+            command = [self.binary, f'-env:UserInstallation={profile.resolve().as_uri()}',
+                       '--headless', '--norestore', '--nologo', '--nolockcheck',
+                       '--convert-to', target, '--outdir', outdir] + batch
+            try:
+                subprocess.run(command, capture_output=True,
+                               timeout=LIBREOFFICE_STARTUP_TIMEOUT + LIBREOFFICE_FILE_TIMEOUT * len(batch))
+            except subprocess.TimeoutExpired:
+                print(f"  LibreOffice 轉換逾時: {', '.join(Path(path).name for path in batch)}")
+            except OSError as e:
+                print(f"  LibreOffice 無法執行: {e}")
+
+            for path in batch:
+                produced = Path(outdir) / f"{Path(path).stem}.{target}"
+                if not produced.exists():
+                    converted[path] = None
+                    continue
+                if path in keys:
+                    converted[path] = self.cache.put(keys[path], str(produced), target)
+                    continue
+                destination = Path(output_dir or Path(path).parent) / produced.name
+                shutil.move(str(produced), str(destination))
+                converted[path] = str(destination)
+        return converted
+
+    def _claim_profile(self) -> Path:
+        """取得未被其他工作者使用的設定檔槽位 (持有行程已結束的鎖定檔會被回收)"""
+        import os
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        slot = 0
+        while True:
+            lock = self.profile_dir / f"profile-{slot}.lock"
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._lock_is_stale(lock):
+                    lock.unlink(missing_ok=True)
+                else:
+                    slot += 1
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return self.profile_dir / f"profile-{slot}"
+
+    @staticmethod
+    def _release_profile(profile: Path):
+        profile.with_name(profile.name + '.lock').unlink(missing_ok=True)
+
+    @staticmethod
+    def _lock_is_stale(lock: Path) -> bool:
+        import os
+
+        if os.name == 'nt':
+            # Windows 上 os.kill 會結束目標行程, 無法用來檢查; 改用下一個槽位
+            return False
+        try:
+            pid = lock.read_text().strip()
+        except OSError:
+            return False
+        if not pid.isdigit():
+            return False  # 剛建立、尚未寫入 pid
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+
+# OOXML (DOCX/PPTX) 的 XML 命名空間
+_W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_A_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_P_NS = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+_R_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_V_NS = '{urn:schemas-microsoft-com:vml}'
+_MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# 逐段解析時需要處理的元素 (其餘元素直接略過)
+_OOXML_START_TAGS = {
+    _W_NS + 'tr': 'tr', _A_NS + 'tr': 'tr',
+    _W_NS + 'tc': 'tc', _A_NS + 'tc': 'tc',
+    _P_NS + 'sp': 'sp', _P_NS + 'ph': 'ph',
+    _A_NS + 'blip': 'blip', _V_NS + 'imagedata': 'imagedata',
+    _W_NS + 'pPr': 'ppr',
+    _MC_FALLBACK: 'fallback',
+}
+_OOXML_END_TAGS = {
+    _W_NS + 't': 't', _A_NS + 't': 't',
+    _W_NS + 'tab': 'tab', _W_NS + 'pPr': 'ppr',
+    _W_NS + 'br': 'br', _W_NS + 'cr': 'br', _A_NS + 'br': 'br',
+    _W_NS + 'p': 'p', _A_NS + 'p': 'p',
+    _W_NS + 'tc': 'tc', _A_NS + 'tc': 'tc',
+    _W_NS + 'tr': 'tr', _A_NS + 'tr': 'tr',
+    _P_NS + 'sp': 'sp',
+    _MC_FALLBACK: 'fallback',
+}
+
+
+class OOXMLPackage:
+    """以 zipfile 直接讀取 OOXML 文件 (DOCX/PPTX)
+
+    不建立 python-docx / python-pptx 的完整物件模型: 文件只開啟一次, XML 以
+    iterparse 逐段解析, 圖片直接讀取 word/media、ppt/media 中的原始資料。
+    """
+
+    def __init__(self, path: str):
+        import zipfile
+
+        self.zip = zipfile.ZipFile(path)
+        self.names = set(self.zip.namelist())
+        self._rels = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.zip.close()
+
+    def read(self, part: str) -> bytes:
+        return self.zip.read(part)
+
+    def rels(self, part: str) -> Dict[str, Tuple[str, str]]:
+        """讀取文件部分的關係 {rId: (關係類型, 目標部分路徑)}, 外部連結不列入"""
+        import posixpath
+        import xml.etree.ElementTree as ET
+
+        if part not in self._rels:
+            folder, name = posixpath.split(part)
+            rels_part = posixpath.join(folder, '_rels', name + '.rels')
+            rels = {}
+            if rels_part in self.names:
+                for rel in ET.fromstring(self.zip.read(rels_part)).iter(_PKG_REL_NS + 'Relationship'):
+                    if rel.get('TargetMode') == 'External':
+                        continue
+                    target = rel.get('Target', '')
+                    target = (target.lstrip('/') if target.startswith('/')
+                              else posixpath.normpath(posixpath.join(folder, target)))
+                    rels[rel.get('Id')] = (rel.get('Type', '').rsplit('/', 1)[-1], target)
+            self._rels[part] = rels
+        return self._rels[part]
+
+    def main_part(self, default: str) -> str:
+        """主文件部分 (word/document.xml 或 ppt/presentation.xml)"""
+        for rel_type, target in self.rels('').values():
+            if rel_type == 'officeDocument' and target in self.names:
+                return target
+        return default
+
+    def related(self, part: str, rel_type: str) -> List[str]:
+        """指定類型的關係目標 (依 rId 順序)"""
+        return [target for kind, target in self.rels(part).values()
+                if kind == rel_type and target in self.names]
+
+    def text(self, part: str, body_placeholders_only: bool = False) -> Tuple[List[str], List[str]]:
+        """逐段解析文件部分的文字與圖片引用
+
+        段落 (w:p / a:p) 各為一行; 表格 (w:tbl / a:tbl) 每列一行, 儲存格以 " | " 分隔;
+        文字方塊與群組圖形中的文字依出現順序列出。mc:Fallback 中的替代內容
+        (與 mc:Choice 重複) 會略過。
+
+        Args:
+            part: 文件部分路徑 (例如 ppt/slides/slide1.xml)
+            body_placeholders_only: 只保留 body 版面配置區的文字 (用於備註頁,
+                                    略過投影片縮圖與頁碼)
+
+        Returns:
+            (文字行列表, 依出現順序的圖片部分路徑 (不重複))
+        """
+        import xml.etree.ElementTree as ET
+
+        rels = self.rels(part)
+        lines, images = [], []
+        paragraph = []   # 目前段落的文字片段
+        cells = []       # 開啟中的儲存格 (段落列表) 堆疊
+        rows = []        # 開啟中的表格列 (儲存格文字列表) 堆疊
+        shape = None     # 備註頁: 目前圖形 [是否為 body, 段落列表]
+        fallback = 0
+        properties = 0   # 段落屬性 (w:pPr) 內的 w:tab 是定位點設定, 不是文字中的 tab
+
+        def emit(text: str):
+            if not text.strip():
+                return
+            if cells:
+                cells[-1].append(text)
+            elif shape is not None:
+                shape[1].append(text)
+            else:
+                lines.append(text)
+
+        def add_image(rel_id: str):
+            target = rels.get(rel_id)
+            if target and target[0] == 'image' and target[1] in self.names and target[1] not in images:
+                images.append(target[1])
+
+        for event, elem in ET.iterparse(self.zip.open(part), events=('start', 'end')):
+            if event == 'start':
+                kind = _OOXML_START_TAGS.get(elem.tag)
+                if kind is None or (fallback and kind != 'fallback'):
+                    continue
+                if kind == 'fallback':
+                    fallback += 1
+                elif kind == 'ppr':
+                    properties += 1
+                elif kind == 'tr':
+                    rows.append([])
+                elif kind == 'tc':
+                    cells.append([])
+                elif kind == 'sp':
+                    if body_placeholders_only:
+                        shape = [False, []]
+                elif kind == 'ph':
+                    if shape is not None:
+                        shape[0] = elem.get('type') == 'body'
+                elif kind == 'blip':
+                    add_image(elem.get(_R_NS + 'embed'))
+                elif kind == 'imagedata':
+                    add_image(elem.get(_R_NS + 'id'))
+                continue
+
+            kind = _OOXML_END_TAGS.get(elem.tag)
+            if kind is None:
+                continue
+            if fallback:
+                if kind == 'fallback':
+                    fallback -= 1
+                elif kind == 'p':
+                    elem.clear()
+                continue
+
+            if kind == 't':
+                paragraph.append(elem.text or '')
+            elif kind == 'ppr':
+                properties -= 1
+            elif kind == 'tab':
+                if not properties:
+                    paragraph.append('\t')
+            elif kind == 'br':
+                paragraph.append('\n')
+            elif kind == 'p':
+                emit(''.join(paragraph))
+                paragraph = []
+                elem.clear()
+            elif kind == 'tc':
+                cell_text = ' '.join(cells.pop()) if cells else ''
+                if rows:
+                    rows[-1].append(cell_text)
+            elif kind == 'tr':
+                emit(' | '.join(rows.pop()) if rows else '')
+                elem.clear()
+            elif kind == 'sp' and shape is not None:
+                is_body, texts = shape
+                shape = None
+                if is_body:
+                    lines.extend(texts)
+                elem.clear()
+        return lines, images
+
+
+class _ImageBudget:
+    """讀取報告時的圖片數量與記憶體上限"""
+
+    __slots__ = ('max_images', 'max_bytes', 'count', 'total_bytes')
+
+    def __init__(self, max_images: int = None, max_bytes: int = None):
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.count = 0
+        self.total_bytes = 0
+
+    @property
+    def exhausted(self) -> bool:
+        if self.max_images is not None and self.count >= self.max_images:
+            return True
+        return self.max_bytes is not None and self.total_bytes >= self.max_bytes
+
+    def accept(self, size: int) -> bool:
+        """嘗試保留一張圖片的額度, 超出上限時返回 False"""
+        if self.max_images is not None and self.count >= self.max_images:
+            return False
+        if self.max_bytes is not None and self.total_bytes + size > self.max_bytes:
+            return False
+        self.count += 1
+        self.total_bytes += size
+        return True
+
+
+class _ImageSelector:
+    """報告圖片篩選: 去除重複與裝飾性圖片, 並保留最有資訊量的圖片
+
+    以串流方式逐張加入, 只保留分數最高的 limit 張, 因此記憶體用量與報告中的
+    圖片總數無關。重複判斷使用 SHA-1 (完全相同) 與 dHash 感知雜湊 (近似重複),
+    在多頁重複出現的圖片 (logo、頁首橫幅等) 會被扣分; 讀取時已合併的重複引用
+    (PDF xref、PPTX 共用媒體) 以 ImageRecord.occurrences 計入。
+    """
+
+    # 近似重複的 dHash 漢明距離門檻 (64 bits)
+    NEAR_DUPLICATE_BITS = 5
+    # 小於此尺寸或檔案大小的圖片視為圖示/裝飾
+    MIN_EDGE = 64
+    MIN_BYTES = 2048
+    # 長寬比超過此值的圖片視為橫幅/分隔線
+    MAX_ASPECT_RATIO = 8
+
+    def __init__(self, limit: int, max_bytes: int = None):
+        self.limit = limit
+        self.max_bytes = max_bytes
+        self.page_hits = {}       # 頁碼 -> 分析關鍵字出現次數
+        self.candidates = []      # 目前保留的候選圖片
+        self.seen = []            # [(sha1, dhash, candidate 或 None)]
+        self.sequence = 0
+        self.stats = {'scanned': 0, 'duplicates': 0, 'decorative': 0, 'selected': 0}
+
+    def add_text(self, page: int, text: str):
+        """記錄頁面文字中的分析關鍵字數量"""
+        lowered = text.lower()
+        hits = sum(lowered.count(keyword.lower()) for keyword in ANALYSIS_KEYWORDS)
+        self.page_hits[page] = self.page_hits.get(page, 0) + hits
+
+    def add_image(self, image: 'ImageRecord'):
+        """加入一張圖片, 必要時淘汰分數最低的候選圖片"""
+        import hashlib
+
+        # 讀取時已合併的重複引用 (同一張圖片出現在多頁)
+        repeats = max(image.occurrences - 1, 0)
+        self.stats['scanned'] += 1 + repeats
+        self.stats['duplicates'] += repeats
+        raw = image.data
+        sha1 = hashlib.sha1(raw).digest()
+        features = self._image_features(raw)
+        dhash = features['dhash'] if features else None
+
+        # 重複圖片: 不加入, 但讓先前保留的同一張圖片扣分
+        for seen_sha1, seen_dhash, candidate in self.seen:
+            duplicate = seen_sha1 == sha1 or (
+                dhash is not None and seen_dhash is not None
+                and (dhash ^ seen_dhash).bit_count() <= self.NEAR_DUPLICATE_BITS)
+            if duplicate:
+                self.stats['duplicates'] += 1
+                if candidate is not None:
+                    candidate['repeats'] += 1 + repeats
+                    candidate['score'] -= 8 * (1 + repeats)
+                return
+
+        if self._is_decorative(raw, features):
+            self.stats['decorative'] += 1
+            self.seen.append((sha1, dhash, None))
+            return
+
+        page = image.page
+        score = min(self.page_hits.get(page, 0), 5) * 2
+        if features:
+            score += math.log2(max(features['pixels'], 1)) + features['entropy'] * 1.5
+        else:
+            score += math.log2(max(len(raw), 1))
+
+        score -= 8 * repeats
+        candidate = {'image': image, 'score': score, 'repeats': repeats,
+                     'size': len(raw), 'order': self.sequence}
+        self.sequence += 1
+        self.seen.append((sha1, dhash, candidate))
+        self.candidates.append(candidate)
+        self._trim()
+
+    def _trim(self):
+        """淘汰超出數量或記憶體上限的最低分候選圖片"""
+        def over_limit():
+            if len(self.candidates) > self.limit:
+                return True
+            if self.max_bytes is None or len(self.candidates) <= 1:
+                return False
+            return sum(c['size'] for c in self.candidates) > self.max_bytes
+
+        while self.candidates and over_limit():
+            lowest = min(self.candidates, key=lambda c: c['score'])
+            self.candidates.remove(lowest)
+            # 釋放圖片資料, 只保留雜湊供重複判斷
+            for index, (sha1, dhash, candidate) in enumerate(self.seen):
+                if candidate is lowest:
+                    self.seen[index] = (sha1, dhash, None)
+                    break
+
+    def _is_decorative(self, raw: bytes, features: Optional[Dict]) -> bool:
+        if len(raw) < self.MIN_BYTES:
+            return True
+        if not features:
+            return False
+        width, height = features['size']
+        if min(width, height) < self.MIN_EDGE:
+            return True
+        return max(width, height) / max(min(width, height), 1) > self.MAX_ASPECT_RATIO
+
+    @staticmethod
+    def _image_features(raw: bytes) -> Optional[Dict]:
+        """計算圖片尺寸、灰階熵與 dHash; 未安裝 Pillow 或無法解析時返回 None"""
+        if not HAS_PIL:
+            return None
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(raw)) as image:
+                size = image.size
+                image.draft('L', (256, 256))  # JPEG 可直接以較低解析度解碼
+                gray = image.convert('L')
+                gray.thumbnail((256, 256))
+                entropy = gray.entropy()
+                pixels = list(gray.resize((9, 8), Image.BILINEAR).getdata())
+        except Exception:
+            return None
+
+        dhash = 0
+        for row in range(8):
+            for col in range(8):
+                left = pixels[row * 9 + col]
+                right = pixels[row * 9 + col + 1]
+                dhash = (dhash << 1) | (left > right)
+        return {'size': size, 'pixels': size[0] * size[1], 'entropy': entropy, 'dhash': dhash}
+
+    def result(self) -> List['ImageRecord']:
+        """返回保留的圖片 (依原始文件順序)"""
+        selected = sorted(self.candidates, key=lambda c: c['order'])
+        self.stats['selected'] = len(selected)
+        return [c['image'] for c in selected]
+
+
+# 非同步模式下各事件迴圈中每個後端共用的 semaphore
+_ASYNC_LIMITS = {}
+_ASYNC_SEMAPHORES = None
+
+
+def set_async_concurrency(backend: str, limit: int):
+    """設定非同步模式下某個後端同時進行的請求數上限
+
+    需在該事件迴圈第一次送出此後端的請求之前呼叫。
+    """
+    _ASYNC_LIMITS[backend] = limit
+
+
+def _backend_semaphore(backend: str):
+    """取得目前事件迴圈中此後端共用的 semaphore (同一行程內所有分析器共用)"""
+    import asyncio
+    import weakref
+
+    global _ASYNC_SEMAPHORES
+    if _ASYNC_SEMAPHORES is None:
+        _ASYNC_SEMAPHORES = weakref.WeakKeyDictionary()
+
+    loop = asyncio.get_running_loop()
+    semaphores = _ASYNC_SEMAPHORES.setdefault(loop, {})
+    if backend not in semaphores:
+        limit = _ASYNC_LIMITS.get(backend) or BACKEND_CONCURRENCY.get(backend, 1)
+        semaphores[backend] = asyncio.Semaphore(limit)
+    return semaphores[backend]
+
+
+# 分頁符號: 讀取報告時以此連接各頁文字, 供提示詞精簡辨識跨頁重複的頁首/頁尾;
+# 送給模型與 read_report 返回前換成 PAGE_SEPARATOR
+PAGE_BREAK = "\f"
+PAGE_SEPARATOR = "\n\n"
+
+# 無本地 tokenizer 時的 token 估算比例:
+# (每個中日韓文字約佔的 token 數, 其他文字每個 token 約佔的字元數)
+TOKEN_ESTIMATE_RATIOS = {
+    'ollama': (1.0, 4.0),
+    'openai': (1.0, 4.0),
+    'anthropic': (1.3, 3.5),
+}
+
+_TIKTOKEN_ENCODERS = {}
+
+
+def _tiktoken_encoder(model: str):
+    """取得 OpenAI 模型的 tiktoken 編碼器, 未安裝或無法載入編碼表時返回 None"""
+    if model not in _TIKTOKEN_ENCODERS:
+        encoder = None
+        try:
+            import tiktoken
+            try:
+                encoder = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoder = tiktoken.get_encoding('o200k_base')
+        except Exception:
+            # 未安裝 tiktoken, 或離線環境無法下載編碼表
+            encoder = None
+        _TIKTOKEN_ENCODERS[model] = encoder
+    return _TIKTOKEN_ENCODERS[model]
+
+
+def estimate_tokens(text: str, backend: str, model: str = None) -> int:
+    """在本地估算文字的 token 數
+
+    OpenAI 模型在可用時使用 tiktoken 精確計算, 其餘依 TOKEN_ESTIMATE_RATIOS 粗估。
+    """
+    if not text:
+        return 0
+    if backend == 'openai' and model:
+        encoder = _tiktoken_encoder(model)
+        if encoder is not None:
+            return len(encoder.encode(text, disallowed_special=()))
+
+    cjk_ratio, chars_per_token = TOKEN_ESTIMATE_RATIOS.get(backend, (1.0, 4.0))
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return int(cjk * cjk_ratio + (len(text) - cjk) / chars_per_token)
+
+
+# 明確標示的頁碼行 (Page 3、Page 3 of 10、- 3 -、第 3 頁、第 3 頁 共 10 頁 等)
+_PAGE_MARKER_LINE = re.compile(
+    r'^(?:page\s*\d+(?:\s*(?:of|/)\s*\d+)?|[-–—]\s*\d{1,4}\s*[-–—]|'
+    r'第\s*\d+\s*頁(?:\s*[,，/／]?\s*共\s*\d+\s*頁)?)$', re.IGNORECASE)
+# 只有數字的頁碼行 (3、3 / 10、3 of 10), 也可能是資料, 需在多頁的同一位置遞增才視為頁碼
+_BARE_PAGE_NUMBER = re.compile(r'^(\d{1,4})(?:\s*(?:/|of)\s*\d+)?$', re.IGNORECASE)
+
+
+def _page_number_lines(pages: List[List[str]], edge_lines: int) -> List[set]:
+    """找出各頁頁首/頁尾位置的頁碼行, 返回各頁要移除的行索引
+
+    明確標示的頁碼 (_PAGE_MARKER_LINE) 直接視為頁碼; 只有數字的行需在至少 3 頁的
+    同一位置 (頁首第 n 行或頁尾倒數第 n 行) 出現且數值遞增才視為頁碼。單頁文字不移除。
+    """
+    page_numbers = [set() for _ in pages]
+    if len(pages) < 2:
+        return page_numbers
+
+    positions = {}  # 位置 (頁首為 0, 1, ..., 頁尾為 -1, -2, ...) -> [(頁索引, 數值, 行索引)]
+    for page_index, lines in enumerate(pages):
+        top = range(min(edge_lines, len(lines)))
+        bottom = range(max(0, len(lines) - edge_lines), len(lines))
+        for index in set(top) | set(bottom):
+            if _PAGE_MARKER_LINE.match(lines[index]):
+                page_numbers[page_index].add(index)
+                continue
+            match = _BARE_PAGE_NUMBER.match(lines[index])
+            if not match:
+                continue
+            if index in top:
+                positions.setdefault(index, []).append((page_index, int(match.group(1)), index))
+            if index in bottom:
+                positions.setdefault(index - len(lines), []).append((page_index, int(match.group(1)), index))
+
+    for hits in positions.values():
+        numbers = [number for _, number, _ in hits]
+        if len(hits) >= 3 and all(a < b for a, b in zip(numbers, numbers[1:])):
+            for page_index, _, index in hits:
+                page_numbers[page_index].add(index)
+    return page_numbers
+
+
+def compact_report_text(text: str, edge_lines: int = 3) -> Tuple[str, Dict]:
+    """精簡報告文字以減少提示詞 token
+
+    - 跨頁重複的頁首/頁尾 (出現在至少一半頁面的前後 edge_lines 行) 只保留第一次出現
+    - 移除頁首/頁尾位置的頁碼行 (見 _page_number_lines; 單頁文字不移除)
+    - 合併連續空白與空行
+
+    頁面以 PAGE_BREAK 分隔, 精簡後仍保留分頁符號 (map-reduce 分段會使用)。
+
+    Returns:
+        (精簡後的文字, 統計 {'pages', 'repeated_lines', 'page_numbers', 'chars_before', 'chars_after'})
+    """
+    def normalize(line: str) -> str:
+        return re.sub(r'[ \t\u3000\xa0]+', ' ', line).strip()
+
+    pages = [[normalize(line) for line in page.split('\n')] for page in text.split(PAGE_BREAK)]
+    pages = [[line for line in page if line] for page in pages]
+    stats = {'pages': len(pages), 'repeated_lines': 0, 'page_numbers': 0,
+             'chars_before': len(text), 'chars_after': 0}
+
+    def edge_indexes(lines: List[str]) -> set:
+        return set(range(min(edge_lines, len(lines)))) | set(range(max(0, len(lines) - edge_lines), len(lines)))
+
+    # 找出跨頁重複的頁首/頁尾
+    boilerplate = set()
+    if len(pages) >= 3:
+        counts = {}
+        for lines in pages:
+            for line in {lines[i] for i in edge_indexes(lines)}:
+                counts[line] = counts.get(line, 0) + 1
+        min_pages = max(3, (len(pages) + 1) // 2)
+        boilerplate = {line for line, count in counts.items() if count >= min_pages}
+
+    page_numbers = _page_number_lines(pages, edge_lines)
+    seen = set()
+    compacted = []
+    for lines, numbers in zip(pages, page_numbers):
+        edges = edge_indexes(lines)
+        kept = []
+        for index, line in enumerate(lines):
+            if index in edges:
+                if index in numbers:
+                    stats['page_numbers'] += 1
+                    continue
+                if line in boilerplate:
+                    if line in seen:
+                        stats['repeated_lines'] += 1
+                        continue
+                    seen.add(line)
+            kept.append(line)
+        if kept:
+            compacted.append('\n'.join(kept))
+
+    result = PAGE_BREAK.join(compacted)
+    stats['chars_after'] = len(result)
+    return result, stats
+
+
+def trim_to_token_budget(text: str, budget: int, backend: str, model: str = None) -> Tuple[str, int]:
+    """將報告文字裁切至 token 預算內
+
+    保留開頭 (基本資訊、問題描述) 與結尾 (根因、對策) 並省略中間內容, 於行邊界切分。
+
+    Returns:
+        (裁切後的文字, 省略的字元數)
+    """
+    tokens = estimate_tokens(text, backend, model)
+    if not budget or tokens <= budget:
+        return text, 0
+
+    keep = int(len(text) * budget / tokens)
+    while keep > 0:
+        head = text[:int(keep * 0.6)]
+        tail = text[len(text) - int(keep * 0.4):]
+        if '\n' in head:
+            head = head[:head.rfind('\n')]
+        if '\n' in tail:
+            tail = tail[tail.find('\n') + 1:]
+        omitted = len(text) - len(head) - len(tail)
+        trimmed = f"{head}\n[... 中間約 {omitted} 字元已省略以符合 token 預算 ...]\n{tail}"
+        if estimate_tokens(trimmed, backend, model) <= budget:
+            return trimmed, omitted
+        keep = int(keep * 0.9)
+    return "", len(text)
+
+
+# 報告章節標題 (用於 map-reduce 分段)
+_SECTION_HEADING = re.compile(
+    r'^\s*(?:【[^】]+】|#{1,6}\s+\S|\d+(?:\.\d+)*[\.、)]\s*\S|'
+    r'[一二三四五六七八九十]+[、.]|第[一二三四五六七八九十\d]+[章節部分])')
+
+
+def split_report_sections(text: str, max_chars: int) -> List[str]:
+    """依章節將報告切分為不超過 max_chars 的段落
+
+    優先在章節標題 (【...】、Markdown 標題、1. / 1.1 / 一、/ 第X章 等) 與分頁處切分,
+    再將相鄰章節合併到接近 max_chars; 單一章節過長時依段落、行切分。
+    """
+    # 切分章節
+    sections = []
+    current = []
+    for line in text.replace('\f', '\n\f').split('\n'):
+        starts_page = line.startswith('\f')
+        line = line.lstrip('\f')
+        if current and (starts_page or _SECTION_HEADING.match(line)):
+            sections.append('\n'.join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append('\n'.join(current))
+
+    # 過長的章節依段落/行切分
+    pieces = []
+    for section in sections:
+        if len(section) <= max_chars:
+            pieces.append(section)
+            continue
+        for block in re.split(r'\n\s*\n', section):
+            while len(block) > max_chars:
+                cut = block.rfind('\n', 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                pieces.append(block[:cut])
+                block = block[cut:].lstrip('\n')
+            pieces.append(block)
+
+    # 合併相鄰段落
+    chunks = []
+    buffer = ''
+    for piece in pieces:
+        if not piece.strip():
+            continue
+        if buffer and len(buffer) + len(piece) + 1 > max_chars:
+            chunks.append(buffer)
+            buffer = piece
+        else:
+            buffer = f"{buffer}\n{piece}" if buffer else piece
+    if buffer:
+        chunks.append(buffer)
+    return chunks
+
+
+def collect_batch_inputs(inputs: List[str] = None, manifest: str = None) -> List[Path]:
+    """收集批次分析的輸入文件
+
+    Args:
+        inputs: 資料夾、glob 樣式或文件路徑列表
+        manifest: 清單文件路徑 (每行一個文件路徑, # 開頭為註解)
+
+    Returns:
+        去除重複後的文件路徑列表 (保持輸入順序)
+    """
+    import glob
+
+    candidates = []
+    for item in inputs or []:
+        path = Path(item)
+        if path.is_dir():
+            candidates.extend(sorted(p for p in path.iterdir() if p.is_file()))
+        elif any(ch in item for ch in '*?['):
+            candidates.extend(sorted(Path(p) for p in glob.glob(item, recursive=True)))
+        else:
+            candidates.append(path)
+
+    if manifest:
+        manifest_path = Path(manifest)
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                path = Path(line)
+                # 相對路徑以清單文件所在目錄為基準
+                if not path.is_absolute():
+                    path = manifest_path.parent / path
+                candidates.append(path)
+
+    files = []
+    seen = set()
+    for path in candidates:
+        if path.suffix.lower() not in SUPPORTED_SUFFIXES:
+            continue
+        key = path.resolve()
+        if key in seen:
+            continue
+        seen.add(key)
+        files.append(path)
+    return files
+
+
+def _read_report_task(analyzer: 'FAReportAnalyzer', file_path: str) -> Tuple[str, List[ImageRecord], Dict]:
+    """在子行程中讀取報告 (供批次模式的 ProcessPoolExecutor 使用)
+
+    Returns:
+        (文字內容, 圖片列表, 讀取階段的指標)
+    """
+    try:
+        return analyzer._read_with_metrics(file_path)
+    finally:
+        analyzer._cleanup_temp_files()
 
 
 class FAReportAnalyzer:
@@ -46,7 +2496,39 @@ class FAReportAnalyzer:
                  model: str = None,
                  api_key: str = None,
                  base_url: str = None,
-                 skip_images: bool = False):
+                 skip_images: bool = False,
+                 use_cache: bool = True,
+                 refresh_cache: bool = False,
+                 cache_dir: str = None,
+                 max_image_mb: float = DEFAULT_MAX_IMAGE_MB,
+                 preprocess_images: bool = True,
+                 image_max_edge: int = None,
+                 image_quality: int = 85,
+                 image_format: str = 'jpeg',
+                 image_budget_mb: float = None,
+                 stream: bool = False,
+                 max_retries: int = 5,
+                 requests_per_minute: int = None,
+                 tokens_per_minute: int = None,
+                 pool_size: int = 10,
+                 timeout: float = 600,
+                 concurrency: int = None,
+                 analysis_mode: str = 'single',
+                 chunk_chars: int = 12000,
+                 compact_prompt: bool = True,
+                 token_budget: int = None,
+                 structured_output: bool = True,
+                 metrics_log: str = None,
+                 metrics_prom_file: str = None,
+                 metrics_port: int = None,
+                 metrics_host: str = '127.0.0.1',
+                 ollama_keep_alive=OLLAMA_KEEP_ALIVE,
+                 ollama_warmup: bool = True,
+                 ollama_num_ctx: int = None,
+                 ollama_max_ctx: int = OLLAMA_MAX_CTX,
+                 office_workers: int = None,
+                 conversion_cache_dir: str = None,
+                 conversion_cache_mb: float = 2048):
         """初始化分析器
 
         Args:
@@ -55,12 +2537,66 @@ class FAReportAnalyzer:
             api_key: API key (OpenAI/Anthropic 需要)
             base_url: API base URL (OpenAI 相容接口)
             skip_images: 是否跳過圖片分析 (僅分析文字)
+            use_cache: 是否使用分析結果快取
+            refresh_cache: 忽略既有快取並重新分析 (結果仍會寫入快取)
+            cache_dir: 快取資料夾 (預設: ~/.cache/fa_report_analyzer/analysis)
+            max_image_mb: 每份報告保留的圖片原始資料上限 (MB, None 表示不限制)
+            preprocess_images: 送出前是否縮小並重新壓縮圖片
+            image_max_edge: 圖片最長邊 (px, 預設: 依後端 IMAGE_MAX_EDGE)
+            image_quality: 重新壓縮的品質 (1-100)
+            image_format: 重新壓縮的格式 ('jpeg' 或 'webp')
+            image_budget_mb: 單次請求的圖片總量上限 (MB, 預設: 依後端 IMAGE_PAYLOAD_BUDGET)
+            stream: 使用串流回應 (可提前偵測拒絕並在 JSON 完整時停止生成)
+            max_retries: LLM 請求失敗 (429/5xx/連線錯誤) 時的最多重試次數
+            requests_per_minute: 每分鐘請求數上限 (預設: 依伺服器 rate-limit 標頭)
+            tokens_per_minute: 每分鐘 token 數上限 (預設: 依伺服器 rate-limit 標頭)
+            pool_size: 共用客戶端的最大連線數 (keep-alive 連線池大小)
+            timeout: LLM 請求逾時秒數
+            concurrency: 同時進行的 LLM 請求數 (批次模式的報告數與 map-reduce 的分段數;
+                         預設: 依後端 BACKEND_CONCURRENCY)
+            analysis_mode: 分析模式 ('single' 單次分析, 'mapreduce' 分段證據整理後合併評分,
+                           'per-dimension' 各維度並行評分, 'auto' 依報告長度自動選擇)
+            chunk_chars: map-reduce 模式每段的最大字元數
+            compact_prompt: 送出前移除跨頁重複的頁首/頁尾、頁碼與多餘空白
+            token_budget: 報告內容的 token 上限, 超過時保留開頭與結尾並省略中間
+                          (None 表示不限制; map-reduce 模式改以分段處理, 不裁切)
+            structured_output: 以 JSON schema 約束模型輸出 (Ollama format, OpenAI json_schema,
+                               Anthropic 工具呼叫); 不支援的 OpenAI 相容伺服器可關閉
+            metrics_log: 每份報告各階段耗時與計數的 JSON-lines 記錄文件
+            metrics_prom_file: Prometheus 文字格式的指標文件
+            metrics_port: 提供 Prometheus /metrics 端點的連接埠
+            metrics_host: /metrics 端點綁定的位址 (預設只接受本機連線)
+            ollama_keep_alive: Ollama 模型在最後一次請求後的常駐時間 (例如 '30m', -1 表示不卸載)
+            ollama_warmup: 批次分析時以第一份報告預先載入 Ollama 模型 (建立分析器不會連線)
+            ollama_num_ctx: 固定的 Ollama num_ctx (預設: 依提示詞長度自動調整)
+            ollama_max_ctx: 自動調整 num_ctx 的上限
+            office_workers: 並行轉換舊版 .ppt 的 LibreOffice 數量 (預設: CPU 核心數的一半, 最多 4)
+            conversion_cache_dir: 轉換後 .pptx 的快取資料夾 (預設: ~/.cache/fa_report_analyzer/converted)
+            conversion_cache_mb: 轉換快取的容量上限 (MB)
         """
+        if not HAS_PANDAS:
+            # 在分析前檢查, 避免 LLM 請求完成後才因無法輸出報告而失敗
+            raise ImportError("需要安裝 pandas: pip install pandas --break-system-packages")
         self.backend = backend.lower()
         self.api_key = api_key
         self.base_url = base_url
         self.skip_images = skip_images
         self.temp_files = []  # 用於追蹤需要清理的臨時文件
+        self.conversion_cache = ConversionCache(conversion_cache_dir, conversion_cache_mb)
+        self.office_converter = OfficeConverter(workers=office_workers, cache=self.conversion_cache)
+        self.refresh_cache = refresh_cache
+        self.cache = AnalysisCache(cache_dir) if use_cache else None
+        self.max_image_bytes = int(max_image_mb * 1024 * 1024) if max_image_mb else None
+        self.preprocess_images = preprocess_images
+        self.image_max_edge = image_max_edge
+        self.image_quality = image_quality
+        self.image_format = image_format.lower()
+        self.image_budget_bytes = int(image_budget_mb * 1024 * 1024) if image_budget_mb else None
+        self.last_image_stats = None  # 最近一次圖片前處理的統計
+        self.stream = stream
+        self.last_stream_stats = None  # 最近一次串流回應的統計
+        self.last_usage = None  # 最近一次請求的 token 用量 (含提示詞快取命中)
+        self.usage = _UsageCounter()
         
         # 設定預設模型
         if model:
@@ -78,8 +2614,42 @@ class FAReportAnalyzer:
             else:
                 self.model = "llama3.2-vision:latest"
         
+        if analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"不支援的分析模式: {analysis_mode}")
+        self.analysis_mode = analysis_mode
+        self.concurrency = concurrency
+        if concurrency:
+            set_async_concurrency(self.backend, concurrency)
+        self.chunk_chars = chunk_chars
+        self.compact_prompt = compact_prompt
+        self.token_budget = token_budget
+        self.last_prompt_stats = None  # 最近一次提示詞精簡的統計
+        self.structured_output = structured_output
+        self.metrics = (MetricsSink(metrics_log, metrics_prom_file, metrics_port, metrics_host)
+                        if metrics_log or metrics_prom_file or metrics_port else None)
+        self.last_metrics = None  # 最近一份報告的各階段耗時與計數
+
+        # Ollama 模型常駐與 context 大小 (num_ctx 只增不減, 避免來回重新載入模型)
+        self.ollama_keep_alive = ollama_keep_alive
+        self.ollama_num_ctx = ollama_num_ctx
+        self.ollama_max_ctx = max(ollama_max_ctx, OLLAMA_MIN_CTX)
+        self._ollama_ctx = ollama_num_ctx or OLLAMA_MIN_CTX
+        self.ollama_warmup = ollama_warmup
+        self._ollama_warmed = False
+        self.last_ollama_timings = None  # 最近一次 Ollama 請求的載入/提示詞處理/生成耗時
+
         # 初始化客戶端
+        self.pool_size = pool_size
+        self.timeout = timeout
         self._init_client()
+
+        # 速率限制與重試排程器 (相同後端、端點與 API key 的分析器共用)
+        self.scheduler = get_scheduler(
+            self.backend, self.base_url, self.api_key,
+            max_retries=max_retries,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute
+        )
         
         # 評估維度與權重
         self.dimensions = {
@@ -100,6 +2670,14 @@ class FAReportAnalyzer:
             'F': (0, 59, '不合格報告')
         }
     
+    def __getstate__(self):
+        # LLM 客戶端無法序列化, 子行程僅需讀取報告, 不需要客戶端
+        state = self.__dict__.copy()
+        state['scheduler'] = None
+        state['usage'] = None
+        state['metrics'] = None
+        return state
+
     def _init_client(self):
         """初始化 LLM 客戶端"""
         if self.backend == "ollama":
@@ -110,88 +2688,79 @@ class FAReportAnalyzer:
                 if not self.backend:
                     raise RuntimeError("無可用的 LLM 後端")
             else:
-                self.client = None  # Ollama 使用函數式調用
                 print(f"✓ 使用 Ollama 地端模型: {self.model}")
         
         elif self.backend == "openai":
             if not HAS_OPENAI:
                 raise ImportError("需要安裝 openai: pip install openai --break-system-packages")
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
             print(f"✓ 使用 OpenAI API: {self.model}")
         
         elif self.backend == "anthropic":
-            self.client = anthropic.Anthropic(api_key=self.api_key)
+            if not HAS_ANTHROPIC:
+                raise ImportError("需要安裝 anthropic: pip install anthropic --break-system-packages")
             print(f"✓ 使用 Anthropic Claude: {self.model}")
         
         else:
             raise ValueError(f"不支援的後端: {self.backend}")
+
+    @property
+    def client(self):
+        """共用連線池中的 LLM 客戶端 (相同端點與 API key 的分析器共用)
+
+        第一次送出請求時才建立, 只讀取報告或檢查參數時不會匯入後端 SDK。
+        """
+        return get_client(self.backend, self.base_url, self.api_key, self.pool_size, self.timeout)
+
+    def _start_ollama_warmup(self, report_content: str, images: List[ImageRecord] = None):
+        """以第一份報告計算 num_ctx, 在背景預先載入 Ollama 模型 (批次模式使用, 只執行一次)
+
+        num_ctx 與分析請求同樣由 _ollama_request_kwargs 計算; 未精簡的報告估算值不小於
+        實際請求, 而 num_ctx 只增不減, 因此之後的請求沿用相同大小, 不會重新載入模型。
+        """
+        if self.backend != "ollama" or not self.ollama_warmup or self._ollama_warmed:
+            return
+        self._ollama_warmed = True
+        prompt = self.create_report_prompt(report_content, bool(images))
+        num_ctx = self._ollama_request_kwargs(prompt, images, self.create_system_prompt())['options']['num_ctx']
+        threading.Thread(target=self._warmup_ollama, args=(num_ctx,), daemon=True).start()
+
+    def _warmup_ollama(self, num_ctx: int):
+        """預先載入 Ollama 模型並以 keep_alive 常駐, 讀取與前處理報告時同時載入模型
+
+        空白提示詞的 generate 只載入模型不生成。
+        """
+        try:
+            response = self.client.generate(model=self.model, prompt='',
+                                            keep_alive=self.ollama_keep_alive,
+                                            options={'num_ctx': num_ctx})
+        except Exception as e:
+            print(f"⚠️  Ollama 模型預先載入失敗, 將於第一次請求時載入: {e}")
+            return
+        load = (self._usage_field(response, 'load_duration') or 0) / 1e9
+        print(f"✓ Ollama 模型已載入: {load:.2f} 秒 (num_ctx {num_ctx}, "
+              f"常駐 {self.ollama_keep_alive})")
     
     def _convert_ppt_to_pptx(self, ppt_path: str) -> Optional[str]:
         """嘗試將 .ppt 轉換為 .pptx
         
+        轉換結果存放在轉換快取中 (以文件內容為鍵值), 不會寫在來源文件旁邊,
+        相同文件再次分析時直接使用快取。
+
         Args:
             ppt_path: .ppt 文件路徑
             
         Returns:
             轉換後的 .pptx 文件路徑，失敗返回 None
         """
-        import subprocess
         import os
-        
-        pptx_path = ppt_path.rsplit('.', 1)[0] + '_converted.pptx'
-        
-        # 方法 1: 嘗試使用 LibreOffice
-        try:
-            # 檢查 LibreOffice 是否安裝
-            libreoffice_paths = [
-                'libreoffice',
-                '/Applications/LibreOffice.app/Contents/MacOS/soffice',  # macOS
-                '/usr/bin/libreoffice',  # Linux
-                'C:\\Program Files\\LibreOffice\\program\\soffice.exe',  # Windows
-            ]
-            
-            libreoffice_cmd = None
-            for path in libreoffice_paths:
-                try:
-                    if os.path.exists(path) or subprocess.run(
-                        [path, '--version'], 
-                        capture_output=True, 
-                        timeout=2
-                    ).returncode == 0:
-                        libreoffice_cmd = path
-                        break
-                except:
-                    continue
-            
-            if libreoffice_cmd:
-                print(f"  使用 LibreOffice 進行轉換...")
-                output_dir = os.path.dirname(ppt_path)
-                result = subprocess.run(
-                    [
-                        libreoffice_cmd,
-                        '--headless',
-                        '--convert-to', 'pptx',
-                        '--outdir', output_dir,
-                        ppt_path
-                    ],
-                    capture_output=True,
-                    timeout=30
-                )
-                
-                if result.returncode == 0:
-                    # LibreOffice 會生成與原文件同名但副檔名為 .pptx 的文件
-                    auto_pptx = ppt_path.rsplit('.', 1)[0] + '.pptx'
-                    if os.path.exists(auto_pptx):
-                        self.temp_files.append(auto_pptx)  # 記錄臨時文件
-                        return auto_pptx
-                    elif os.path.exists(pptx_path):
-                        self.temp_files.append(pptx_path)  # 記錄臨時文件
-                        return pptx_path
-        except Exception as e:
-            print(f"  LibreOffice 轉換失敗: {e}")
+        import tempfile
+
+        # 方法 1: 使用 LibreOffice (快取命中時不會啟動 LibreOffice)
+        converted = self.office_converter.convert([ppt_path])[ppt_path]
+        if converted:
+            return converted
+        if self.office_converter.available:
+            print(f"  LibreOffice 轉換失敗")
         
         # 方法 2: 在 Windows 上嘗試使用 pywin32
         if os.name == 'nt':
@@ -202,20 +2771,41 @@ class FAReportAnalyzer:
                 powerpoint = win32com.client.Dispatch("PowerPoint.Application")
                 powerpoint.Visible = 1
                 
-                # 打開並轉換
-                deck = powerpoint.Presentations.Open(os.path.abspath(ppt_path))
-                deck.SaveAs(os.path.abspath(pptx_path), 24)  # 24 = ppSaveAsOpenXMLPresentation
-                deck.Close()
-                powerpoint.Quit()
-
-                if os.path.exists(pptx_path):
-                    self.temp_files.append(pptx_path)  # 記錄臨時文件
-                    return pptx_path
+                with tempfile.TemporaryDirectory(prefix='fa_convert_') as outdir:
+                    pptx_path = os.path.join(outdir, Path(ppt_path).stem + '.pptx')
+
+                    # 打開並轉換
+                    deck = powerpoint.Presentations.Open(os.path.abspath(ppt_path))
+                    deck.SaveAs(pptx_path, 24)  # 24 = ppSaveAsOpenXMLPresentation
+                    deck.Close()
+                    powerpoint.Quit()
+
+                    if os.path.exists(pptx_path):
+                        cache = self.conversion_cache
+                        return cache.put(cache.make_key(ppt_path, 'pptx'), pptx_path, 'pptx')
             except Exception as e:
                 print(f"  COM 轉換失敗: {e}")
         
         return None
 
+    def _preconvert_legacy_files(self, files: List[Path]):
+        """批次開始前並行轉換所有舊版 .ppt 並存入轉換快取 (每個 LibreOffice 呼叫轉換多個文件)
+
+        轉換結果保留在快取中直到批次結束 (ConversionCache.release), 避免容量淘汰
+        在讀取之前刪除先前轉換的文件。
+        """
+        import time
+
+        legacy = [str(path) for path in files if path.suffix.lower() == '.ppt']
+        if not legacy or not self.office_converter.available:
+            return
+        start = time.perf_counter()
+        results = self.office_converter.convert(legacy, pin=True)
+        succeeded = sum(1 for target in results.values() if target)
+        print(f"✓ 預先轉換 .ppt: {succeeded}/{len(legacy)} 份 (含快取), "
+              f"{self.office_converter.workers} 個 LibreOffice 工作者, "
+              f"耗時 {time.perf_counter() - start:.1f} 秒")
+
     def _cleanup_temp_files(self):
         """清理臨時轉換的文件"""
         import os
@@ -242,295 +2832,455 @@ class FAReportAnalyzer:
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
     
-    def _extract_images_from_pdf(self, pdf_path: str) -> List[bytes]:
-        """從 PDF 提取圖片
-        
+    def _iter_pdf_pages(self, pdf_path: str, budget: '_ImageBudget' = None):
+        """逐頁讀取 PDF 的文字和圖片 (單次開啟文件)
+
+        優先使用 PyMuPDF 同時提取文字和圖片; 未安裝 PyMuPDF 時改用 PyPDF2,
+        此時僅能提取文字。
+
         Args:
             pdf_path: PDF 文件路徑
-            
-        Returns:
-            圖片二進制數據列表
+            budget: 圖片上限, 達到上限後不再提取圖片
+
+        Yields:
+            (頁碼, 頁面文字, 該頁圖片列表 [(二進制數據, 引用此圖片的頁數)])
         """
-        images = []
         try:
             import fitz  # PyMuPDF
-            pdf_document = fitz.open(pdf_path)
-            
-            for page_num in range(len(pdf_document)):
-                page = pdf_document[page_num]
-                image_list = page.get_images()
-                
-                for img_index, img in enumerate(image_list):
-                    xref = img[0]
-                    base_image = pdf_document.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    images.append(image_bytes)
-            
-            pdf_document.close()
-            return images
         except ImportError:
+            fitz = None
+
+        if fitz is None:
+            try:
+                import PyPDF2
+            except ImportError:
+                print("警告: 需要安裝 PyMuPDF 或 PyPDF2: pip install PyMuPDF --break-system-packages")
+                raise
             print("警告: 需要安裝 PyMuPDF 來提取 PDF 圖片: pip install PyMuPDF --break-system-packages")
-            return []
-        except Exception as e:
-            print(f"提取 PDF 圖片時發生錯誤: {e}")
-            return []
-    
-    def _extract_images_from_docx(self, docx_path: str) -> List[bytes]:
-        """從 DOCX 提取圖片
-        
+            with open(pdf_path, 'rb') as f:
+                reader = PyPDF2.PdfReader(f)
+                for page_num, page in enumerate(reader.pages, 1):
+                    with _metric_stage('pdf_text'):
+                        text = page.extract_text() or ""
+                    yield page_num, text, []
+            return
+
+        pdf_document = fitz.open(pdf_path)
+        try:
+            # 同一張圖片 (如頁首 logo) 在多頁引用時只提取一次, 引用頁數交給圖片篩選扣分
+            occurrences = {}
+            for page_index in range(pdf_document.page_count):
+                for xref in {img[0] for img in pdf_document.get_page_images(page_index)}:
+                    occurrences[xref] = occurrences.get(xref, 0) + 1
+            seen_xrefs = set()
+            for page_num, page in enumerate(pdf_document, 1):
+                page_images = []
+                for img in page.get_images():
+                    if budget is not None and budget.exhausted:
+                        break
+                    xref = img[0]
+                    if xref in seen_xrefs:
+                        continue
+                    seen_xrefs.add(xref)
+                    try:
+                        with _metric_stage('pdf_images'):
+                            page_images.append((pdf_document.extract_image(xref)["image"],
+                                                occurrences.get(xref, 1)))
+                    except Exception as e:
+                        print(f"提取 PDF 圖片時發生錯誤 (第 {page_num} 頁): {e}")
+                with _metric_stage('pdf_text'):
+                    text = page.get_text()
+                yield page_num, text, page_images
+        finally:
+            pdf_document.close()
+
+    def _iter_docx_parts(self, docx_path: str, budget: '_ImageBudget' = None):
+        """讀取 DOCX 的文字 (含表格與文字方塊) 和圖片
+
+        以 OOXMLPackage 直接解析 word/document.xml, 圖片依文件中出現的順序
+        讀取 word/media 中的原始資料。
+
         Args:
             docx_path: DOCX 文件路徑
-            
-        Returns:
-            圖片二進制數據列表
+            budget: 圖片上限, 達到上限後不再讀取圖片
+
+        Yields:
+            (頁碼, 文字, 圖片列表 [(二進制數據, 1)]); Word 文件沒有固定分頁, 頁碼固定為 1
         """
-        images = []
-        try:
-            import docx
-            from docx.oxml import parse_xml
-            
-            doc = docx.Document(docx_path)
-            
-            # 從關係中提取圖片
-            for rel in doc.part.rels.values():
-                if "image" in rel.target_ref:
-                    image_bytes = rel.target_part.blob
-                    images.append(image_bytes)
-            
-            return images
-        except ImportError:
-            print("警告: 需要安裝 python-docx: pip install python-docx --break-system-packages")
-            return []
-        except Exception as e:
-            print(f"提取 DOCX 圖片時發生錯誤: {e}")
-            return []
-    
-    def _extract_images_from_pptx(self, pptx_path: str) -> List[bytes]:
-        """從 PPTX 提取圖片
-        
+        with OOXMLPackage(docx_path) as package:
+            document = package.main_part('word/document.xml')
+            lines, images = package.text(document)
+            yield 1, "\n".join(lines), []
+
+            # 文件中未直接引用的圖片關係 (例如舊版 VML 圖形) 排在最後
+            images += [target for target in package.related(document, 'image') if target not in images]
+            for image_part in images:
+                if budget is not None and budget.exhausted:
+                    break
+                try:
+                    yield 1, "", [(package.read(image_part), 1)]
+                except Exception as e:
+                    print(f"提取 DOCX 圖片時發生錯誤: {e}")
+
+    def _iter_pptx_parts(self, pptx_path: str, budget: '_ImageBudget' = None):
+        """逐張投影片讀取 PPTX 的文字 (含表格、群組圖形與備註) 和圖片
+
+        以 OOXMLPackage 依 presentation.xml 的投影片順序逐張解析投影片 XML,
+        圖片直接讀取 ppt/media 中的原始資料; 多張投影片共用的圖片 (例如 logo) 只讀取一次。
+
         Args:
             pptx_path: PPTX 文件路徑
-            
-        Returns:
-            圖片二進制數據列表
+            budget: 圖片上限, 達到上限後不再讀取圖片
+
+        Yields:
+            (投影片編號, 投影片文字, 該投影片圖片列表 [(二進制數據, 使用此圖片的投影片數)])
         """
-        images = []
-        try:
-            from pptx import Presentation
-            
-            prs = Presentation(pptx_path)
-            
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "image"):
-                        image_bytes = shape.image.blob
-                        images.append(image_bytes)
-            
-            return images
-        except ImportError:
-            print("警告: 需要安裝 python-pptx: pip install python-pptx --break-system-packages")
-            return []
-        except Exception as e:
-            print(f"提取 PPTX 圖片時發生錯誤: {e}")
-            return []
-    
-    def read_report(self, file_path: str) -> Tuple[str, List[Dict]]:
-        """讀取 FA 報告文件（文字和圖片）
-        
+        import xml.etree.ElementTree as ET
+
+        with OOXMLPackage(pptx_path) as package:
+            presentation = package.main_part('ppt/presentation.xml')
+            slide_rels = package.rels(presentation)
+            slides = []
+            for slide_id in ET.fromstring(package.read(presentation)).iter(_P_NS + 'sldId'):
+                rel_type, target = slide_rels.get(slide_id.get(_R_NS + 'id'), ('', ''))
+                if rel_type == 'slide' and target in package.names:
+                    slides.append(target)
+
+            # 共用圖片只讀取一次, 使用的投影片數交給圖片篩選扣分
+            occurrences = {}
+            for slide in slides:
+                for image_part in set(package.related(slide, 'image')):
+                    occurrences[image_part] = occurrences.get(image_part, 0) + 1
+            seen_images = set()
+            for slide_num, slide in enumerate(slides, 1):
+                text_parts, images = package.text(slide)
+                for notes in package.related(slide, 'notesSlide'):
+                    notes_lines, _ = package.text(notes, body_placeholders_only=True)
+                    if notes_lines:
+                        text_parts.append("[備註] " + "\n".join(notes_lines))
+
+                slide_images = []
+                for image_part in images:
+                    if image_part in seen_images or (budget is not None and budget.exhausted):
+                        continue
+                    seen_images.add(image_part)
+                    try:
+                        slide_images.append((package.read(image_part), occurrences.get(image_part, 1)))
+                    except Exception as e:
+                        print(f"提取 PPTX 圖片時發生錯誤 (第 {slide_num} 張投影片): {e}")
+                yield slide_num, "\n".join(text_parts), slide_images
+
+    def iter_report_parts(self,
+                          file_path: str,
+                          max_images: int = None,
+                          max_image_bytes: int = None):
+        """逐頁/逐張投影片讀取 FA 報告 (文字和圖片)
+
+        各部分在讀取時才產生, 超出圖片上限的圖片不會被讀入記憶體,
+        因此呼叫端只需保留真正要送給模型的內容。
+
         Args:
             file_path: 報告文件路徑
-            
-        Returns:
-            (文字內容, 圖片列表)
+            max_images: 最多產生的圖片數量 (None 表示不限制)
+            max_image_bytes: 圖片原始資料總量上限 (bytes, None 表示不限制)
+
+        Yields:
+            文字部分 {'type': 'text', 'text': ..., 'page': ...} 或
+            圖片部分 ImageRecord (原始資料, 格式依檔頭判斷)
         """
         file_path = Path(file_path)
-        
+
         if not file_path.exists():
             raise FileNotFoundError(f"找不到文件: {file_path}")
-        
-        text_content = ""
-        images = []
-        
+
+        budget = _ImageBudget(max_images, max_image_bytes)
         suffix = file_path.suffix.lower()
-        
+
         # 純圖片文件
         if suffix in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-            with open(file_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-                images.append({
-                    'type': 'image',
-                    'data': image_data,
-                    'format': suffix[1:]  # 去掉點
-                })
-            text_content = f"[圖片文件: {file_path.name}]"
-        
+            yield {'type': 'text', 'text': f"[圖片文件: {file_path.name}]", 'page': 1}
+            if budget.accept(file_path.stat().st_size):
+                with open(file_path, 'rb') as f:
+                    yield ImageRecord(f.read(), page=1)
+            return
+
         # 文字文件
-        elif suffix == '.txt':
+        if suffix == '.txt':
             with open(file_path, 'r', encoding='utf-8') as f:
-                text_content = f.read()
-        
-        # PDF 文件
-        elif suffix == '.pdf':
-            try:
-                import PyPDF2
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text_content = ""
-                    for page in reader.pages:
-                        text_content += page.extract_text() + "\n"
-                
-                # 提取圖片
-                image_bytes_list = self._extract_images_from_pdf(str(file_path))
-                for img_bytes in image_bytes_list:
-                    img_b64 = base64.b64encode(img_bytes).decode('utf-8')
-                    images.append({
-                        'type': 'image',
-                        'data': img_b64,
-                        'format': 'png'
-                    })
-                
-            except ImportError:
-                print("警告: 需要安裝 PyPDF2: pip install PyPDF2 --break-system-packages")
-                raise
-        
+                yield {'type': 'text', 'text': f.read(), 'page': 1}
+            return
+
+        if suffix == '.pdf':
+            pages = self._iter_pdf_pages(str(file_path), budget)
+
         # Word 文件
         elif suffix in ['.doc', '.docx']:
-            try:
-                import docx
-                doc = docx.Document(file_path)
-                text_content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                
-                # 提取圖片
-                image_bytes_list = self._extract_images_from_docx(str(file_path))
-                for img_bytes in image_bytes_list:
-                    img_b64 = base64.b64encode(img_bytes).decode('utf-8')
-                    images.append({
-                        'type': 'image',
-                        'data': img_b64,
-                        'format': 'png'
-                    })
-                
-            except ImportError:
-                print("警告: 需要安裝 python-docx: pip install python-docx --break-system-packages")
-                raise
-        
+            pages = self._iter_docx_parts(str(file_path), budget)
+
         # PowerPoint 文件
         elif suffix in ['.ppt', '.pptx']:
             # 處理舊版 .ppt 格式
             if suffix == '.ppt':
-                print(f"⚠️  檢測到舊版 PowerPoint 格式 (.ppt)")
-                print(f"正在嘗試轉換為 .pptx 格式...")
-                
-                converted_path = self._convert_ppt_to_pptx(str(file_path))
-                if converted_path:
-                    print(f"✓ 轉換成功: {converted_path}")
-                    file_path = Path(converted_path)
-                else:
-                    print("\n" + "=" * 70)
-                    print("⚠️  無法自動轉換 .ppt 文件")
-                    print("=" * 70)
-                    print("\n請使用以下方法之一:\n")
-                    print("方法 1: 手動轉換 (推薦)")
-                    print("  1. 在 PowerPoint 中開啟此文件")
-                    print("  2. 另存為 .pptx 格式")
-                    print("  3. 重新執行分析\n")
-                    print("方法 2: 使用 LibreOffice 轉換")
-                    print("  安裝: brew install libreoffice  # macOS")
-                    print("       sudo apt install libreoffice  # Linux")
-                    print(f"  轉換: libreoffice --headless --convert-to pptx \"{file_path}\"\n")
-                    print("方法 3: 線上轉換")
-                    print("  使用 CloudConvert 或其他線上轉換工具")
-                    print("=" * 70)
-                    raise ValueError("不支援 .ppt 格式，請先轉換為 .pptx")
-            
-            try:
-                from pptx import Presentation
-                prs = Presentation(file_path)
-                
-                text_parts = []
-                for slide in prs.slides:
-                    for shape in slide.shapes:
-                        if hasattr(shape, "text"):
-                            text_parts.append(shape.text)
-                
-                text_content = "\n".join(text_parts)
-                
-                # 提取圖片
-                image_bytes_list = self._extract_images_from_pptx(str(file_path))
-                for img_bytes in image_bytes_list:
-                    img_b64 = base64.b64encode(img_bytes).decode('utf-8')
-                    images.append({
-                        'type': 'image',
-                        'data': img_b64,
-                        'format': 'png'
-                    })
-                
-            except ImportError:
-                print("警告: 需要安裝 python-pptx: pip install python-pptx --break-system-packages")
-                raise
-        
+                file_path = self._prepare_ppt(file_path)
+            pages = self._iter_pptx_parts(str(file_path), budget)
+
         else:
             raise ValueError(f"不支援的文件格式: {suffix}")
-        
-        return text_content, images
-    
-    def create_analysis_prompt(self, report_content: str, has_images: bool = False) -> str:
-        """創建分析提示詞
+
+        for page_num, page_text, page_images in pages:
+            if page_text:
+                yield {'type': 'text', 'text': page_text, 'page': page_num}
+            for img_bytes, occurrences in page_images:
+                if not budget.accept(len(img_bytes)):
+                    continue
+                yield ImageRecord(img_bytes, page=page_num, occurrences=occurrences)
+
+    def _prepare_ppt(self, file_path: Path) -> Path:
+        """將舊版 .ppt 轉換為 .pptx, 失敗時顯示手動轉換說明並拋出錯誤"""
+        print(f"⚠️  檢測到舊版 PowerPoint 格式 (.ppt)")
+        print(f"正在嘗試轉換為 .pptx 格式...")
+
+        with _metric_stage('convert'):
+            converted_path = self._convert_ppt_to_pptx(str(file_path))
+        if converted_path:
+            print(f"✓ 轉換成功: {converted_path}")
+            return Path(converted_path)
+
+        print("\n" + "=" * 70)
+        print("⚠️  無法自動轉換 .ppt 文件")
+        print("=" * 70)
+        print("\n請使用以下方法之一:\n")
+        print("方法 1: 手動轉換 (推薦)")
+        print("  1. 在 PowerPoint 中開啟此文件")
+        print("  2. 另存為 .pptx 格式")
+        print("  3. 重新執行分析\n")
+        print("方法 2: 使用 LibreOffice 轉換")
+        print("  安裝: brew install libreoffice  # macOS")
+        print("       sudo apt install libreoffice  # Linux")
+        print(f"  轉換: libreoffice --headless --convert-to pptx \"{file_path}\"\n")
+        print("方法 3: 線上轉換")
+        print("  使用 CloudConvert 或其他線上轉換工具")
+        print("=" * 70)
+        raise ValueError("不支援 .ppt 格式，請先轉換為 .pptx")
+
+    def read_report(self,
+                    file_path: str,
+                    max_images: int = None,
+                    max_image_bytes: int = None) -> Tuple[str, List[Dict]]:
+        """讀取 FA 報告文件（文字和圖片）
         
         Args:
-            report_content: 報告內容
-            has_images: 是否包含圖片
+            file_path: 報告文件路徑
+            max_images: 最多讀取的圖片數量 (None 表示不限制)
+            max_image_bytes: 圖片原始資料總量上限 (bytes, None 表示不限制)
             
         Returns:
-            完整的分析提示詞
+            (文字內容 (各頁以空行分隔), 圖片列表 [{'type': 'image', 'data': <base64>, 'format', 'page'}])
         """
-        image_note = ""
-        if has_images:
-            image_note = """
-【注意】此報告包含圖片,請仔細分析圖片中的內容:
-- 檢查圖片的清晰度和標註
-- 評估圖片是否充分支持分析結論
-- 判斷圖表/數據視覺化的品質
-"""
-        
-        prompt = f"""請分析這份 Failure Analysis Report,並根據以下評估維度進行全面評分:
-{image_note}
+        text, images = self._read_report(file_path, max_images, max_image_bytes)
+        return text.replace(PAGE_BREAK, PAGE_SEPARATOR), [img.to_dict() for img in images]
+
+    def _read_report(self,
+                     file_path: str,
+                     max_images: int = None,
+                     max_image_bytes: int = None) -> Tuple[str, List[ImageRecord]]:
+        """讀取報告文字 (各頁以 PAGE_BREAK 分隔) 與 ImageRecord 圖片 (分析流程使用, 不產生 base64)"""
+        text_parts = []
+        images = []
+        for part in self.iter_report_parts(file_path, max_images, max_image_bytes):
+            if isinstance(part, ImageRecord):
+                images.append(part)
+            else:
+                text_parts.append(part['text'])
+        return PAGE_BREAK.join(text_parts), images
+
+    def _read_report_for_analysis(self, file_path: str) -> Tuple[str, List[ImageRecord]]:
+        """讀取報告並篩選圖片 (見 _select_report_parts), 記錄讀取耗時、位元組與圖片數量"""
+        import os
+
+        with _metric_stage('read'):
+            report_content, images = self._select_report_parts(file_path)
+        _metric_count('bytes_read', os.path.getsize(file_path))
+        _metric_count('images', len(images))
+        _metric_count('image_bytes', sum(img.size for img in images))
+        return report_content, images
+
+    def _read_with_metrics(self, file_path: str) -> Tuple[str, List[ImageRecord], Dict]:
+        """讀取報告, 另外返回讀取階段的指標 (供其他執行緒或行程合併到報告的指標)"""
+        metrics = ReportMetrics(file_path)
+        token = _CURRENT_METRICS.set(metrics)
+        try:
+            report_content, images = self._read_report_for_analysis(file_path)
+        finally:
+            _CURRENT_METRICS.reset(token)
+        return report_content, images, metrics.to_dict()
+
+    def _select_report_parts(self, file_path: str) -> Tuple[str, List[ImageRecord]]:
+        """讀取報告並篩選圖片, 只保留會送給模型的圖片
+
+        重複圖片與 logo/圖示等裝飾性圖片會被去除, 其餘依尺寸、資訊量 (熵) 與同頁
+        文字是否為分析內容排序, 以最有資訊量的圖片填滿後端的圖片數量上限。
+        同時保留的圖片原始資料不超過 max_image_bytes。
+        """
+        if self.skip_images:
+            return self._read_report(file_path, max_images=0)
+
+        limit = IMAGE_LIMITS.get(self.backend, 5)
+        # 單張圖片文件不需要篩選
+        if Path(file_path).suffix.lower() in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
+            return self._read_report(file_path, limit, self.max_image_bytes)
+
+        selector = _ImageSelector(limit, self.max_image_bytes)
+        text_parts = []
+        for part in self.iter_report_parts(file_path):
+            if isinstance(part, ImageRecord):
+                selector.add_image(part)
+            else:
+                text_parts.append(part['text'])
+                selector.add_text(part['page'], part['text'])
+        images = selector.result()
+
+        stats = selector.stats
+        if stats['scanned']:
+            print(f"✓ 圖片篩選: 掃描 {stats['scanned']} 張, 重複 {stats['duplicates']} 張, "
+                  f"裝飾性 {stats['decorative']} 張, 保留 {stats['selected']} 張")
+        return PAGE_BREAK.join(text_parts), images
+    
+    def _ensure_supported_images(self, images: List[ImageRecord]) -> List[ImageRecord]:
+        """將後端不支援的格式 (TIFF/BMP/EMF 等) 轉為 PNG, 無法轉換的圖片會被略過"""
+        supported = []
+        for img in images:
+            converted = img.to_supported()
+            if converted is None:
+                print(f"⚠️  不支援的圖片格式 {img.mime}, 已略過 (第 {img.page} 頁)")
+                continue
+            supported.append(converted)
+        return supported
+
+    def _prepare_images(self, images: List[ImageRecord]) -> List[ImageRecord]:
+        """送出前的圖片前處理: 縮小尺寸、重新壓縮並限制總傳輸量
+
+        模型內部也會將圖片縮小, 超過各後端最長邊 (IMAGE_MAX_EDGE) 的解析度只會增加
+        上傳時間與 token 成本。未安裝 Pillow 時圖片維持原樣。
+
+        Args:
+            images: 圖片列表
+
+        Returns:
+            處理後的圖片列表 (超出總傳輸量上限的圖片會被捨棄)
+        """
+        images = images[:IMAGE_LIMITS.get(self.backend, len(images))]
+        if not HAS_PIL:
+            print("警告: 需要安裝 Pillow 來壓縮圖片: pip install Pillow --break-system-packages")
+            return images
+
+        max_edge = self.image_max_edge or IMAGE_MAX_EDGE.get(self.backend, 1568)
+        budget = self.image_budget_bytes or IMAGE_PAYLOAD_BUDGET.get(self.backend)
+        image_format = self.image_format
+        if image_format == 'webp' and self.backend == 'ollama':
+            image_format = 'jpeg'  # Ollama 僅確定支援 JPEG/PNG
+
+        prepared = []
+        bytes_in = 0
+        bytes_out = 0
+        for img in images:
+            raw = img.data
+            bytes_in += len(raw)
+            remaining = budget - bytes_out if budget else None
+
+            # 品質逐步降低, 直到符合剩餘傳輸量
+            qualities = [self.image_quality] + [q for q in (70, 55, 40) if q < self.image_quality]
+            data = None
+            for quality in qualities:
+                data = self._recompress_image(raw, max_edge, image_format, quality)
+                if data is None:
+                    # 無法解析的格式, 維持原始資料
+                    data = raw
+                    break
+                if remaining is None or len(data) <= remaining:
+                    break
+
+            if remaining is not None and len(data) > remaining:
+                print(f"⚠️  圖片超出傳輸量上限, 已略過 (第 {img.page} 頁)")
+                continue
+
+            bytes_out += len(data)
+            if data is raw:
+                prepared.append(img)
+            else:
+                prepared.append(ImageRecord(data, page=img.page, mime=f"image/{image_format}"))
+
+        self.last_image_stats = {
+            'images_in': len(images),
+            'images_out': len(prepared),
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'bytes_saved': bytes_in - bytes_out,
+        }
+        if images:
+            saved = (1 - bytes_out / bytes_in) * 100 if bytes_in else 0
+            print(f"✓ 圖片前處理: {len(prepared)}/{len(images)} 張, "
+                  f"{bytes_in / 1024 / 1024:.2f} MB → {bytes_out / 1024 / 1024:.2f} MB "
+                  f"(節省 {saved:.0f}%)")
+        return prepared
+
+    @staticmethod
+    def _recompress_image(raw: bytes, max_edge: int, image_format: str, quality: int) -> Optional[bytes]:
+        """縮小並重新壓縮單張圖片
+
+        Returns:
+            壓縮後的圖片資料; 若原圖已夠小且壓縮後沒有變小則返回原始資料;
+            Pillow 無法解析時返回 None
+        """
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(raw)) as image:
+                image.load()
+                resized = max(image.size) > max_edge
+                if resized:
+                    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+                # JPEG 不支援透明度, 將透明背景合成為白色
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    image = image.convert('RGBA')
+                    if image_format == 'jpeg':
+                        background = Image.new('RGB', image.size, (255, 255, 255))
+                        background.paste(image, mask=image.getchannel('A'))
+                        image = background
+                elif image.mode != 'RGB':
+                    image = image.convert('RGB')
+
+                output = io.BytesIO()
+                image.save(output, format=image_format.upper(), quality=quality)
+                data = output.getvalue()
+        except Exception:
+            return None
+
+        if not resized and len(data) >= len(raw):
+            return raw
+        return data
+
+    def _format_dimension_rubric(self, names: List[str] = None) -> str:
+        """將評估維度、權重與評分細項 (DIMENSION_CRITERIA) 格式化為提示詞文字"""
+        blocks = []
+        for index, name in enumerate(names or self.dimensions, 1):
+            lines = [f"{index}. **{name}** ({self.dimensions[name]}%)"]
+            lines.extend(f"   - {item}" for item in DIMENSION_CRITERIA.get(name, []))
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
+
+    def create_system_prompt(self) -> str:
+        """創建固定的評分標準提示詞 (評估維度、權重、等級、JSON 格式)
+
+        內容與報告無關, 每次請求都完全相同, 放在請求最前面作為 system 提示,
+        讓 Anthropic (cache_control) 與 OpenAI (自動前綴快取) 可重複使用已處理的前綴。
+        """
+        return f"""你是一位資深的失效分析 (Failure Analysis) 報告審查專家。
+請分析使用者提供的 Failure Analysis Report,並根據以下評估維度進行全面評分:
+
 【評估維度與權重】
-1. **基本資訊完整性** (15%)
-   - 產品資訊(型號、批號、製造日期)
-   - 客戶資訊與投訴內容
-   - FA 編號與日期
-   - 負責工程師資訊
-
-2. **問題描述與定義** (15%)
-   - 失效現象描述的清晰度
-   - 失效模式的準確性
-   - 問題範圍與影響評估
-   - 失效率數據
-
-3. **分析方法與流程** (20%)
-   - 分析方法的適當性(如:光學檢查、SEM、FIB、X-ray等)
-   - 分析步驟的邏輯性與完整性
-   - 實驗設計的合理性
-   - 分析設備使用的正確性
-
-4. **數據與證據支持** (20%)
-   - 分析數據的充分性
-   - 圖片/圖表的清晰度與標註
-   - 量化數據的準確性
-   - 對照組/比較樣本的使用
-
-5. **根因分析** (20%)
-   - 根本原因的深度與準確度
-   - 因果關係的邏輯推導
-   - 5-Why 或 Fishbone 分析的應用
-   - 排除其他可能原因的論證
-
-6. **改善對策** (10%)
-   - 短期與長期對策的完整性
-   - 對策的可行性與有效性
-   - 預防措施的提出
-   - 驗證計畫
+{self._format_dimension_rubric()}
 
 【評分標準】
 - **A級 (90-100分)**:卓越報告
@@ -564,17 +3314,74 @@ class FAReportAnalyzer:
   "summary": "<總評與建議>"
 }}
 
-重要格式要求:
-1. 你的回應必須是純 JSON 格式,不要包含任何其他文字、markdown 標記或程式碼區塊符號
-2. 所有數字欄位(total_score, score, percentage)必須是純數字,不要加單位或符號(例如: 85.5 而不是 85.5% 或 85.5分)
-3. percentage 是百分比數值(0-100),例如: 93.33 表示 93.33%
-4. 使用台灣繁體中文回答
+重要格式要求:
+1. 你的回應必須是純 JSON 格式,不要包含任何其他文字、markdown 標記或程式碼區塊符號
+2. 所有數字欄位(total_score, score, percentage)必須是純數字,不要加單位或符號(例如: 85.5 而不是 85.5% 或 85.5分)
+3. percentage 是百分比數值(0-100),例如: 93.33 表示 93.33%
+4. 使用台灣繁體中文回答
+"""
+
+    def create_report_prompt(self, report_content: str, has_images: bool = False) -> str:
+        """創建每份報告不同的提示詞部分 (圖片說明與報告內容)"""
+        image_note = ""
+        if has_images:
+            image_note = """【注意】此報告包含圖片,請仔細分析圖片中的內容:
+- 檢查圖片的清晰度和標註
+- 評估圖片是否充分支持分析結論
+- 判斷圖表/數據視覺化的品質
+
+"""
+        return f"""{image_note}【FA 報告內容】
+{report_content}
+"""
+
+    def create_analysis_prompt(self, report_content: str, has_images: bool = False) -> str:
+        """創建分析提示詞
+        
+        Args:
+            report_content: 報告內容
+            has_images: 是否包含圖片
+            
+        Returns:
+            完整的分析提示詞 (評分標準 + 報告內容)
+        """
+        return f"{self.create_system_prompt()}\n{self.create_report_prompt(report_content, has_images)}"
+
+    @property
+    def result_schema(self) -> Dict:
+        """分析結果的 JSON schema (依目前的評估維度產生)"""
+        return build_result_schema(self.dimensions)
+
+    def _per_dimension_schema(self, name: Optional[str]) -> Dict:
+        """'per-dimension' 模式各請求的 schema: 維度評分或總評 (取自 result_schema)"""
+        schema = self.result_schema
+        if name is None:
+            return sub_schema(schema, ['strengths', 'improvements', 'summary'])
+        return schema['properties']['dimension_scores']['properties'][name]
+
+    def _structured_output_kwargs(self, schema: Dict = None) -> Dict:
+        """各後端約束輸出格式的請求參數"""
+        if not schema or not self.structured_output:
+            return {}
+        if self.backend == "ollama":
+            return {'format': schema}
+        if self.backend == "openai":
+            return {'response_format': {
+                "type": "json_schema",
+                "json_schema": {"name": "fa_report_analysis", "schema": schema, "strict": True}
+            }}
+        if self.backend == "anthropic":
+            # 強制呼叫唯一的工具, 工具輸入即為符合 schema 的結果
+            return {
+                'tools': [{
+                    "name": RESULT_TOOL_NAME,
+                    "description": "提交 FA 報告的評估結果",
+                    "input_schema": schema
+                }],
+                'tool_choice': {"type": "tool", "name": RESULT_TOOL_NAME},
+            }
+        return {}
 
-【FA 報告內容】
-{report_content}
-"""
-        return prompt
-    
     def _clean_json_response(self, response_text: str) -> str:
         """清理 AI 返回的 JSON 響應
 
@@ -584,8 +3391,6 @@ class FAReportAnalyzer:
         Returns:
             清理後的 JSON 字串
         """
-        import re
-
         # 移除 markdown 代碼塊標記
         response_text = response_text.replace('```json', '').replace('```', '').strip()
 
@@ -601,7 +3406,7 @@ class FAReportAnalyzer:
 
         return response_text
 
-    def analyze_with_ai(self, report_content: str, images: List[Dict] = None) -> Dict:
+    def analyze_with_ai(self, report_content: str, images: List[ImageRecord] = None) -> Dict:
         """使用 AI 分析報告
 
         Args:
@@ -611,23 +3416,56 @@ class FAReportAnalyzer:
         Returns:
             分析結果字典
         """
-        # 根據 skip_images 設定決定是否使用圖片
-        if self.skip_images and images:
-            print("⚠️  已啟用 --skip-images,將僅分析文字內容")
-            images = None
+        report_content, prompt, images, cache_key, cached = self._prepare_analysis(report_content, images)
+        if cached is not None:
+            return cached
 
-        has_images = images and len(images) > 0
-        prompt = self.create_analysis_prompt(report_content, has_images)
+        try:
+            mode = self._resolve_analysis_mode(report_content)
+            if mode == 'mapreduce':
+                result = self._analyze_map_reduce(report_content, images)
+            elif mode == 'per-dimension':
+                result = self._analyze_per_dimension(report_content, images)
+            else:
+                result = self._dispatch(prompt, images, system=self.create_system_prompt(),
+                                        schema=self.result_schema)
+
+        except json.JSONDecodeError as e:
+            print(f"JSON 解析錯誤: {e}")
+            raise
+        except Exception as e:
+            print(f"分析過程發生錯誤: {e}")
+            raise
+
+        self._cache_result(cache_key, result)
+        return result
+
+    async def aanalyze_with_ai(self, report_content: str, images: List[ImageRecord] = None) -> Dict:
+        """使用 AI 分析報告 (asyncio 版本)
+
+        使用各後端的原生非同步客戶端, 同一事件迴圈中同一後端的請求數
+        受 BACKEND_CONCURRENCY (或 set_async_concurrency 設定) 限制。
+
+        Args:
+            report_content: 報告文字內容
+            images: 圖片列表
+
+        Returns:
+            分析結果字典
+        """
+        report_content, prompt, images, cache_key, cached = self._prepare_analysis(report_content, images)
+        if cached is not None:
+            return cached
 
         try:
-            if self.backend == "ollama":
-                return self._analyze_with_ollama(prompt, images)
-            elif self.backend == "openai":
-                return self._analyze_with_openai(prompt, images)
-            elif self.backend == "anthropic":
-                return self._analyze_with_anthropic(prompt, images)
+            mode = self._resolve_analysis_mode(report_content)
+            if mode == 'mapreduce':
+                result = await self._aanalyze_map_reduce(report_content, images)
+            elif mode == 'per-dimension':
+                result = await self._aanalyze_per_dimension(report_content, images)
             else:
-                raise ValueError(f"不支援的後端: {self.backend}")
+                result = await self._adispatch(prompt, images, system=self.create_system_prompt(),
+                                               schema=self.result_schema)
 
         except json.JSONDecodeError as e:
             print(f"JSON 解析錯誤: {e}")
@@ -635,50 +3473,507 @@ class FAReportAnalyzer:
         except Exception as e:
             print(f"分析過程發生錯誤: {e}")
             raise
-    
-    def _analyze_with_ollama(self, prompt: str, images: List[Dict] = None) -> Dict:
-        """使用 Ollama 進行分析"""
-        messages = []
-        
-        # 構建消息內容
-        if images and len(images) > 0:
-            # 多模態消息
-            content_parts = [prompt]
-            for img in images[:5]:  # 限制最多 5 張圖片
-                content_parts.append({
-                    'type': 'image',
-                    'data': img['data']
-                })
-            messages.append({
-                'role': 'user',
-                'content': prompt,
-                'images': [img['data'] for img in images[:5]]
-            })
-        else:
-            messages.append({
-                'role': 'user',
-                'content': prompt
-            })
-        
-        # 調用 Ollama
-        response = ollama.chat(
-            model=self.model,
-            messages=messages
-        )
-        
-        response_text = response['message']['content'].strip()
 
-        print("=== Ollama raw response ===")
-        print(response_text)
-        print("=== End raw response ===")
+        self._cache_result(cache_key, result)
+        return result
 
-        # 清理並解析 JSON
-        response_text = self._clean_json_response(response_text)
+    def _dispatch(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                  schema: Dict = None) -> Dict:
+        """經由排程器送出單次請求, 返回解析後的 JSON
+
+        回應無法解析或不符合 schema 時, 只把該回應送回模型修正格式 (不含報告與圖片),
+        不重新執行整個分析。
+
+        Args:
+            prompt: 每次請求不同的提示詞 (報告內容)
+            images: 圖片列表
+            system: 固定的 system 提示 (評分標準), 作為可快取的請求前綴
+            schema: 回應的 JSON schema (結構化輸出與結果驗證)
+        """
+        analyze = self._backend_analyze()
+        with _metric_stage('llm'):
+            try:
+                return self.scheduler.call(lambda: analyze(prompt, images, system, schema),
+                                           self._estimate_request_tokens(f"{system or ''}{prompt}", images))
+            except json.JSONDecodeError as e:
+                return self._fix_json(e, schema)
+
+    async def _adispatch(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                         schema: Dict = None) -> Dict:
+        """經由排程器送出單次請求 (非同步)"""
+        analyze = self._backend_analyze(asynchronous=True)
+        async with _backend_semaphore(self.backend):
+            with _metric_stage('llm'):
+                try:
+                    return await self.scheduler.acall(lambda: analyze(prompt, images, system, schema),
+                                                      self._estimate_request_tokens(f"{system or ''}{prompt}",
+                                                                                    images))
+                except json.JSONDecodeError as e:
+                    fix_prompt = self._build_json_fix_prompt(e.doc, str(e), schema)
+                    try:
+                        return await self.scheduler.acall(lambda: analyze(fix_prompt, None, None, schema),
+                                                          self._estimate_request_tokens(fix_prompt))
+                    except json.JSONDecodeError:
+                        return self._fallback_json(e, schema)
+
+    def _backend_analyze(self, asynchronous: bool = False):
+        """目前後端的分析方法 (prompt, images, system, schema)"""
+        if self.backend == "ollama":
+            return self._aanalyze_with_ollama if asynchronous else self._analyze_with_ollama
+        elif self.backend == "openai":
+            return self._aanalyze_with_openai if asynchronous else self._analyze_with_openai
+        elif self.backend == "anthropic":
+            return self._aanalyze_with_anthropic if asynchronous else self._analyze_with_anthropic
+        raise ValueError(f"不支援的後端: {self.backend}")
+
+    def _fix_json(self, error: json.JSONDecodeError, schema: Dict = None) -> Dict:
+        """送出格式修正請求 (見 _dispatch), 失敗時改用 _fallback_json"""
+        analyze = self._backend_analyze()
+        fix_prompt = self._build_json_fix_prompt(error.doc, str(error), schema)
+        try:
+            return self.scheduler.call(lambda: analyze(fix_prompt, None, None, schema),
+                                       self._estimate_request_tokens(fix_prompt))
+        except json.JSONDecodeError:
+            return self._fallback_json(error, schema)
+
+    def _build_json_fix_prompt(self, response_text: str, error: str, schema: Dict = None) -> str:
+        """建立修正 JSON 格式的提示詞 (只含有問題的回應, 遠小於原始分析請求)"""
+        print(f"⚠️  回應 JSON 無效 ({error}), 送出格式修正請求")
+        schema_text = ""
+        if schema:
+            schema_text = f"\n【JSON schema】\n{json.dumps(schema, ensure_ascii=False)}\n"
+        return f"""以下 JSON 無法解析或不符合要求的格式,錯誤訊息: {error}
+
+請修正格式並補上缺少的欄位,保留原有的評分與文字內容,不要重新評估。
+只回傳修正後的純 JSON,不要包含任何其他文字、markdown 標記或程式碼區塊符號。
+{schema_text}
+【待修正的 JSON】
+{response_text}
+"""
+
+    def _fallback_json(self, error: json.JSONDecodeError, schema: Dict = None) -> Dict:
+        """格式修正請求也失敗時, 若原始回應仍可解析且包含 schema 必要的頂層欄位則沿用, 否則拋出原錯誤
+
+        沿用的結果未通過 schema 檢查, 不會寫入分析快取 (見 _cache_result)。
+        """
+        try:
+            result = json.loads(repair_json(error.doc))
+        except json.JSONDecodeError:
+            raise error
+        if not isinstance(result, dict):
+            raise error
+        if any(name not in result for name in (schema or {}).get('required', [])):
+            raise error
+        print(f"⚠️  格式修正失敗, 沿用原始回應: {error}")
+        return result
+
+    def _cache_result(self, cache_key: Optional[str], result: Dict):
+        """將分析結果寫入快取 (不符合 result_schema 的結果不寫入, 下次會重新分析)"""
+        if not self.cache or not cache_key:
+            return
+        problems = schema_problems(result, self.result_schema)
+        if problems:
+            print(f"⚠️  分析結果不符合格式, 不寫入快取: {'; '.join(problems[:5])}")
+            return
+        self.cache.put(cache_key, result)
+
+    def _prepare_analysis(self, report_content: str, images: List[ImageRecord] = None):
+        """精簡報告文字、建立提示詞、查詢快取並前處理圖片 (同步與非同步分析共用)
+
+        Returns:
+            (精簡後的報告文字, 提示詞, 處理後的圖片列表, 快取鍵值, 快取結果或 None)
+        """
+        # 根據 skip_images 設定決定是否使用圖片
+        if self.skip_images and images:
+            print("⚠️  已啟用 --skip-images,將僅分析文字內容")
+            images = None
+
+        if images:
+            images = [ImageRecord.coerce(img) for img in images]
+
+        has_images = images and len(images) > 0
+        report_content = self._compact_report(report_content)
+        prompt = self.create_report_prompt(report_content, has_images)
+
+        # 查詢分析快取, 命中時直接返回先前的結果
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(report_content, images, f"{self.create_system_prompt()}{prompt}",
+                                            self.backend, self.model,
+                                            variant=self._cache_variant(report_content, images))
+            if not self.refresh_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    print(f"✓ 命中分析快取 ({cache_key[:12]}), 略過 AI 分析")
+                    return report_content, prompt, images, cache_key, cached
+
+        with _metric_stage('image_prep'):
+            if has_images:
+                images = self._ensure_supported_images(images)
+            if images and self.preprocess_images:
+                images = self._prepare_images(images)
+        if images:
+            _metric_count('images_sent', len(images))
+            _metric_count('image_bytes_sent', sum(img.size for img in images))
+
+        return report_content, prompt, images, cache_key, None
+
+    def _cache_variant(self, report_content: str, images: List[ImageRecord] = None) -> str:
+        """影響分析結果的設定 (分析快取鍵值的 variant)
+
+        快取鍵值以前處理之前的圖片計算, 因此圖片的縮放、品質與格式設定也要納入。
+        """
+        mode = self._resolve_analysis_mode(report_content)
+        parts = [f"mode={mode}", f"structured={int(bool(self.structured_output))}"]
+        if mode == 'mapreduce':
+            parts.append(f"chunk_chars={self.chunk_chars}")
+        if images:
+            parts.append(f"images={self.image_max_edge}/{self.image_quality}/{self.image_format}"
+                         if self.preprocess_images else "images=original")
+        return ";".join(parts)
+
+    def _compact_report(self, report_content: str) -> str:
+        """精簡報告文字並裁切至 token 預算, 顯示前後的 token 數"""
+        tokens_before = estimate_tokens(report_content, self.backend, self.model)
+        stats = {'tokens_before': tokens_before, 'repeated_lines': 0, 'page_numbers': 0, 'omitted_chars': 0}
+
+        if self.compact_prompt:
+            report_content, compact_stats = compact_report_text(report_content)
+            stats['repeated_lines'] = compact_stats['repeated_lines']
+            stats['page_numbers'] = compact_stats['page_numbers']
+
+        # map-reduce 模式以分段處理長篇報告, 不裁切
+        mapreduce = self._resolve_analysis_mode(report_content) == 'mapreduce'
+        if self.token_budget and not mapreduce:
+            report_content, stats['omitted_chars'] = trim_to_token_budget(
+                report_content, self.token_budget, self.backend, self.model)
+            if stats['omitted_chars']:
+                print(f"⚠️  報告超出 token 預算 ({self.token_budget}), 已省略中間 {stats['omitted_chars']} 字元; "
+                      f"如需完整分析請使用 --mode mapreduce")
+        # 分頁符號不送給模型 (map-reduce 分段時才會用到, 由 split_report_sections 移除)
+        if not mapreduce:
+            report_content = report_content.replace(PAGE_BREAK, PAGE_SEPARATOR)
+
+        stats['tokens_after'] = estimate_tokens(report_content, self.backend, self.model)
+        self.last_prompt_stats = stats
+        if stats['tokens_after'] < tokens_before:
+            saved = (1 - stats['tokens_after'] / tokens_before) * 100
+            print(f"✓ 提示詞精簡: 報告 {tokens_before} → {stats['tokens_after']} tokens (節省 {saved:.0f}%), "
+                  f"移除重複頁首/頁尾 {stats['repeated_lines']} 行, 頁碼 {stats['page_numbers']} 行")
+        return report_content
+
+    def _request_concurrency(self) -> int:
+        """同時進行的 LLM 請求數 (--concurrency, 預設依後端 BACKEND_CONCURRENCY)"""
+        return self.concurrency or BACKEND_CONCURRENCY.get(self.backend, 1)
+
+    def _resolve_analysis_mode(self, report_content: str) -> str:
+        """決定實際使用的分析模式 ('auto' 依報告長度選擇)"""
+        if self.analysis_mode != 'auto':
+            return self.analysis_mode
+        threshold = MAP_REDUCE_THRESHOLD.get(self.backend, 24000)
+        if estimate_tokens(report_content, self.backend, self.model) > threshold:
+            return 'mapreduce'
+        return 'single'
+
+    def _build_map_prompt(self, chunk: str, index: int, total: int) -> str:
+        """建立分段證據整理 (map) 的提示詞"""
+        dimension_lines = "\n".join(f"- {name} ({weight}%)" for name, weight in self.dimensions.items())
+        evidence_schema = ",\n".join(
+            f'    "{name}": {{"evidence": ["<具體證據>"], "missing": ["<缺少的內容>"], "score_hint": <0-100>}}'
+            for name in self.dimensions)
+        return f"""以下是一份 Failure Analysis Report 的第 {index}/{total} 段。
+請只根據這一段的內容, 整理與各評估維度相關的證據, 不要推測其他段落的內容:
+{dimension_lines}
+
+請以 JSON 格式回傳, 格式如下:
+
+{{
+  "dimensions": {{
+{evidence_schema}
+  }},
+  "strengths": ["<此段的具體優點>"],
+  "issues": ["<此段的具體問題>"]
+}}
+
+重要格式要求:
+1. 你的回應必須是純 JSON 格式,不要包含任何其他文字、markdown 標記或程式碼區塊符號
+2. score_hint 是此段內容對該維度的完成度 (0-100), 此段未涉及該維度時填 null
+3. evidence 請簡短引用原文重點, 每個維度最多 5 項
+4. 使用台灣繁體中文回答
+
+【報告第 {index}/{total} 段】
+{chunk}
+"""
+
+    def _build_reduce_prompt(self, map_results: List[Dict], has_images: bool) -> str:
+        """將各段證據整理合併為最終評分 (reduce) 的提示詞 (評分標準另以 system 提示送出)"""
+        evidence = {name: {'evidence': [], 'missing': [], 'score_hints': []} for name in self.dimensions}
+        strengths = []
+        issues = []
+        for result in map_results:
+            for name, info in (result.get('dimensions') or {}).items():
+                if name not in evidence or not isinstance(info, dict):
+                    continue
+                evidence[name]['evidence'].extend(info.get('evidence') or [])
+                evidence[name]['missing'].extend(info.get('missing') or [])
+                if info.get('score_hint') is not None:
+                    evidence[name]['score_hints'].append(info['score_hint'])
+            strengths.extend(result.get('strengths') or [])
+            issues.extend(result.get('issues') or [])
+
+        digest = json.dumps({'dimensions': evidence, 'strengths': strengths, 'issues': issues},
+                            ensure_ascii=False, indent=1)
+        report_content = (f"(此報告篇幅較長, 已分為 {len(map_results)} 段分別整理證據。"
+                          f"以下為各段整理的證據彙總, 請據此對整份報告評分; "
+                          f"某段缺少的內容若在其他段出現, 則不應視為缺少)\n\n{digest}")
+        return self.create_report_prompt(report_content, has_images)
+
+    def _map_reduce_chunks(self, report_content: str) -> List[str]:
+        chunks = split_report_sections(report_content, self.chunk_chars)
+        print(f"✓ 長篇報告分段分析: {len(report_content)} 字元, 分為 {len(chunks)} 段")
+        return chunks
+
+    def _analyze_map_reduce(self, report_content: str, images: List[ImageRecord] = None) -> Dict:
+        """長篇報告的 map-reduce 分析
+
+        map: 各段落並行整理各維度的證據 (不含圖片);
+        reduce: 依證據彙總 (與圖片) 產生與單次分析相同格式的評分結果。
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        chunks = self._map_reduce_chunks(report_content)
+        if not chunks:
+            # 沒有文字 (例如無文字層的掃描 PDF) 時改以單次請求分析
+            print("⚠️  報告沒有文字內容, 改以單次請求分析")
+            return self._dispatch(self.create_report_prompt(report_content, bool(images)), images,
+                                  system=self.create_system_prompt(), schema=self.result_schema)
+        workers = min(len(chunks), self._request_concurrency())
+
+        def map_chunk(index: int, chunk: str) -> Optional[Dict]:
+            try:
+                return self._dispatch(self._build_map_prompt(chunk, index, len(chunks)))
+            except Exception as e:
+                print(f"⚠️  第 {index}/{len(chunks)} 段證據整理失敗: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # 複製 context, 讓各執行緒的請求記錄到同一份報告的指標
+            futures = [pool.submit(contextvars.copy_context().run, map_chunk, index, chunk)
+                       for index, chunk in enumerate(chunks, 1)]
+            map_results = [future.result() for future in futures]
+
+        map_results = [r for r in map_results if r is not None]
+        if not map_results:
+            raise RuntimeError("所有段落的證據整理都失敗")
+
+        return self._dispatch(self._build_reduce_prompt(map_results, bool(images)), images,
+                              system=self.create_system_prompt(), schema=self.result_schema)
+
+    async def _aanalyze_map_reduce(self, report_content: str, images: List[ImageRecord] = None) -> Dict:
+        """長篇報告的 map-reduce 分析 (非同步, 見 _analyze_map_reduce)"""
+        import asyncio
+
+        chunks = self._map_reduce_chunks(report_content)
+        if not chunks:
+            print("⚠️  報告沒有文字內容, 改以單次請求分析")
+            return await self._adispatch(self.create_report_prompt(report_content, bool(images)), images,
+                                         system=self.create_system_prompt(), schema=self.result_schema)
+
+        async def map_chunk(index: int, chunk: str) -> Optional[Dict]:
+            try:
+                return await self._adispatch(self._build_map_prompt(chunk, index, len(chunks)))
+            except Exception as e:
+                print(f"⚠️  第 {index}/{len(chunks)} 段證據整理失敗: {e}")
+                return None
+
+        map_results = await asyncio.gather(*(map_chunk(index, chunk)
+                                             for index, chunk in enumerate(chunks, 1)))
+        map_results = [r for r in map_results if r is not None]
+        if not map_results:
+            raise RuntimeError("所有段落的證據整理都失敗")
+
+        return await self._adispatch(self._build_reduce_prompt(map_results, bool(images)), images,
+                                     system=self.create_system_prompt(), schema=self.result_schema)
+
+    def _build_dimension_prompt(self, name: str, report_content: str, has_images: bool) -> str:
+        """建立單一評估維度評分的提示詞 ('per-dimension' 模式)"""
+        weight = self.dimensions[name]
+        criteria = "\n".join(f"- {item}" for item in DIMENSION_CRITERIA.get(name, []))
+        image_note = ""
+        if has_images:
+            image_note = "\n【注意】此報告包含圖片,請一併檢查圖片的清晰度、標註及是否支持分析結論。\n"
+        return f"""請只針對「{name}」這一個維度評估這份 Failure Analysis Report,不需要評估其他維度。
+{image_note}
+【{name}】(滿分 {weight} 分)
+{criteria or '- 依此維度的名稱自行判斷評估重點'}
+
+請以 JSON 格式回傳評估結果,格式如下:
+
+{{"score": <0-{weight} 的分數>, "percentage": <百分比數字>, "comment": "<評語>"}}
+
+重要格式要求:
+1. 你的回應必須是純 JSON 格式,不要包含任何其他文字、markdown 標記或程式碼區塊符號
+2. score 與 percentage 必須是純數字, percentage 為 score 佔滿分 {weight} 分的百分比 (0-100)
+3. 評語請簡潔具體, 不超過 100 字
+4. 使用台灣繁體中文回答
+
+【FA 報告內容】
+{report_content}
+"""
+
+    def _build_summary_prompt(self, report_content: str, has_images: bool) -> str:
+        """建立優點、改善建議與總評的提示詞 ('per-dimension' 模式, 不含評分)"""
+        image_note = "\n【注意】此報告包含圖片,請一併參考圖片內容。\n" if has_images else ""
+        return f"""請閱讀這份 Failure Analysis Report,整理其優點、待改進項目與總評,不需要評分。
+{image_note}
+【參考評估維度】
+{self._format_dimension_rubric()}
+
+請以 JSON 格式回傳,格式如下:
+
+{{
+  "strengths": [
+    "<具體優點1>",
+    "<具體優點2>",
+    "<具體優點3>"
+  ],
+  "improvements": [
+    {{"priority": "高", "item": "<待改進項目>", "suggestion": "<具體改善建議>"}},
+    {{"priority": "中", "item": "<待改進項目>", "suggestion": "<具體改善建議>"}}
+  ],
+  "summary": "<總評與建議>"
+}}
+
+重要格式要求:
+1. 你的回應必須是純 JSON 格式,不要包含任何其他文字、markdown 標記或程式碼區塊符號
+2. 使用台灣繁體中文回答
+
+【FA 報告內容】
+{report_content}
+"""
+
+    def _per_dimension_requests(self, report_content: str,
+                                images: List[ImageRecord] = None) -> List[Tuple[str, str, Optional[List[ImageRecord]]]]:
+        """列出 'per-dimension' 模式的所有請求: (名稱, 提示詞, 圖片)
+
+        名稱為評估維度名稱, 最後一項為 None 代表總評請求。
+        """
+        requests = []
+        for name in self.dimensions:
+            dim_images = images if images and name in IMAGE_DIMENSIONS else None
+            requests.append((name, self._build_dimension_prompt(name, report_content, bool(dim_images)),
+                             dim_images))
+        requests.append((None, self._build_summary_prompt(report_content, bool(images)), images))
+        return requests
+
+    def _assemble_per_dimension_result(self, responses: Dict[Optional[str], Dict]) -> Dict:
+        """將各維度與總評的回應組合為與單次分析相同格式的結果"""
+        dimension_scores = {}
+        for name, weight in self.dimensions.items():
+            data = responses.get(name) or {}
+            try:
+                score = float(data.get('score', 0))
+            except (TypeError, ValueError):
+                score = 0.0
+            score = min(max(score, 0.0), float(weight))
+            dimension_scores[name] = {
+                'score': round(score, 2),
+                'percentage': round(score / weight * 100, 2) if weight else 0,
+                'comment': data.get('comment', ''),
+            }
+
+        total_score = round(sum(d['score'] for d in dimension_scores.values()), 1)
+        grade, _ = self.calculate_grade(round(total_score))
+        summary = responses.get(None) or {}
+        return {
+            'total_score': total_score,
+            'grade': grade,
+            'dimension_scores': dimension_scores,
+            'strengths': summary.get('strengths', []),
+            'improvements': summary.get('improvements', []),
+            'summary': summary.get('summary', ''),
+        }
+
+    def _analyze_per_dimension(self, report_content: str, images: List[ImageRecord] = None) -> Dict:
+        """各評估維度與總評各自送出一個較短的請求並同時執行, 再組合結果
+
+        每個請求的輸出遠短於單次分析, 同時進行的請求數受 _request_concurrency 限制;
+        總分由各維度分數加總, 等級由 calculate_grade 計算。
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        requests = self._per_dimension_requests(report_content, images)
+        print(f"✓ 分維度並行評分: 共 {len(requests)} 個請求")
+
+        # 與 map-reduce 相同, 同時進行的請求數不超過後端的並行上限 (--concurrency)
+        with ThreadPoolExecutor(max_workers=min(len(requests), self._request_concurrency())) as pool:
+            futures = [(name, pool.submit(contextvars.copy_context().run, self._dispatch, prompt, req_images,
+                                          schema=self._per_dimension_schema(name)))
+                       for name, prompt, req_images in requests]
+            responses = {name: future.result() for name, future in futures}
+
+        return self._assemble_per_dimension_result(responses)
+
+    async def _aanalyze_per_dimension(self, report_content: str, images: List[ImageRecord] = None) -> Dict:
+        """分維度並行評分 (非同步, 見 _analyze_per_dimension)"""
+        import asyncio
+
+        requests = self._per_dimension_requests(report_content, images)
+        print(f"✓ 分維度並行評分: 共 {len(requests)} 個請求")
 
+        results = await asyncio.gather(*(self._adispatch(prompt, req_images,
+                                                         schema=self._per_dimension_schema(name))
+                                         for name, prompt, req_images in requests))
+        return self._assemble_per_dimension_result(
+            {name: result for (name, _, _), result in zip(requests, results)})
+
+    def _estimate_request_tokens(self, prompt: str, images: List['ImageRecord'] = None) -> int:
+        """估算單次請求的 token 數 (供 tokens-per-minute 限制使用)
+
+        提示詞依 estimate_tokens 估算, 每張圖片約 1000 token, 再加上回應的 max_tokens。
+        """
+        return estimate_tokens(prompt, self.backend, self.model) + len(images or []) * 1000 + 4000
+
+    def _load_json(self, response_text: str, schema: Dict = None) -> Dict:
+        """清理並解析 JSON, 嚴格解析失敗時先以 repair_json 修復
+
+        Raises:
+            json.JSONDecodeError: 無法解析, 或結果不符合 schema (doc 為回應文字)
+        """
+        response_text = self._clean_json_response(response_text)
         try:
             result = json.loads(response_text)
-            return result
         except json.JSONDecodeError as e:
+            try:
+                result = json.loads(repair_json(response_text))
+            except json.JSONDecodeError:
+                raise e
+            print("⚠️  回應 JSON 格式有誤, 已自動修復")
+
+        if schema:
+            problems = schema_problems(result, schema)
+            if problems:
+                raise json.JSONDecodeError(f"不符合 schema: {'; '.join(problems[:5])}", response_text, 0)
+        return result
+
+    def _parse_json_result(self, response_text: str, label: str, schema: Dict = None) -> Dict:
+        """顯示原始回應, 清理並解析 JSON
+
+        Args:
+            response_text: 模型回應文本
+            label: 顯示用的後端名稱
+            schema: 驗證結果用的 JSON schema
+        """
+        response_text = response_text.strip()
+
+        print(f"=== {label} raw response ===")
+        print(response_text)
+        print("=== End raw response ===")
+
+        try:
+            return self._load_json(response_text, schema)
+        except json.JSONDecodeError as e:
+            response_text = e.doc
             print(f"\nJSON 解析錯誤: {e}")
             print(f"清理後的響應文本:")
             print(response_text)
@@ -689,48 +3984,189 @@ class FAReportAnalyzer:
                 print(f"...{response_text[start:end]}...")
                 print(f"    {' ' * (min(50, e.pos - start))}^")
             raise
-    
-    def _analyze_with_openai(self, prompt: str, images: List[Dict] = None) -> Dict:
-        """使用 OpenAI API 進行分析"""
-        messages = []
 
-        # 構建消息內容
-        content = []
-        content.append({
+    def _build_ollama_messages(self, prompt: str, images: List[ImageRecord] = None,
+                               system: str = None) -> List[Dict]:
+        """構建 Ollama 請求消息 (固定的 system 提示在前, Ollama 可重用相同前綴的 KV cache)"""
+        messages = [{'role': 'system', 'content': system}] if system else []
+        if images and len(images) > 0:
+            # 多模態消息
+            messages.append({
+                'role': 'user',
+                'content': prompt,
+                'images': [img.b64() for img in images[:IMAGE_LIMITS['ollama']]]
+            })
+            return messages
+        messages.append({
+            'role': 'user',
+            'content': prompt
+        })
+        return messages
+
+    def _ollama_request_kwargs(self, prompt: str, images: List[ImageRecord] = None,
+                               system: str = None) -> Dict:
+        """Ollama 請求的 keep_alive 與依提示詞長度計算的 num_ctx / num_predict
+
+        Ollama 預設的 num_ctx 會靜默截斷過長的報告; 這裡以提示詞、圖片 (每張約 1000 token)
+        與回應預留量估算所需的 context, 以 2 的次方向上取整, 且在同一分析器中只增不減。
+        """
+        prompt_tokens = (estimate_tokens(system or '', self.backend, self.model)
+                         + estimate_tokens(prompt, self.backend, self.model)
+                         + min(len(images or []), IMAGE_LIMITS['ollama']) * 1000)
+        if self.ollama_num_ctx:
+            num_ctx = self.ollama_num_ctx
+        else:
+            num_ctx = OLLAMA_MIN_CTX
+            while num_ctx < prompt_tokens + OLLAMA_NUM_PREDICT and num_ctx < self.ollama_max_ctx:
+                num_ctx *= 2
+            num_ctx = min(max(num_ctx, self._ollama_ctx), self.ollama_max_ctx)
+            if num_ctx > self._ollama_ctx:
+                print(f"✓ Ollama num_ctx 調整為 {num_ctx} (提示詞約 {prompt_tokens} token)")
+                self._ollama_ctx = num_ctx
+
+        num_predict = min(OLLAMA_NUM_PREDICT, num_ctx - prompt_tokens)
+        if num_predict < OLLAMA_NUM_PREDICT // 4:
+            print(f"⚠️  提示詞約 {prompt_tokens} token, 接近 num_ctx {num_ctx}, Ollama 可能截斷報告內容;"
+                  f" 建議使用 --mode mapreduce 或 --token-budget")
+            num_predict = OLLAMA_NUM_PREDICT // 4
+        return {
+            'options': {'num_ctx': num_ctx, 'num_predict': num_predict},
+            'keep_alive': self.ollama_keep_alive,
+        }
+
+    def _record_ollama_timings(self, response):
+        """記錄 Ollama 回應的模型載入、提示詞處理與生成耗時 (回應中的單位為奈秒)"""
+        timings = {stage: (self._usage_field(response, field) or 0) / 1e9
+                   for stage, field in OLLAMA_TIMING_FIELDS.items()}
+        for stage, seconds in timings.items():
+            _metric_time(stage, seconds)
+        self.last_ollama_timings = timings
+
+        eval_count = self._usage_field(response, 'eval_count') or 0
+        rate = f", {eval_count / timings['ollama_eval']:.1f} token/s" if timings['ollama_eval'] else ""
+        print(f"✓ Ollama 耗時: 載入 {timings['ollama_load']:.2f} 秒, "
+              f"提示詞處理 {timings['ollama_prompt_eval']:.2f} 秒, 生成 {timings['ollama_eval']:.2f} 秒{rate}")
+        if timings['ollama_load'] >= 1:
+            print("⚠️  Ollama 重新載入了模型, 可延長 --ollama-keep-alive 或以 --ollama-num-ctx 固定 context 大小")
+
+    def _analyze_with_ollama(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                             schema: Dict = None) -> Dict:
+        """使用 Ollama 進行分析"""
+        if self.stream:
+            response_text = self._run_stream(self._stream_ollama(prompt, images, system, schema), "Ollama")
+            return self._parse_json_result(response_text, "Ollama", schema)
+
+        response = self.client.chat(
+            model=self.model,
+            messages=self._build_ollama_messages(prompt, images, system),
+            **self._ollama_request_kwargs(prompt, images, system),
+            **self._structured_output_kwargs(schema)
+        )
+        self._record_usage(self._ollama_usage(response))
+        self._record_ollama_timings(response)
+        return self._parse_json_result(response['message']['content'], "Ollama", schema)
+
+    async def _aanalyze_with_ollama(self, prompt: str, images: List[ImageRecord] = None,
+                                    system: str = None, schema: Dict = None) -> Dict:
+        """使用 Ollama 進行分析 (非同步)"""
+        if self.stream:
+            response_text = await self._arun_stream(self._astream_ollama(prompt, images, system, schema),
+                                                    "Ollama")
+            return self._parse_json_result(response_text, "Ollama", schema)
+
+        response = await self._get_async_client().chat(
+            model=self.model,
+            messages=self._build_ollama_messages(prompt, images, system),
+            **self._ollama_request_kwargs(prompt, images, system),
+            **self._structured_output_kwargs(schema)
+        )
+        self._record_usage(self._ollama_usage(response))
+        self._record_ollama_timings(response)
+        return self._parse_json_result(response['message']['content'], "Ollama", schema)
+
+    def _build_openai_messages(self, prompt: str, images: List[ImageRecord] = None,
+                               system: str = None) -> List[Dict]:
+        """構建 OpenAI 請求消息
+
+        固定的 system 提示放在最前面, 讓 OpenAI 的自動前綴快取 (1024 token 以上) 在
+        不同報告之間命中; 每份報告不同的文字與圖片放在後面。
+        """
+        content = [{
             "type": "text",
             "text": prompt
-        })
+        }]
 
         if images and len(images) > 0:
-            for img in images[:10]:  # 限制最多 10 張圖片
+            for img in images[:IMAGE_LIMITS['openai']]:
                 content.append({
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/{img['format']};base64,{img['data']}"
+                        "url": f"data:{img.mime};base64,{img.b64()}"
                     }
                 })
 
+        messages = [{"role": "system", "content": system}] if system else []
         messages.append({
             "role": "user",
             "content": content
         })
+        return messages
 
-        # 調用 OpenAI
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=4000
-            )
+    def _analyze_with_openai(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                             schema: Dict = None) -> Dict:
+        """使用 OpenAI API 進行分析"""
+        if self.stream:
+            response_text = self._run_stream(self._stream_openai(prompt, images, system, schema), "OpenAI")
+            return self._parse_openai_response(response_text, schema)
+
+        raw = self.client.chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=self._build_openai_messages(prompt, images, system),
+            max_tokens=4000,
+            **self._structured_output_kwargs(schema)
+        )
+        self.scheduler.update_from_headers(raw.headers)
+        response = raw.parse()
+        self._record_usage(self._openai_usage(response.usage))
+        message = response.choices[0].message
+        return self._parse_openai_response(message.content or "", schema, getattr(message, 'refusal', None))
+
+    async def _aanalyze_with_openai(self, prompt: str, images: List[ImageRecord] = None,
+                                    system: str = None, schema: Dict = None) -> Dict:
+        """使用 OpenAI API 進行分析 (非同步)"""
+        if self.stream:
+            response_text = await self._arun_stream(self._astream_openai(prompt, images, system, schema),
+                                                    "OpenAI")
+            return self._parse_openai_response(response_text, schema)
+
+        raw = await self._get_async_client().chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=self._build_openai_messages(prompt, images, system),
+            max_tokens=4000,
+            **self._structured_output_kwargs(schema)
+        )
+        self.scheduler.update_from_headers(raw.headers)
+        response = raw.parse()
+        self._record_usage(self._openai_usage(response.usage))
+        message = response.choices[0].message
+        return self._parse_openai_response(message.content or "", schema, getattr(message, 'refusal', None))
 
-            response_text = response.choices[0].message.content.strip()
+    def _parse_openai_response(self, response_text: str, schema: Dict = None, refusal: str = None) -> Dict:
+        """檢查 OpenAI 回應是否被拒絕, 並解析 JSON
 
+        Args:
+            response_text: 模型回應文本
+            schema: 驗證結果用的 JSON schema
+            refusal: 結構化輸出模式下 API 回傳的拒絕訊息
+        """
+        response_text = response_text.strip()
+        try:
             print("=== OpenAI raw response ===")
-            print(response_text)
+            print(refusal or response_text)
             print("=== End raw response ===")
 
             # 檢查是否被拒絕
-            if "I'm sorry" in response_text or "I cannot" in response_text or "I can't" in response_text:
+            if refusal or "I'm sorry" in response_text or "I cannot" in response_text or "I can't" in response_text:
                 print("\n" + "=" * 80)
                 print("⚠️  OpenAI 內容審核拒絕了此請求")
                 print("=" * 80)
@@ -748,13 +4184,10 @@ class FAReportAnalyzer:
                 print("=" * 80 + "\n")
                 raise ValueError("OpenAI API 拒絕處理此請求,請嘗試其他後端或純文字分析")
 
-            # 清理並解析 JSON
-            response_text = self._clean_json_response(response_text)
-
-            result = json.loads(response_text)
-            return result
+            return self._load_json(response_text, schema)
 
         except json.JSONDecodeError as e:
+            response_text = e.doc
             print("\n" + "=" * 80)
             print("⚠️  OpenAI 返回了無效的 JSON 格式")
             print("=" * 80)
@@ -773,62 +4206,367 @@ class FAReportAnalyzer:
             print("\n建議: 嘗試使用其他後端 (ollama 或 anthropic)")
             print("=" * 80 + "\n")
             raise
-    
-    def _analyze_with_anthropic(self, prompt: str, images: List[Dict] = None) -> Dict:
-        """使用 Anthropic Claude 進行分析"""
-        content = []
-        
+
+    def _build_anthropic_request(self, prompt: str, images: List[ImageRecord] = None,
+                                 system: str = None, schema: Dict = None) -> Dict:
+        """構建 Anthropic 請求參數
+
+        固定的 system 提示 (評分標準) 設定 cache_control 快取斷點, 後續請求直接讀取
+        快取的前綴; 報告文字在圖片之前, 讓每份報告的內容依序接在快取前綴之後。
+        指定 schema 時以強制的工具呼叫取得結構化結果。
+        """
+        request = {
+            'model': self.model,
+            'max_tokens': 4000,
+            'messages': [
+                {"role": "user", "content": self._build_anthropic_content(prompt, images)}
+            ],
+        }
+        if system:
+            request['system'] = [{
+                "type": "text",
+                "text": system,
+                "cache_control": {"type": "ephemeral"}
+            }]
+        request.update(self._structured_output_kwargs(schema))
+        return request
+
+    @staticmethod
+    def _anthropic_message_text(message) -> str:
+        """取出 Anthropic 回應的結果文字 (工具呼叫的輸入轉為 JSON 字串)"""
+        texts = []
+        for block in message.content:
+            if block.type == 'tool_use':
+                return json.dumps(block.input, ensure_ascii=False)
+            if block.type == 'text':
+                texts.append(block.text)
+        return "".join(texts)
+
+    def _build_anthropic_content(self, prompt: str, images: List[ImageRecord] = None) -> List[Dict]:
+        """構建 Anthropic 請求內容 (文字在前, 圖片在後)"""
+        # 添加文字提示
+        content = [{
+            "type": "text",
+            "text": prompt
+        }]
+
         # 添加圖片
         if images and len(images) > 0:
-            for img in images[:20]:  # Claude 支持較多圖片
+            for img in images[:IMAGE_LIMITS['anthropic']]:
                 content.append({
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": f"image/{img['format']}",
-                        "data": img['data']
+                        "media_type": img.mime,
+                        "data": img.b64()
                     }
                 })
-        
-        # 添加文字提示
-        content.append({
-            "type": "text",
-            "text": prompt
-        })
-        
-        # 調用 Claude
-        message = self.client.messages.create(
+        return content
+
+    def _analyze_with_anthropic(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                                schema: Dict = None) -> Dict:
+        """使用 Anthropic Claude 進行分析"""
+        if self.stream:
+            response_text = self._run_stream(self._stream_anthropic(prompt, images, system, schema),
+                                             "Anthropic Claude")
+            return self._parse_json_result(response_text, "Anthropic Claude", schema)
+
+        raw = self.client.messages.with_raw_response.create(
+            **self._build_anthropic_request(prompt, images, system, schema))
+        self.scheduler.update_from_headers(raw.headers)
+        message = raw.parse()
+        self._record_usage(self._anthropic_usage(message.usage))
+        return self._parse_json_result(self._anthropic_message_text(message), "Anthropic Claude", schema)
+
+    async def _aanalyze_with_anthropic(self, prompt: str, images: List[ImageRecord] = None,
+                                       system: str = None, schema: Dict = None) -> Dict:
+        """使用 Anthropic Claude 進行分析 (非同步)"""
+        if self.stream:
+            response_text = await self._arun_stream(self._astream_anthropic(prompt, images, system, schema),
+                                                    "Anthropic Claude")
+            return self._parse_json_result(response_text, "Anthropic Claude", schema)
+
+        raw = await self._get_async_client().messages.with_raw_response.create(
+            **self._build_anthropic_request(prompt, images, system, schema))
+        self.scheduler.update_from_headers(raw.headers)
+        message = await raw.parse()
+        self._record_usage(self._anthropic_usage(message.usage))
+        return self._parse_json_result(self._anthropic_message_text(message), "Anthropic Claude", schema)
+
+    @staticmethod
+    def _usage_field(obj, name: str):
+        if obj is None:
+            return None
+        if isinstance(obj, dict):
+            return obj.get(name)
+        return getattr(obj, name, None)
+
+    @classmethod
+    def _ollama_usage(cls, response) -> Dict:
+        """Ollama 回應的 token 用量 (Ollama 不回報前綴快取命中數)"""
+        return {
+            'input_tokens': cls._usage_field(response, 'prompt_eval_count') or 0,
+            'output_tokens': cls._usage_field(response, 'eval_count') or 0,
+        }
+
+    @classmethod
+    def _openai_usage(cls, usage) -> Dict:
+        """OpenAI 回應的 token 用量 (prompt_tokens 已包含快取命中的 cached_tokens)"""
+        details = cls._usage_field(usage, 'prompt_tokens_details')
+        return {
+            'input_tokens': cls._usage_field(usage, 'prompt_tokens') or 0,
+            'output_tokens': cls._usage_field(usage, 'completion_tokens') or 0,
+            'cached_tokens': cls._usage_field(details, 'cached_tokens') or 0,
+        }
+
+    @classmethod
+    def _anthropic_usage(cls, usage) -> Dict:
+        """Anthropic 回應的 token 用量
+
+        Anthropic 的 input_tokens 不含快取讀取與寫入的部分, 此處合計為總輸入 token。
+        """
+        cached = cls._usage_field(usage, 'cache_read_input_tokens') or 0
+        written = cls._usage_field(usage, 'cache_creation_input_tokens') or 0
+        return {
+            'input_tokens': (cls._usage_field(usage, 'input_tokens') or 0) + cached + written,
+            'output_tokens': cls._usage_field(usage, 'output_tokens') or 0,
+            'cached_tokens': cached,
+            'cache_write_tokens': written,
+        }
+
+    def _record_usage(self, usage: Dict):
+        """記錄單次請求的 token 用量 (last_usage) 並累計至 usage_totals"""
+        self.last_usage = usage
+        if self.usage is not None:
+            self.usage.record(usage)
+        _metric_count('requests')
+        _metric_count('prompt_tokens', usage.get('input_tokens') or 0)
+        _metric_count('completion_tokens', usage.get('output_tokens') or 0)
+        _metric_count('cached_tokens', usage.get('cached_tokens') or 0)
+
+    @property
+    def usage_totals(self) -> Dict:
+        """此分析器累計的 token 用量與提示詞快取命中"""
+        return self.usage.snapshot() if self.usage is not None else {}
+
+    def _run_stream(self, deltas, label: str) -> str:
+        """消耗串流回應, 物件結束時提前停止生成, 偵測到拒絕時立即中止
+
+        Args:
+            deltas: 逐段產生文字的生成器 (關閉時會中止對後端的請求)
+            label: 顯示用的後端名稱
+
+        Returns:
+            回應文字 (完整 JSON 物件或目前收到的全部內容)
+        """
+        import time
+
+        scanner = _JSONStreamScanner()
+        start = time.perf_counter()
+        first_token = None
+        try:
+            for delta in deltas:
+                if not delta:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                scanner.feed(delta)
+                if scanner.refused or scanner.complete:
+                    break
+        finally:
+            deltas.close()
+        return self._finish_stream(scanner, label, start, first_token)
+
+    async def _arun_stream(self, deltas, label: str) -> str:
+        """消耗非同步串流回應 (見 _run_stream)"""
+        import time
+
+        scanner = _JSONStreamScanner()
+        start = time.perf_counter()
+        first_token = None
+        try:
+            async for delta in deltas:
+                if not delta:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                scanner.feed(delta)
+                if scanner.refused or scanner.complete:
+                    break
+        finally:
+            await deltas.aclose()
+        return self._finish_stream(scanner, label, start, first_token)
+
+    def _finish_stream(self, scanner: _JSONStreamScanner, label: str,
+                       start: float, first_token: Optional[float]) -> str:
+        """記錄串流統計, 拒絕時拋出錯誤"""
+        import time
+
+        elapsed = time.perf_counter() - start
+        self.last_stream_stats = {
+            'time_to_first_token': round(first_token, 3) if first_token is not None else None,
+            'elapsed': round(elapsed, 3),
+            'chars': scanner.length,
+            'early_stop': scanner.complete,
+            'refused': scanner.refused,
+        }
+        _metric_time('first_token', first_token)
+        _metric_count('early_stops', int(scanner.complete))
+        ttft = f"{first_token:.2f}" if first_token is not None else "-"
+        print(f"✓ {label} 串流: 首個 token {ttft} 秒, 總計 {elapsed:.2f} 秒, "
+              f"{scanner.length} 字元{' (JSON 已完整, 提前結束生成)' if scanner.complete else ''}")
+
+        if scanner.refused:
+            print(f"⚠️  {label} 在回應開頭即拒絕此請求, 已中止生成: {scanner.text[:80]!r}")
+            raise ValueError(f"{label} 拒絕處理此請求,請嘗試其他後端或純文字分析")
+        if not scanner.text.strip():
+            # 空回應沒有可修正的內容, 不送出格式修正請求
+            raise ValueError(f"{label} 串流回應沒有任何內容, 請確認模型與伺服器狀態")
+        return scanner.json_text or scanner.text
+
+    def _stream_ollama(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                       schema: Dict = None):
+        """Ollama 串流回應 (逐段產生文字)"""
+        stream = self.client.chat(
+            model=self.model,
+            messages=self._build_ollama_messages(prompt, images, system),
+            stream=True,
+            **self._ollama_request_kwargs(prompt, images, system),
+            **self._structured_output_kwargs(schema)
+        )
+        try:
+            for chunk in stream:
+                if chunk.get('done'):
+                    self._record_usage(self._ollama_usage(chunk))
+                    self._record_ollama_timings(chunk)
+                yield chunk['message']['content']
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+
+    async def _astream_ollama(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                              schema: Dict = None):
+        """Ollama 串流回應 (非同步)"""
+        stream = await self._get_async_client().chat(
+            model=self.model,
+            messages=self._build_ollama_messages(prompt, images, system),
+            stream=True,
+            **self._ollama_request_kwargs(prompt, images, system),
+            **self._structured_output_kwargs(schema)
+        )
+        try:
+            async for chunk in stream:
+                if chunk.get('done'):
+                    self._record_usage(self._ollama_usage(chunk))
+                    self._record_ollama_timings(chunk)
+                yield chunk['message']['content']
+        finally:
+            aclose = getattr(stream, 'aclose', None)
+            if aclose:
+                await aclose()
+
+    def _stream_openai(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                       schema: Dict = None):
+        """OpenAI 串流回應 (逐段產生文字)
+
+        token 用量在最後一個區塊回傳, 提前結束生成時不會記錄。
+        """
+        stream = self.client.chat.completions.create(
             model=self.model,
+            messages=self._build_openai_messages(prompt, images, system),
             max_tokens=4000,
-            messages=[
-                {"role": "user", "content": content}
-            ]
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._structured_output_kwargs(schema)
         )
-        
-        response_text = message.content[0].text.strip()
+        try:
+            for chunk in stream:
+                if chunk.usage:
+                    self._record_usage(self._openai_usage(chunk.usage))
+                if chunk.choices:
+                    yield self._openai_delta_text(chunk.choices[0].delta)
+        finally:
+            stream.close()
 
-        print("=== Anthropic Claude raw response ===")
-        print(response_text)
-        print("=== End raw response ===")
+    async def _astream_openai(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                              schema: Dict = None):
+        """OpenAI 串流回應 (非同步)"""
+        stream = await self._get_async_client().chat.completions.create(
+            model=self.model,
+            messages=self._build_openai_messages(prompt, images, system),
+            max_tokens=4000,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._structured_output_kwargs(schema)
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    self._record_usage(self._openai_usage(chunk.usage))
+                if chunk.choices:
+                    yield self._openai_delta_text(chunk.choices[0].delta)
+        finally:
+            await stream.close()
 
-        # 清理並解析 JSON
-        response_text = self._clean_json_response(response_text)
+    @staticmethod
+    def _openai_delta_text(delta) -> Optional[str]:
+        """串流區塊的文字; 結構化輸出模式下的拒絕訊息直接中止請求"""
+        refusal = getattr(delta, 'refusal', None)
+        if refusal:
+            print(f"⚠️  OpenAI 拒絕此請求: {refusal}")
+            raise ValueError("OpenAI API 拒絕處理此請求,請嘗試其他後端或純文字分析")
+        return delta.content
+
+    @staticmethod
+    def _anthropic_event_text(event) -> Optional[str]:
+        """Anthropic 串流事件的文字 (一般文字或工具呼叫輸入的 JSON 片段)"""
+        if event.type != 'content_block_delta':
+            return None
+        if event.delta.type == 'text_delta':
+            return event.delta.text
+        if event.delta.type == 'input_json_delta':
+            return event.delta.partial_json
+        return None
+
+    def _stream_anthropic(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                          schema: Dict = None):
+        """Anthropic 串流回應 (逐段產生文字)
+
+        輸入 token 與快取命中在串流開頭 (message_start) 即已回報, 提前結束時仍會記錄。
+        """
+        with self.client.messages.stream(**self._build_anthropic_request(prompt, images, system, schema)) as stream:
+            try:
+                for event in stream:
+                    yield self._anthropic_event_text(event)
+            finally:
+                self._record_stream_usage(stream)
+
+    async def _astream_anthropic(self, prompt: str, images: List[ImageRecord] = None, system: str = None,
+                                 schema: Dict = None):
+        """Anthropic 串流回應 (非同步)"""
+        async with self._get_async_client().messages.stream(
+                **self._build_anthropic_request(prompt, images, system, schema)) as stream:
+            try:
+                async for event in stream:
+                    yield self._anthropic_event_text(event)
+            finally:
+                self._record_stream_usage(stream)
 
+    def _record_stream_usage(self, stream):
+        """記錄 Anthropic 串流目前為止的 token 用量"""
         try:
-            result = json.loads(response_text)
-            return result
-        except json.JSONDecodeError as e:
-            print(f"\nJSON 解析錯誤: {e}")
-            print(f"清理後的響應文本:")
-            print(response_text)
-            print(f"\n錯誤位置附近的內容:")
-            if e.pos < len(response_text):
-                start = max(0, e.pos - 50)
-                end = min(len(response_text), e.pos + 50)
-                print(f"...{response_text[start:end]}...")
-                print(f"    {' ' * (min(50, e.pos - start))}^")
-            raise
-    
+            usage = stream.current_message_snapshot.usage
+        except Exception:
+            return
+        self._record_usage(self._anthropic_usage(usage))
+
+
+    def _get_async_client(self):
+        """取得目前事件迴圈共用的非同步客戶端"""
+        return get_async_client(self.backend, self.base_url, self.api_key,
+                                self.pool_size, self.timeout)
+
     def calculate_grade(self, total_score: float) -> Tuple[str, str]:
         """計算等級"""
         for grade, (min_score, max_score, description) in self.grade_criteria.items():
@@ -872,6 +4610,8 @@ class FAReportAnalyzer:
                 '評語': dim_info['comment']
             })
         
+        import pandas as pd
+
         df = pd.DataFrame(dimension_data)
         report.append(df.to_string(index=False))
         report.append("")
@@ -909,7 +4649,56 @@ class FAReportAnalyzer:
         return report_text
     
     def analyze_report(self, input_file: str, output_file: str = None) -> Dict:
-        """完整的報告分析流程"""
+        """完整的報告分析流程 (各階段耗時與計數記錄於 last_metrics)"""
+        with self._report_metrics(input_file):
+            result = self._analyze_report(input_file, output_file)
+        stages = self.last_metrics['stages']
+        print("✓ 各階段耗時: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stages.items()))
+        return result
+
+    def _report_metrics(self, source: str, read_metrics: Dict = None):
+        """在區塊中收集一份報告的指標, 結束時保存於 last_metrics 並輸出至 metrics
+
+        Args:
+            source: 報告文件路徑
+            read_metrics: 在其他行程或執行緒中讀取報告時的指標 (見 _read_with_metrics)
+        """
+        from contextlib import contextmanager
+
+        @contextmanager
+        def collect():
+            import time
+
+            metrics = ReportMetrics(source)
+            if read_metrics:
+                metrics.merge(read_metrics)
+            token = _CURRENT_METRICS.set(metrics)
+            start = time.perf_counter()
+            status = 'error'
+            try:
+                yield metrics
+                status = 'ok'
+            finally:
+                _CURRENT_METRICS.reset(token)
+                elapsed = time.perf_counter() - start
+                if read_metrics:
+                    elapsed += (read_metrics.get('stages') or {}).get('read', 0.0)
+                record = {
+                    'timestamp': datetime.now().isoformat(timespec='seconds'),
+                    'source': source,
+                    'backend': self.backend,
+                    'model': self.model,
+                    'status': status,
+                    'elapsed': round(elapsed, 4),
+                    **metrics.to_dict(),
+                }
+                self.last_metrics = record
+                if self.metrics:
+                    self.metrics.emit(record)
+
+        return collect()
+
+    def _analyze_report(self, input_file: str, output_file: str = None) -> Dict:
         import os
 
         print("=" * 80)
@@ -919,15 +4708,21 @@ class FAReportAnalyzer:
         try:
             # 1. 讀取報告
             print(f"\n[1/3] 讀取報告文件: {input_file}")
-            report_content, images = self.read_report(input_file)
+            report_content, images = self._read_report_for_analysis(input_file)
             print(f"✓ 成功讀取報告 ({len(report_content)} 字元)")
             if images:
                 print(f"✓ 提取到 {len(images)} 張圖片")
 
             # 2. AI 分析
             print(f"\n[2/3] 使用 {self.backend.upper()} 進行深度分析...")
-            analysis_result = self.analyze_with_ai(report_content, images)
+            usage_start = self.usage_totals
+            with _metric_stage('analyze'):
+                analysis_result = self.analyze_with_ai(report_content, images)
             print("✓ 分析完成")
+            usage = _UsageCounter.diff(self.usage_totals, usage_start)
+            if usage['requests']:
+                print(f"✓ Token 用量: 輸入 {usage['input_tokens']} (快取命中 {usage['cached_tokens']}), "
+                      f"輸出 {usage['output_tokens']}")
 
             # 3. 生成報告
             print("\n[3/3] 生成評估報告...")
@@ -947,7 +4742,8 @@ class FAReportAnalyzer:
             # 獲取來源文件名
             source_filename = os.path.basename(input_file)
 
-            report_text = self.generate_report(analysis_result, output_file, source_filename)
+            with _metric_stage('write'):
+                report_text = self.generate_report(analysis_result, output_file, source_filename)
 
             print("\n" + "=" * 80)
             print("分析完成!")
@@ -961,6 +4757,678 @@ class FAReportAnalyzer:
                 print("\n[清理] 移除臨時轉換文件...")
                 self._cleanup_temp_files()
 
+    def _analyze_batch_item(self, input_file: Path, report_content: str,
+                            images: List[ImageRecord], output_file: str,
+                            read_metrics: Dict = None) -> Dict:
+        """批次模式中單一報告的 AI 分析與報告輸出 (在執行緒池中執行)"""
+        with self._report_metrics(str(input_file), read_metrics):
+            with _metric_stage('analyze'):
+                analysis_result = self.analyze_with_ai(report_content, images)
+            with _metric_stage('write'):
+                self.generate_report(analysis_result, output_file, input_file.name)
+        return analysis_result
+
+    @staticmethod
+    def _batch_output_files(files: List[Path], output_dir: str) -> Dict[Path, str]:
+        """決定每份報告的輸出文件名 (同名文件加上序號避免覆蓋)"""
+        import os
+
+        output_files = {}
+        used_names = set()
+        for index, path in enumerate(files, 1):
+            name = f"{path.stem}_evaluation.txt"
+            if name in used_names:
+                name = f"{path.stem}_{index}_evaluation.txt"
+            used_names.add(name)
+            output_files[path] = os.path.join(output_dir, name)
+        return output_files
+
+    @staticmethod
+    def _batch_item(path: Path, output_file: str, elapsed: float, done: int, total: int,
+                    result: Dict = None, error: Exception = None) -> Dict:
+        """整理單一報告的批次結果並顯示進度"""
+        item = {
+            'file': str(path),
+            'output': output_file if result is not None else None,
+            'status': 'ok' if result is not None else 'error',
+            'elapsed': round(elapsed, 2),
+        }
+        if result is not None:
+            item['total_score'] = float(result['total_score'])
+            item['grade'] = result['grade']
+            print(f"  ✓ [{done}/{total}] {path.name} - "
+                  f"分數: {item['total_score']:.1f}, 等級: {item['grade']}")
+        else:
+            item['error'] = str(error)
+            print(f"  ✗ [{done}/{total}] {path.name} - 錯誤: {error}")
+        return item
+
+    def _write_batch_summary(self, files: List[Path], items: List[Dict],
+                             output_dir: str, elapsed: float, usage: Dict = None) -> Dict:
+        """依輸入順序整理結果並輸出批次摘要 batch_summary.json"""
+        import os
+
+        order = {str(path): index for index, path in enumerate(files)}
+        items.sort(key=lambda item: order[item['file']])
+        scores = [item['total_score'] for item in items if item['status'] == 'ok']
+        summary = {
+            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'backend': self.backend,
+            'model': self.model,
+            'total': len(files),
+            'succeeded': len(scores),
+            'failed': len(files) - len(scores),
+            'elapsed': round(elapsed, 2),
+            'average_score': round(sum(scores) / len(scores), 2) if scores else None,
+            'max_score': max(scores) if scores else None,
+            'min_score': min(scores) if scores else None,
+            'usage': usage,
+            'results': items,
+        }
+
+        summary_file = os.path.join(output_dir, "batch_summary.json")
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        print("\n" + "=" * 80)
+        print(f"批次分析完成! 成功 {summary['succeeded']} / {summary['total']}, "
+              f"耗時 {summary['elapsed']:.1f} 秒")
+        if usage and usage['requests']:
+            print(f"Token 用量: 輸入 {usage['input_tokens']} (快取命中 {usage['cached_tokens']}, "
+                  f"{usage['cache_hit_rate'] * 100:.1f}%), 輸出 {usage['output_tokens']}")
+        print(f"✓ 批次摘要已保存至: {summary_file}")
+        print("=" * 80)
+
+        return summary
+
+    def analyze_batch(self,
+                      input_files: List[str],
+                      output_dir: str = "evaluation_results",
+                      concurrency: int = None,
+                      parse_workers: int = None,
+                      use_async: bool = False) -> Dict:
+        """批次分析多份報告
+
+        文件解析在行程池中進行, LLM 請求在有上限的執行緒池中進行,
+        兩者重疊執行; 每份報告輸出一個評估文件, 最後輸出批次摘要。
+
+        Args:
+            input_files: 報告文件路徑列表 (可用 collect_batch_inputs 產生)
+            output_dir: 輸出資料夾
+            concurrency: 同時進行的 LLM 請求數 (預設: 分析器的 concurrency 設定)
+            parse_workers: 解析文件的行程數 (預設: CPU 核心數)
+            use_async: 改用 asyncio 與非同步客戶端執行 LLM 請求 (見 aanalyze_batch)
+
+        Returns:
+            批次摘要字典
+        """
+        import os
+        import time
+        from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                        wait, FIRST_COMPLETED)
+
+        if use_async:
+            import asyncio
+            return asyncio.run(self.aanalyze_batch(input_files, output_dir,
+                                                   concurrency, parse_workers))
+
+        files = [Path(f) for f in input_files]
+        concurrency = concurrency or self._request_concurrency()
+        parse_workers = parse_workers or min(os.cpu_count() or 1, max(len(files), 1))
+        os.makedirs(output_dir, exist_ok=True)
+
+        print("=" * 80)
+        print("FA 報告分析工具 v2.0 - 批次模式")
+        print("=" * 80)
+        print(f"報告數量: {len(files)}, 解析行程: {parse_workers}, "
+              f"{self.backend.upper()} 並行請求: {concurrency}")
+
+        output_files = self._batch_output_files(files, output_dir)
+        items = []
+        started = {}
+        batch_start = time.perf_counter()
+        usage_start = self.usage_totals
+        self._preconvert_legacy_files(files)
+
+        def record(path: Path, result: Dict = None, error: Exception = None):
+            items.append(self._batch_item(path, output_files[path],
+                                          time.perf_counter() - started[path],
+                                          len(items) + 1, len(files), result, error))
+
+        # 限制已解析但尚未送出分析的報告數量, 避免大量報告內容同時佔用記憶體
+        window = parse_workers + concurrency
+        pending = iter(files)
+
+        with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool, \
+                ThreadPoolExecutor(max_workers=concurrency) as llm_pool:
+            parse_futures = {}
+            llm_futures = {}
+
+            def fill_window():
+                while len(parse_futures) + len(llm_futures) < window:
+                    path = next(pending, None)
+                    if path is None:
+                        return
+                    started[path] = time.perf_counter()
+                    future = parse_pool.submit(_read_report_task, self, str(path))
+                    parse_futures[future] = path
+
+            fill_window()
+            while parse_futures or llm_futures:
+                done, _ = wait(list(parse_futures) + list(llm_futures),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in parse_futures:
+                        path = parse_futures.pop(future)
+                        try:
+                            report_content, images, read_metrics = future.result()
+                        except Exception as e:
+                            record(path, error=e)
+                            continue
+                        self._start_ollama_warmup(report_content, images)
+                        llm_future = llm_pool.submit(self._analyze_batch_item, path,
+                                                     report_content, images,
+                                                     output_files[path], read_metrics)
+                        llm_futures[llm_future] = path
+                    else:
+                        path = llm_futures.pop(future)
+                        try:
+                            record(path, result=future.result())
+                        except Exception as e:
+                            record(path, error=e)
+                fill_window()
+
+        self.conversion_cache.release()
+        return self._write_batch_summary(files, items, output_dir,
+                                         time.perf_counter() - batch_start,
+                                         _UsageCounter.diff(self.usage_totals, usage_start))
+
+    async def aanalyze_batch(self,
+                             input_files: List[str],
+                             output_dir: str = "evaluation_results",
+                             concurrency: int = None,
+                             parse_workers: int = None) -> Dict:
+        """批次分析多份報告 (asyncio 版本)
+
+        所有 LLM 請求在同一個事件迴圈中以非同步客戶端送出, 同時進行的請求數由
+        後端共用的 semaphore 限制; 文件解析仍在行程池中進行。
+        輸出與 analyze_batch 相同。
+
+        Args:
+            input_files: 報告文件路徑列表
+            output_dir: 輸出資料夾
+            concurrency: 同時進行的 LLM 請求數 (預設: 分析器的 concurrency 設定)
+            parse_workers: 解析文件的行程數 (預設: CPU 核心數)
+
+        Returns:
+            批次摘要字典
+        """
+        import asyncio
+        import os
+        import time
+        from concurrent.futures import ProcessPoolExecutor
+
+        files = [Path(f) for f in input_files]
+        concurrency = concurrency or self._request_concurrency()
+        parse_workers = parse_workers or min(os.cpu_count() or 1, max(len(files), 1))
+        set_async_concurrency(self.backend, concurrency)
+        os.makedirs(output_dir, exist_ok=True)
+
+        print("=" * 80)
+        print("FA 報告分析工具 v2.0 - 批次模式 (asyncio)")
+        print("=" * 80)
+        print(f"報告數量: {len(files)}, 解析行程: {parse_workers}, "
+              f"{self.backend.upper()} 並行請求: {concurrency}")
+
+        output_files = self._batch_output_files(files, output_dir)
+        items = []
+        batch_start = time.perf_counter()
+        usage_start = self.usage_totals
+        loop = asyncio.get_running_loop()
+        await asyncio.to_thread(self._preconvert_legacy_files, files)
+        # 限制同時處理中的報告數量, 避免大量報告內容同時佔用記憶體
+        window = asyncio.Semaphore(parse_workers + concurrency)
+
+        async def process(path: Path, parse_pool: ProcessPoolExecutor):
+            async with window:
+                started = time.perf_counter()
+                try:
+                    report_content, images, read_metrics = await loop.run_in_executor(
+                        parse_pool, _read_report_task, self, str(path))
+                    self._start_ollama_warmup(report_content, images)
+                    with self._report_metrics(str(path), read_metrics):
+                        with _metric_stage('analyze'):
+                            result = await self.aanalyze_with_ai(report_content, images)
+                        with _metric_stage('write'):
+                            await asyncio.to_thread(self.generate_report, result,
+                                                    output_files[path], path.name)
+                except Exception as e:
+                    result, error = None, e
+                else:
+                    error = None
+                items.append(self._batch_item(path, output_files[path],
+                                              time.perf_counter() - started,
+                                              len(items) + 1, len(files), result, error))
+
+        try:
+            with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+                await asyncio.gather(*(process(path, parse_pool) for path in files))
+        finally:
+            # 非同步連線綁定在此事件迴圈, 需在迴圈結束前關閉
+            await aclose_async_clients()
+
+        self.conversion_cache.release()
+        return self._write_batch_summary(files, items, output_dir,
+                                         time.perf_counter() - batch_start,
+                                         _UsageCounter.diff(self.usage_totals, usage_start))
+
+    def analyze_queue(self,
+                      input_files: List[str],
+                      queue_file: str,
+                      output_dir: str = "evaluation_results",
+                      concurrency: int = None,
+                      max_attempts: int = 3,
+                      lease_seconds: float = 3600,
+                      retry_delay: float = 30) -> Dict:
+        """以持久化工作佇列 (JobQueue) 批次分析多份報告
+
+        輸入的報告加入佇列後, 由 concurrency 個執行緒依序領取工作並執行
+        讀取、分析與輸出; 每份報告完成後立即寫入佇列。中斷後以相同的佇列重新執行,
+        已完成的報告直接略過; 失敗的報告在退避時間後重新領取, 直到達到 max_attempts。
+        同一台主機上的多個行程可同時對同一個佇列執行此方法,
+        共同處理佇列中的所有工作 (SQLite WAL 不支援網路檔案系統, 佇列文件不可放在
+        多台機器共用的網路資料夾)。
+
+        Args:
+            input_files: 報告文件路徑列表
+            queue_file: SQLite 佇列文件路徑
+            output_dir: 輸出資料夾
+            concurrency: 此行程同時處理的報告數 (預設: 分析器的 concurrency 設定)
+            max_attempts: 每份報告最多嘗試次數
+            lease_seconds: 工作租約秒數, 超過仍未完成的工作可被其他行程重新領取
+            retry_delay: 第一次失敗後的重試等待秒數, 之後每次失敗加倍
+
+        Returns:
+            批次摘要字典 (涵蓋本次輸入的所有報告, 包含其他行程完成的部分)
+        """
+        import os
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        files = [Path(f) for f in input_files]
+        concurrency = concurrency or self._request_concurrency()
+        os.makedirs(output_dir, exist_ok=True)
+        queue = JobQueue(queue_file, lease_seconds=lease_seconds, max_attempts=max_attempts,
+                         retry_delay=retry_delay)
+
+        print("=" * 80)
+        print("FA 報告分析工具 v2.0 - 批次模式 (工作佇列)")
+        print("=" * 80)
+        added = queue.enqueue(self._batch_output_files(files, output_dir))
+        recovered = queue.recover()
+        counts = queue.counts()
+        print(f"佇列: {queue_file}, 新增 {added} 筆, 恢復中斷 {recovered} 筆, "
+              f"待處理 {counts.get('pending', 0)}, 已完成 {counts.get('done', 0)}, "
+              f"失敗 {counts.get('failed', 0)}, {self.backend.upper()} 並行請求: {concurrency}")
+
+        batch_start = time.perf_counter()
+        usage_start = self.usage_totals
+        processed = []
+
+        def work():
+            worker = JobQueue.worker_id()
+            while True:
+                job = queue.claim(worker)
+                if job is None:
+                    # 沒有可領取的工作時, 等待尚在退避中的失敗工作
+                    retry_at = queue.next_retry()
+                    if retry_at is None:
+                        return
+                    time.sleep(min(max(retry_at - time.time(), 0.1), 60))
+                    continue
+                path = Path(job['path'])
+                started = time.perf_counter()
+                try:
+                    report_content, images, read_metrics = self._read_with_metrics(str(path))
+                    self._start_ollama_warmup(report_content, images)
+                    result = self._analyze_batch_item(path, report_content, images, job['output'],
+                                                      read_metrics)
+                except Exception as e:
+                    queue.fail(job['id'], e, time.perf_counter() - started)
+                    delay = min(retry_delay * 2 ** (job['attempts'] - 1), JobQueue.MAX_RETRY_DELAY)
+                    retry = f" (第 {job['attempts']}/{max_attempts} 次, {delay:g} 秒後重試)" \
+                        if job['attempts'] < max_attempts else ""
+                    print(f"  ✗ {path.name} - 錯誤: {e}{retry}")
+                else:
+                    queue.complete(job['id'], result, time.perf_counter() - started)
+                    print(f"  ✓ {path.name} - 分數: {float(result['total_score']):.1f}, "
+                          f"等級: {result['grade']}")
+                processed.append(path)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(work) for _ in range(concurrency)]:
+                future.result()
+        if self.temp_files:
+            self._cleanup_temp_files()
+        print(f"此行程處理 {len(processed)} 筆工作")
+
+        by_path = {str(f.resolve()): f for f in files}
+        items = []
+        for job in queue.jobs(files):
+            path = by_path[job['path']]
+            if job['status'] == 'done':
+                item = {'file': str(path), 'output': job['output'], 'status': 'ok',
+                        'elapsed': round(job['elapsed'] or 0, 2),
+                        'total_score': float(job['result']['total_score']),
+                        'grade': job['result']['grade']}
+            else:
+                item = {'file': str(path), 'output': None, 'status': 'error',
+                        'elapsed': round(job['elapsed'] or 0, 2),
+                        'error': job['error'] or f"尚未完成 ({job['status']})"}
+            item['attempts'] = job['attempts']
+            items.append(item)
+
+        return self._write_batch_summary(files, items, output_dir,
+                                         time.perf_counter() - batch_start,
+                                         _UsageCounter.diff(self.usage_totals, usage_start))
+
+    def analyze_provider_batch(self,
+                               input_files: List[str],
+                               output_dir: str = "evaluation_results",
+                               state_file: str = None,
+                               poll_interval: float = 60,
+                               parse_workers: int = None) -> Dict:
+        """使用 OpenAI / Anthropic 的 Batch API 離線分析多份報告
+
+        將所有報告的請求寫成 JSONL 後一次提交, 定期查詢批次狀態, 完成後逐筆以
+        _load_json 解析並輸出評估報告。適合不需要即時結果的大量重新評分
+        (費用約為一般請求的一半, 通常在 24 小時內完成)。
+
+        批次編號、輸入文件的雜湊值與每筆請求對應的報告記錄在狀態文件中; 中斷後以相同
+        參數重新執行, 會繼續查詢原本的批次而不會重新提交。狀態文件中的批次已完成時
+        建立新的批次; 未完成但輸入文件不同時拋出錯誤。
+
+        Args:
+            input_files: 報告文件路徑列表
+            output_dir: 輸出資料夾 (請求 JSONL 與狀態文件也存放於此)
+            state_file: 狀態文件路徑 (預設: output_dir/provider_batch_state.json)
+            poll_interval: 查詢批次狀態的間隔秒數
+            parse_workers: 解析文件的行程數 (預設: CPU 核心數)
+
+        Returns:
+            批次摘要字典
+        """
+        import os
+        import time
+
+        if self.backend not in ('openai', 'anthropic'):
+            raise ValueError(f"Batch API 模式僅支援 openai / anthropic 後端, 目前為: {self.backend}")
+        if self.analysis_mode != 'single':
+            raise ValueError("Batch API 模式僅支援 single 分析模式")
+
+        os.makedirs(output_dir, exist_ok=True)
+        state_file = state_file or os.path.join(output_dir, "provider_batch_state.json")
+
+        print("=" * 80)
+        print("FA 報告分析工具 v2.0 - Batch API 模式")
+        print("=" * 80)
+
+        files = [Path(f) for f in input_files]
+        inputs = self._provider_batch_inputs(files)
+        state = None
+        if os.path.exists(state_file):
+            with open(state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('status') == 'done':
+                print(f"✓ 狀態文件 {state_file} 中的批次已完成, 建立新的批次")
+                state = None
+            elif state['backend'] != self.backend or state['model'] != self.model:
+                raise ValueError(f"狀態文件 {state_file} 屬於 {state['backend']}/{state['model']}, "
+                                 f"請改用其他 --batch-state 或刪除此文件")
+            elif state.get('inputs') != inputs:
+                raise ValueError(f"狀態文件 {state_file} 中未完成的批次與目前的輸入文件不同 "
+                                 f"(文件清單或內容已變更), 請改用其他 --batch-state 或等待該批次完成")
+            else:
+                print(f"✓ 從狀態文件繼續: {state_file} (批次: {state.get('batch_id') or '尚未提交'})")
+        if state is None:
+            state = self._build_provider_batch(files, output_dir, parse_workers)
+            state['inputs'] = inputs
+            self._save_provider_batch_state(state, state_file)
+
+        usage_start = self.usage_totals
+        items = list(state['items'])
+        if state['requests']:
+            if not state.get('batch_id'):
+                state['batch_id'] = self._submit_provider_batch(state['requests_file'])
+                state['submitted_at'] = time.time()
+                self._save_provider_batch_state(state, state_file)
+                print(f"✓ 已提交批次: {state['batch_id']} ({len(state['requests'])} 筆請求)")
+
+            try:
+                while True:
+                    status, ended, counts = self._poll_provider_batch(state['batch_id'])
+                    print(f"  批次 {state['batch_id']}: {status} {counts}")
+                    if ended:
+                        break
+                    time.sleep(poll_interval)
+            except KeyboardInterrupt:
+                print(f"\n⚠️  已中斷查詢, 批次仍在處理中; 以相同參數重新執行即可繼續 (狀態文件: {state_file})")
+                raise
+
+            items.extend(self._collect_provider_batch(state))
+            state['status'] = 'done'
+            self._save_provider_batch_state(state, state_file)
+
+        files = [Path(f) for f in state['files']]
+        return self._write_batch_summary(files, items, output_dir,
+                                         time.time() - state['created_at'],
+                                         _UsageCounter.diff(self.usage_totals, usage_start))
+
+    @staticmethod
+    def _provider_batch_inputs(files: List[Path]) -> List[List[str]]:
+        """輸入文件的路徑與內容雜湊值 (依路徑排序), 用於判斷狀態文件是否屬於同一批輸入"""
+        inputs = []
+        for path in sorted(str(f.resolve()) for f in files):
+            try:
+                digest = JobQueue.file_hash(Path(path))
+            except OSError:
+                digest = None
+            inputs.append([path, digest])
+        return inputs
+
+    @staticmethod
+    def _save_provider_batch_state(state: Dict, state_file: str):
+        import os
+
+        tmp_file = f"{state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, state_file)
+
+    def _build_provider_batch(self, files: List[Path], output_dir: str, parse_workers: int = None) -> Dict:
+        """解析所有報告並寫出 Batch API 的請求 JSONL
+
+        命中分析快取的報告直接輸出評估報告, 不加入批次。
+        """
+        import os
+        import time
+        from concurrent.futures import ProcessPoolExecutor
+
+        parse_workers = parse_workers or min(os.cpu_count() or 1, max(len(files), 1))
+        output_files = self._batch_output_files(files, output_dir)
+        requests_file = os.path.join(output_dir, "provider_batch_requests.jsonl")
+        state = {
+            'backend': self.backend,
+            'model': self.model,
+            'created_at': time.time(),
+            'files': [str(path) for path in files],
+            'requests_file': requests_file,
+            'batch_id': None,
+            'status': 'pending',
+            'requests': {},
+            'items': [],
+        }
+
+        print(f"報告數量: {len(files)}, 解析行程: {parse_workers}")
+        system = self.create_system_prompt()
+        with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool, \
+                open(requests_file, 'w', encoding='utf-8') as f:
+            futures = [(path, parse_pool.submit(_read_report_task, self, str(path))) for path in files]
+            for index, (path, future) in enumerate(futures, 1):
+                started = time.perf_counter()
+                try:
+                    report_content, images, _ = future.result()
+                    report_content, prompt, images, cache_key, cached = \
+                        self._prepare_analysis(report_content, images)
+                    if cached is not None:
+                        self.generate_report(cached, output_files[path], path.name)
+                        state['items'].append(self._batch_item(path, output_files[path],
+                                                               time.perf_counter() - started,
+                                                               index, len(files), cached))
+                        continue
+                except Exception as e:
+                    state['items'].append(self._batch_item(path, output_files[path],
+                                                           time.perf_counter() - started,
+                                                           index, len(files), error=e))
+                    continue
+
+                custom_id = f"report-{index:05d}"
+                f.write(json.dumps(self._provider_batch_request(custom_id, prompt, images, system),
+                                   ensure_ascii=False) + "\n")
+                state['requests'][custom_id] = {
+                    'file': str(path),
+                    'output': output_files[path],
+                    'cache_key': cache_key,
+                }
+
+        print(f"✓ 已寫出 {len(state['requests'])} 筆請求: {requests_file}")
+        return state
+
+    def _provider_batch_request(self, custom_id: str, prompt: str,
+                                images: List[ImageRecord], system: str) -> Dict:
+        """單筆 Batch API 請求 (與一般請求使用相同的訊息格式)"""
+        if self.backend == 'openai':
+            return {
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': self.model,
+                    'messages': self._build_openai_messages(prompt, images, system),
+                    'max_tokens': 4000,
+                    **self._structured_output_kwargs(self.result_schema),
+                },
+            }
+        return {
+            'custom_id': custom_id,
+            'params': self._build_anthropic_request(prompt, images, system, self.result_schema),
+        }
+
+    def _submit_provider_batch(self, requests_file: str) -> str:
+        """提交請求 JSONL, 返回批次編號"""
+        if self.backend == 'openai':
+            with open(requests_file, 'rb') as f:
+                uploaded = self.client.files.create(file=f, purpose='batch')
+            batch = self.client.batches.create(input_file_id=uploaded.id,
+                                               endpoint='/v1/chat/completions',
+                                               completion_window='24h')
+            return batch.id
+
+        with open(requests_file, 'r', encoding='utf-8') as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        return self.client.messages.batches.create(requests=requests).id
+
+    def _poll_provider_batch(self, batch_id: str) -> Tuple[str, bool, Dict]:
+        """查詢批次狀態, 返回 (狀態, 是否已結束, 各狀態筆數)"""
+        if self.backend == 'openai':
+            batch = self.client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            counts = {'completed': counts.completed, 'failed': counts.failed,
+                      'total': counts.total} if counts else {}
+            return batch.status, batch.status in ('completed', 'failed', 'expired', 'cancelled'), counts
+
+        batch = self.client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        counts = {'processing': counts.processing, 'succeeded': counts.succeeded,
+                  'errored': counts.errored}
+        return batch.processing_status, batch.processing_status == 'ended', counts
+
+    def _iter_provider_batch_results(self, batch_id: str):
+        """逐筆產生批次結果: (custom_id, 回應文字, token 用量, 錯誤訊息)"""
+        if self.backend == 'openai':
+            batch = self.client.batches.retrieve(batch_id)
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                for line in self.client.files.content(file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    response = entry.get('response') or {}
+                    body = response.get('body') or {}
+                    if entry.get('error') or response.get('status_code') != 200:
+                        error = entry.get('error') or body.get('error') or f"HTTP {response.get('status_code')}"
+                        yield entry['custom_id'], None, None, str(error)
+                        continue
+                    message = body['choices'][0]['message']
+                    if message.get('refusal'):
+                        yield entry['custom_id'], None, None, f"OpenAI 拒絕此請求: {message['refusal']}"
+                        continue
+                    yield (entry['custom_id'], message.get('content') or "",
+                           self._openai_usage(body.get('usage')), None)
+            return
+
+        for entry in self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type == 'succeeded':
+                yield (entry.custom_id, self._anthropic_message_text(result.message),
+                       self._anthropic_usage(result.message.usage), None)
+            else:
+                error = getattr(getattr(result, 'error', None), 'error', None)
+                yield entry.custom_id, None, None, f"{result.type}: {error}" if error else result.type
+
+    def _collect_provider_batch(self, state: Dict) -> List[Dict]:
+        """取回批次結果, 解析 JSON 並輸出每份報告的評估文件"""
+        import time
+
+        requests = state['requests']
+        elapsed = time.time() - state.get('submitted_at', state['created_at'])
+        total = len(state['files'])
+        done = len(state['items'])
+        items = []
+        seen = set()
+
+        for custom_id, text, usage, error in self._iter_provider_batch_results(state['batch_id']):
+            request = requests.get(custom_id)
+            if request is None or custom_id in seen:
+                continue
+            seen.add(custom_id)
+            path = Path(request['file'])
+            result = None
+            if usage:
+                self._record_usage(usage)
+            if text is not None:
+                try:
+                    try:
+                        result = self._load_json(text, self.result_schema)
+                    except json.JSONDecodeError as e:
+                        # 只以即時請求修正這筆回應的格式, 不重新分析
+                        result = self._fix_json(e, self.result_schema)
+                    self.generate_report(result, request['output'], path.name)
+                    if request.get('cache_key'):
+                        self._cache_result(request['cache_key'], result)
+                except Exception as e:
+                    result, error = None, f"回應解析失敗: {e}"
+            done += 1
+            items.append(self._batch_item(path, request['output'], elapsed, done, total, result, error))
+
+        for custom_id, request in requests.items():
+            if custom_id not in seen:
+                done += 1
+                items.append(self._batch_item(Path(request['file']), request['output'], elapsed,
+                                              done, total, error="批次結果中沒有此請求"))
+        return items
+
 
 def main():
     """主程式"""
@@ -985,13 +5453,47 @@ def main():
   
   # 分析包含圖片的報告
   python fa_report_analyzer_v2.py -i report_with_images.pdf -o evaluation.txt
+
+  # 批次分析資料夾中的所有報告
+  python fa_report_analyzer_v2.py --batch reports/ --output-dir results/
+
+  # 批次分析 (glob 樣式與清單文件)
+  python fa_report_analyzer_v2.py --batch "reports/**/*.pdf" --manifest list.txt
+
+  # 使用 OpenAI Batch API 離線重新評分 (中斷後以相同指令繼續)
+  python fa_report_analyzer_v2.py --batch reports/ -b openai -k YOUR_API_KEY --provider-batch
         """
     )
     
-    parser.add_argument('-i', '--input', required=True,
+    # -i 與批次輸入 (--batch、--manifest) 擇一; --batch 與 --manifest 可同時使用 (於解析後檢查)
+    parser.add_argument('-i', '--input',
                         help='輸入的 FA 報告文件路徑')
+    parser.add_argument('--batch', nargs='+', metavar='PATH',
+                        help='批次模式: 資料夾、glob 樣式或文件路徑 (可與 --manifest 合併使用)')
+    parser.add_argument('--manifest',
+                        help='批次模式: 清單文件 (每行一個報告路徑, 可與 --batch 合併使用)')
     parser.add_argument('-o', '--output',
                         help='輸出的評估報告文件路徑 (預設: 自動生成)')
+    parser.add_argument('--output-dir', default='evaluation_results',
+                        help='批次模式的輸出資料夾 (預設: evaluation_results)')
+    parser.add_argument('--concurrency', type=int,
+                        help='同時進行的 LLM 請求數 (批次模式的報告數、map-reduce 的分段數; 預設: 依後端自動選擇)')
+    parser.add_argument('--parse-workers', type=int,
+                        help='批次模式解析文件的行程數 (預設: CPU 核心數)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='批次模式改用 asyncio 與非同步客戶端送出 LLM 請求')
+    parser.add_argument('--queue', metavar='DB',
+                        help='批次模式使用 SQLite 工作佇列, 中斷後重新執行會略過已完成的報告, 可由同一主機的多個行程共用')
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='工作佇列中每份報告最多嘗試次數 (預設: 3)')
+    parser.add_argument('--retry-delay', type=float, default=30,
+                        help='工作佇列中失敗報告的重試等待秒數, 每次失敗加倍 (預設: 30)')
+    parser.add_argument('--provider-batch', action='store_true',
+                        help='批次模式改用 OpenAI / Anthropic 的 Batch API 離線處理 (費用較低, 24 小時內完成)')
+    parser.add_argument('--batch-state',
+                        help='Batch API 模式的狀態文件, 中斷後重新執行可繼續 (預設: <output-dir>/provider_batch_state.json)')
+    parser.add_argument('--poll-interval', type=float, default=60,
+                        help='Batch API 模式查詢批次狀態的間隔秒數 (預設: 60)')
     parser.add_argument('-b', '--backend', default='ollama',
                         choices=['ollama', 'openai', 'anthropic'],
                         help='LLM 後端 (預設: ollama)')
@@ -1003,9 +5505,78 @@ def main():
                         help='API base URL (OpenAI 相容接口)')
     parser.add_argument('--skip-images', action='store_true',
                         help='跳過圖片分析,僅分析文字內容 (可避免 OpenAI 內容審核問題)')
+    parser.add_argument('--max-image-mb', type=float, default=DEFAULT_MAX_IMAGE_MB,
+                        help=f'每份報告保留的圖片原始資料上限 MB (預設: {DEFAULT_MAX_IMAGE_MB})')
+    parser.add_argument('--no-image-preprocess', action='store_true',
+                        help='送出原始圖片, 不縮小或重新壓縮')
+    parser.add_argument('--image-max-edge', type=int,
+                        help='圖片最長邊 px (預設: 依後端自動選擇)')
+    parser.add_argument('--image-quality', type=int, default=85,
+                        help='圖片重新壓縮品質 1-100 (預設: 85)')
+    parser.add_argument('--image-format', default='jpeg', choices=['jpeg', 'webp'],
+                        help='圖片重新壓縮格式 (預設: jpeg)')
+    parser.add_argument('--image-budget-mb', type=float,
+                        help='單次請求的圖片總量上限 MB (預設: 依後端自動選擇)')
+    parser.add_argument('--stream', action='store_true',
+                        help='使用串流回應: 顯示首個 token 時間, 偵測到拒絕或 JSON 完整時提前結束')
+    parser.add_argument('--max-retries', type=int, default=5,
+                        help='LLM 請求失敗 (429/5xx/連線錯誤) 時的最多重試次數 (預設: 5)')
+    parser.add_argument('--rpm', type=int,
+                        help='每分鐘請求數上限 (預設: 依伺服器 rate-limit 標頭)')
+    parser.add_argument('--tpm', type=int,
+                        help='每分鐘 token 數上限 (預設: 依伺服器 rate-limit 標頭)')
+    parser.add_argument('--pool-size', type=int, default=10,
+                        help='LLM 客戶端連線池大小 (預設: 10)')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='LLM 請求逾時秒數 (預設: 600)')
+    parser.add_argument('--mode', default='single', choices=ANALYSIS_MODES,
+                        help='分析模式: single 單次分析, mapreduce 長篇報告分段分析, per-dimension 各維度並行評分, auto 依長度自動選擇 (預設: single)')
+    parser.add_argument('--chunk-chars', type=int, default=12000,
+                        help='mapreduce 模式每段的最大字元數 (預設: 12000)')
+    parser.add_argument('--no-compact', action='store_true',
+                        help='不移除跨頁重複的頁首/頁尾、頁碼與多餘空白')
+    parser.add_argument('--token-budget', type=int,
+                        help='報告內容的 token 上限, 超過時省略中間內容 (預設: 不限制)')
+    parser.add_argument('--no-structured-output', action='store_true',
+                        help='不以 JSON schema 約束模型輸出 (用於不支援的 OpenAI 相容伺服器)')
+    parser.add_argument('--ollama-keep-alive', default=OLLAMA_KEEP_ALIVE,
+                        help=f'Ollama 模型在最後一次請求後的常駐時間, 例如 30m、2h, -1 表示不卸載 (預設: {OLLAMA_KEEP_ALIVE})')
+    parser.add_argument('--no-ollama-warmup', action='store_true',
+                        help='批次模式不預先載入 Ollama 模型')
+    parser.add_argument('--ollama-num-ctx', type=int,
+                        help='固定的 Ollama num_ctx (預設: 依提示詞長度自動調整)')
+    parser.add_argument('--ollama-max-ctx', type=int, default=OLLAMA_MAX_CTX,
+                        help=f'自動調整 Ollama num_ctx 的上限 (預設: {OLLAMA_MAX_CTX})')
+    parser.add_argument('--office-workers', type=int,
+                        help='批次模式並行轉換舊版 .ppt 的 LibreOffice 數量 (預設: CPU 核心數的一半, 最多 4)')
+    parser.add_argument('--conversion-cache-dir',
+                        help='轉換後 .pptx 的快取資料夾 (預設: ~/.cache/fa_report_analyzer/converted)')
+    parser.add_argument('--conversion-cache-mb', type=float, default=2048,
+                        help='轉換快取的容量上限 MB, 超過時淘汰最久未使用的文件 (預設: 2048)')
+    parser.add_argument('--metrics-log',
+                        help='將每份報告的各階段耗時、位元組、圖片、token 與重試次數寫入 JSON-lines 文件')
+    parser.add_argument('--metrics-prom',
+                        help='將累計指標寫入 Prometheus 文字格式文件 (node_exporter textfile collector)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='在此連接埠提供 Prometheus /metrics 端點')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='/metrics 端點綁定的位址 (預設: 127.0.0.1 只接受本機連線; 0.0.0.0 開放所有介面)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用分析結果快取')
+    parser.add_argument('--refresh', action='store_true',
+                        help='忽略既有快取並重新分析 (結果仍會寫入快取)')
+    parser.add_argument('--cache-dir',
+                        help='分析結果快取資料夾 (預設: ~/.cache/fa_report_analyzer/analysis)')
 
     args = parser.parse_args()
+    if bool(args.input) == bool(args.batch or args.manifest):
+        parser.error("請指定 -i/--input 或批次輸入 (--batch、--manifest) 其中之一")
+    # Ollama 的 keep_alive 接受時間字串或秒數 (負數表示不卸載)
+    keep_alive = args.ollama_keep_alive
+    if keep_alive.lstrip('-').isdigit():
+        keep_alive = int(keep_alive)
 
+    analyzer = None
     try:
         # 創建分析器
         analyzer = FAReportAnalyzer(
@@ -1013,9 +5584,80 @@ def main():
             model=args.model,
             api_key=args.api_key,
             base_url=args.base_url,
-            skip_images=args.skip_images
+            skip_images=args.skip_images,
+            use_cache=not args.no_cache,
+            refresh_cache=args.refresh,
+            cache_dir=args.cache_dir,
+            max_image_mb=args.max_image_mb,
+            preprocess_images=not args.no_image_preprocess,
+            image_max_edge=args.image_max_edge,
+            image_quality=args.image_quality,
+            image_format=args.image_format,
+            image_budget_mb=args.image_budget_mb,
+            stream=args.stream,
+            max_retries=args.max_retries,
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            pool_size=args.pool_size,
+            timeout=args.timeout,
+            concurrency=args.concurrency,
+            analysis_mode=args.mode,
+            chunk_chars=args.chunk_chars,
+            compact_prompt=not args.no_compact,
+            token_budget=args.token_budget,
+            structured_output=not args.no_structured_output,
+            metrics_log=args.metrics_log,
+            metrics_prom_file=args.metrics_prom,
+            metrics_port=args.metrics_port,
+            metrics_host=args.metrics_host,
+            ollama_keep_alive=keep_alive,
+            ollama_warmup=not args.no_ollama_warmup,
+            ollama_num_ctx=args.ollama_num_ctx,
+            ollama_max_ctx=args.ollama_max_ctx,
+            office_workers=args.office_workers,
+            conversion_cache_dir=args.conversion_cache_dir,
+            conversion_cache_mb=args.conversion_cache_mb
         )
         
+        # 批次模式
+        if args.batch or args.manifest:
+            input_files = collect_batch_inputs(args.batch, args.manifest)
+            if not input_files:
+                raise ValueError("找不到任何支援格式的報告文件")
+            if args.provider_batch:
+                summary = analyzer.analyze_provider_batch(
+                    input_files,
+                    output_dir=args.output_dir,
+                    state_file=args.batch_state,
+                    poll_interval=args.poll_interval,
+                    parse_workers=args.parse_workers
+                )
+                if summary['failed']:
+                    sys.exit(1)
+                return
+            if args.queue:
+                summary = analyzer.analyze_queue(
+                    input_files,
+                    queue_file=args.queue,
+                    output_dir=args.output_dir,
+                    concurrency=args.concurrency,
+                    max_attempts=args.max_attempts,
+                    retry_delay=args.retry_delay
+                )
+                if summary['failed']:
+                    sys.exit(1)
+                return
+            summary = analyzer.analyze_batch(
+                input_files,
+                output_dir=args.output_dir,
+                concurrency=args.concurrency,
+                parse_workers=args.parse_workers,
+                use_async=args.use_async
+            )
+            if summary['failed']:
+                sys.exit(1)
+            return
+
         # 執行分析
         result = analyzer.analyze_report(args.input, args.output)
         
@@ -1023,11 +5665,18 @@ def main():
         print(f"\n總分: {float(result['total_score']):.1f} 分")
         print(f"等級: {result['grade']}")
         
+    except KeyboardInterrupt:
+        sys.exit(130)
     except Exception as e:
         print(f"\n錯誤: {e}")
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        # 停止 /metrics 端點並關閉共用的客戶端連線 (sys.exit 也會經過此處)
+        if analyzer is not None and analyzer.metrics:
+            analyzer.metrics.close()
+        close_clients()
 
 
 if __name__ == "__main__":
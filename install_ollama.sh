@@ -134,17 +134,17 @@ python3 -m pip install ollama pandas Pillow PyPDF2 --break-system-packages -q
 echo "✓ 核心套件安裝完成"
 
 echo ""
-read -p "是否安裝完整功能 (PDF 圖片提取、Word、PowerPoint)? (y/n): " -n 1 -r
+read -p "是否安裝完整功能 (PDF 圖片提取)? (y/n): " -n 1 -r
 echo ""
 
 if [[ $REPLY =~ ^[Yy]$ ]]; then
     echo "正在安裝完整功能套件..."
-    python3 -m pip install PyMuPDF python-docx python-pptx --break-system-packages -q
+    python3 -m pip install PyMuPDF --break-system-packages -q
     echo "✓ 完整功能套件安裝完成"
 else
     echo "⚠️  跳過完整功能安裝"
     echo "如需完整功能，請執行:"
-    echo "  pip install PyMuPDF python-docx python-pptx --break-system-packages"
+    echo "  pip install PyMuPDF --break-system-packages"
 fi
 echo ""
 
@@ -0,0 +1,563 @@
+"""
+LLM API 模擬伺服器
+在本機模擬 OpenAI、Anthropic (含 Batch API) 與 Ollama 的 API, 用於離線測試 FA Report Analyzer
+
+回應內容依請求文字的雜湊值產生, 相同的請求永遠得到相同的評分結果。
+"stream": true 的請求以 SSE (OpenAI / Anthropic) 或 NDJSON (Ollama) 逐段回傳;
+--trailing-tokens 可在串流的 JSON 之後附加說明文字, 用於測量提前結束生成。
+
+支援的端點:
+    OpenAI:    POST /v1/chat/completions (含串流)
+               POST /v1/files, GET /v1/files/{id}, GET /v1/files/{id}/content
+               POST /v1/batches, GET /v1/batches/{id}
+    Anthropic: POST /v1/messages (含串流)
+               POST /v1/messages/batches, GET /v1/messages/batches/{id}
+               GET /v1/messages/batches/{id}/results
+    Ollama:    POST /api/chat (含串流), POST /api/generate (預先載入模型)
+
+使用方式:
+    python llm_stub_server.py --port 8765 --batch-delay 5
+
+    python fa_report_analyzer_v2.py --batch reports/ -b openai -k test \\
+        --base-url http://127.0.0.1:8765/v1 --provider-batch --poll-interval 2
+    python fa_report_analyzer_v2.py --batch reports/ -b anthropic -k test \\
+        --base-url http://127.0.0.1:8765 --provider-batch --poll-interval 2
+    python fa_report_analyzer_v2.py --batch reports/ -b ollama -m stub \\
+        --base-url http://127.0.0.1:8765 --stream
+"""
+
+import re
+import sys
+import json
+import time
+import uuid
+import email
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# 與 FAReportAnalyzer 預設相同的評估維度與權重
+DIMENSIONS = {
+    "基本資訊完整性": 15,
+    "問題描述與定義": 15,
+    "分析方法與流程": 20,
+    "數據與證據支持": 20,
+    "根因分析": 20,
+    "改善對策": 10,
+}
+
+GRADES = [(90, 'A'), (80, 'B'), (70, 'C'), (60, 'D'), (0, 'F')]
+
+# 串流回應每個區塊的字元數
+STREAM_CHUNK_CHARS = 16
+# 模擬 Ollama 載入模型所需的時間 (只回報, 不實際等待)
+OLLAMA_LOAD_SECONDS = 1.5
+
+
+def _seed(text: str, salt: str = '') -> int:
+    return int(hashlib.sha256(f"{salt}:{text}".encode('utf-8')).hexdigest()[:8], 16)
+
+
+def fake_analysis(prompt: str) -> dict:
+    """依提示詞內容產生固定的分析結果 (格式與真實模型的回應相同)"""
+    # 分維度評分請求
+    match = re.search(r'請只針對「(.+?)」', prompt)
+    if match:
+        weight = DIMENSIONS.get(match.group(1), 10)
+        percentage = 60 + _seed(prompt, match.group(1)) % 36
+        return {'score': round(weight * percentage / 100, 2), 'percentage': percentage,
+                'comment': f"{match.group(1)}的模擬評語"}
+
+    summary = {
+        'strengths': ["分析流程完整", "數據圖表清晰", "根因推導合理"],
+        'improvements': [
+            {'priority': '高', 'item': '對照樣本不足', 'suggestion': '增加良品對照組'},
+            {'priority': '中', 'item': '驗證計畫不明確', 'suggestion': '補充對策的驗證時程'},
+        ],
+        'summary': "模擬伺服器產生的總評",
+    }
+    # 分維度模式的總評請求
+    if '不需要評分' in prompt:
+        return summary
+
+    # map-reduce 的分段證據整理請求
+    if '整理與各評估維度相關的證據' in prompt:
+        return {
+            'dimensions': {name: {'evidence': [f"{name}的模擬證據"], 'missing': [],
+                                  'score_hint': 60 + _seed(prompt, name) % 36}
+                           for name in DIMENSIONS},
+            'strengths': summary['strengths'][:1],
+            'issues': [summary['improvements'][0]['item']],
+        }
+
+    dimension_scores = {}
+    for name, weight in DIMENSIONS.items():
+        percentage = 60 + _seed(prompt, name) % 36
+        dimension_scores[name] = {'score': round(weight * percentage / 100, 2),
+                                  'percentage': percentage, 'comment': f"{name}的模擬評語"}
+    total = round(sum(d['score'] for d in dimension_scores.values()), 1)
+    grade = next(g for threshold, g in GRADES if round(total) >= threshold)
+    return {'total_score': total, 'grade': grade, 'dimension_scores': dimension_scores, **summary}
+
+
+def _estimate_tokens(text: str) -> int:
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk) // 4
+
+
+class StubState:
+    """伺服器狀態: 上傳的文件、批次與已見過的 system 提示 (模擬提示詞快取)"""
+
+    def __init__(self, batch_delay: float, latency: float, tokens_per_second: float = None,
+                 trailing_tokens: int = 0):
+        self.batch_delay = batch_delay
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.trailing_tokens = trailing_tokens
+        self.lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+        self.seen_prefixes = set()
+        self.loaded_models = {}  # Ollama: 模型 -> 載入時的 num_ctx
+
+    def ollama_load(self, model: str, options: dict) -> float:
+        """模擬 Ollama 載入模型: 第一次使用或 num_ctx 改變時重新載入, 返回載入秒數"""
+        num_ctx = (options or {}).get('num_ctx')
+        with self.lock:
+            if model in self.loaded_models and self.loaded_models[model] == num_ctx:
+                return 0.0
+            self.loaded_models[model] = num_ctx
+        return OLLAMA_LOAD_SECONDS
+
+    def cached_tokens(self, system: str) -> int:
+        if not system:
+            return 0
+        with self.lock:
+            if system in self.seen_prefixes:
+                return _estimate_tokens(system)
+            self.seen_prefixes.add(system)
+        return 0
+
+
+def _text_of(content) -> str:
+    """取出訊息內容中的文字 (字串或內容區塊列表)"""
+    if isinstance(content, str):
+        return content
+    return "\n".join(block.get('text', '') for block in content or [] if isinstance(block, dict))
+
+
+def _trailing_text(state: StubState) -> str:
+    """串流時附加在 JSON 之後的說明文字 (模擬模型在結果之後繼續輸出)"""
+    return "\n\n以上為評估結果。" + "補充說明" * state.trailing_tokens if state.trailing_tokens else ""
+
+
+def _chunks(text: str):
+    return [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or ['']
+
+
+def ollama_chat(state: StubState, body: dict) -> dict:
+    messages = body.get('messages', [])
+    prompt = "\n".join(_text_of(m.get('content')) for m in messages)
+    text = json.dumps(fake_analysis(prompt), ensure_ascii=False)
+    load = state.ollama_load(body.get('model', 'stub'), body.get('options'))
+    prompt_tokens, output_tokens = _estimate_tokens(prompt), _estimate_tokens(text)
+    return {
+        'model': body.get('model', 'stub'),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'message': {'role': 'assistant', 'content': text},
+        'done': True,
+        'done_reason': 'stop',
+        'total_duration': int((load + prompt_tokens / 2000 + output_tokens / 50) * 1e9),
+        'load_duration': int(load * 1e9),
+        'prompt_eval_count': prompt_tokens,
+        'prompt_eval_duration': int(prompt_tokens / 2000 * 1e9),
+        'eval_count': output_tokens,
+        'eval_duration': int(output_tokens / (state.tokens_per_second or 50) * 1e9),
+    }
+
+
+def openai_completion(state: StubState, body: dict) -> dict:
+    messages = body.get('messages', [])
+    system = "\n".join(_text_of(m.get('content')) for m in messages if m.get('role') == 'system')
+    prompt = "\n".join(_text_of(m.get('content')) for m in messages)
+    text = json.dumps(fake_analysis(prompt), ensure_ascii=False)
+    prompt_tokens = _estimate_tokens(prompt)
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'stub'),
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                     'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': _estimate_tokens(text),
+                  'total_tokens': prompt_tokens + _estimate_tokens(text),
+                  'prompt_tokens_details': {'cached_tokens': state.cached_tokens(system)}},
+    }
+
+
+def anthropic_message(state: StubState, params: dict) -> dict:
+    system = _text_of(params.get('system'))
+    prompt = "\n".join([system] + [_text_of(m.get('content')) for m in params.get('messages', [])])
+    result = fake_analysis(prompt)
+    text = json.dumps(result, ensure_ascii=False)
+    cached = state.cached_tokens(system)
+    written = _estimate_tokens(system) if system and not cached else 0
+    # 指定 tool_choice 時以工具呼叫回傳結果 (結構化輸出)
+    tool_choice = params.get('tool_choice') or {}
+    if tool_choice.get('type') == 'tool':
+        content = [{'type': 'tool_use', 'id': f"toolu_{uuid.uuid4().hex[:12]}",
+                    'name': tool_choice['name'], 'input': result}]
+        stop_reason = 'tool_use'
+    else:
+        content = [{'type': 'text', 'text': text}]
+        stop_reason = 'end_turn'
+    return {
+        'id': f"msg_{uuid.uuid4().hex[:12]}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': params.get('model', 'stub'),
+        'content': content,
+        'stop_reason': stop_reason,
+        'stop_sequence': None,
+        'usage': {'input_tokens': _estimate_tokens(prompt) - cached - written,
+                  'output_tokens': _estimate_tokens(text),
+                  'cache_read_input_tokens': cached,
+                  'cache_creation_input_tokens': written},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---- 共用
+
+    def _send_json(self, data: dict, status: int = 200):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_bytes(self, data: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self):
+        self._send_json({'error': {'type': 'not_found_error', 'message': f"找不到: {self.path}"}}, 404)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _simulate_generation(self, output_tokens: int):
+        """依設定的生成速度模擬產生回應所需的時間"""
+        if self.state.tokens_per_second:
+            time.sleep(output_tokens / self.state.tokens_per_second)
+
+    def _stream_pieces(self, pieces, write) -> bool:
+        """逐段送出串流內容 (依生成速度等待), 客戶端提前中斷連線時返回 False"""
+        try:
+            for piece in pieces:
+                self._simulate_generation(_estimate_tokens(piece))
+                write(piece)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        return True
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        # 串流沒有 Content-Length, 以關閉連線表示結束
+        self.close_connection = True
+
+    def _sse(self, data: dict, event: str = None):
+        prefix = f"event: {event}\n" if event else ""
+        self.wfile.write(f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+    def _stream_openai(self, response: dict, include_usage: bool):
+        text = response['choices'][0]['message']['content'] + _trailing_text(self.state)
+        base = {'id': response['id'], 'object': 'chat.completion.chunk', 'created': response['created'],
+                'model': response['model']}
+
+        def chunk(delta: dict, finish_reason=None) -> dict:
+            return dict(base, choices=[{'index': 0, 'delta': delta, 'finish_reason': finish_reason}])
+
+        self._start_stream('text/event-stream')
+        self._sse(chunk({'role': 'assistant', 'content': ''}))
+        if not self._stream_pieces(_chunks(text), lambda piece: self._sse(chunk({'content': piece}))):
+            return
+        self._sse(chunk({}, 'stop'))
+        if include_usage:
+            self._sse(dict(base, choices=[], usage=response['usage']))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _stream_anthropic(self, message: dict):
+        block = message['content'][0]
+        usage = message['usage']
+        start = dict(message, content=[], stop_reason=None, usage=dict(usage, output_tokens=1))
+        self._start_stream('text/event-stream')
+        self._sse({'type': 'message_start', 'message': start}, 'message_start')
+        if block['type'] == 'tool_use':
+            text = json.dumps(block['input'], ensure_ascii=False)
+            self._sse({'type': 'content_block_start', 'index': 0,
+                       'content_block': dict(block, input={})}, 'content_block_start')
+            delta = lambda piece: {'type': 'input_json_delta', 'partial_json': piece}
+        else:
+            text = block['text'] + _trailing_text(self.state)
+            self._sse({'type': 'content_block_start', 'index': 0,
+                       'content_block': {'type': 'text', 'text': ''}}, 'content_block_start')
+            delta = lambda piece: {'type': 'text_delta', 'text': piece}
+        if not self._stream_pieces(_chunks(text), lambda piece: self._sse(
+                {'type': 'content_block_delta', 'index': 0, 'delta': delta(piece)}, 'content_block_delta')):
+            return
+        self._sse({'type': 'content_block_stop', 'index': 0}, 'content_block_stop')
+        self._sse({'type': 'message_delta',
+                   'delta': {'stop_reason': message['stop_reason'], 'stop_sequence': None},
+                   'usage': {'output_tokens': usage['output_tokens']}}, 'message_delta')
+        self._sse({'type': 'message_stop'}, 'message_stop')
+
+    def _stream_ollama(self, response: dict):
+        text = response['message']['content'] + _trailing_text(self.state)
+        base = {'model': response['model'], 'created_at': response['created_at']}
+
+        def write(piece: str):
+            line = dict(base, message={'role': 'assistant', 'content': piece}, done=False)
+            self.wfile.write((json.dumps(line, ensure_ascii=False) + "\n").encode('utf-8'))
+
+        self._start_stream('application/x-ndjson')
+        if not self._stream_pieces(_chunks(text), write):
+            return
+        final = dict(response, message={'role': 'assistant', 'content': ''})
+        self.wfile.write((json.dumps(final, ensure_ascii=False) + "\n").encode('utf-8'))
+
+    def _ollama_generate(self, data: dict):
+        """/api/generate: 空白提示詞只載入模型 (分析器的預先載入)"""
+        load = self.state.ollama_load(data.get('model', 'stub'), data.get('options'))
+        response = {'model': data.get('model', 'stub'),
+                    'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    'response': '', 'done': True, 'done_reason': 'load',
+                    'total_duration': int(load * 1e9), 'load_duration': int(load * 1e9)}
+        if data.get('stream', True):
+            self._start_stream('application/x-ndjson')
+            self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+            return
+        self._send_json(response)
+
+    def _batch_ready(self, batch: dict) -> bool:
+        return time.time() - batch['_created'] >= self.state.batch_delay
+
+    # ---- 路由
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        body = self._read_body()
+
+        if path.endswith('/files'):
+            return self._upload_file(body)
+
+        data = json.loads(body or b'{}')
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if path.endswith('/chat/completions'):
+            response = openai_completion(self.state, data)
+            if data.get('stream'):
+                return self._stream_openai(response, (data.get('stream_options') or {}).get('include_usage'))
+            self._simulate_generation(response['usage']['completion_tokens'])
+            return self._send_json(response)
+        if path.endswith('/messages/batches'):
+            return self._create_anthropic_batch(data)
+        if path.endswith('/messages'):
+            response = anthropic_message(self.state, data)
+            if data.get('stream'):
+                return self._stream_anthropic(response)
+            self._simulate_generation(response['usage']['output_tokens'])
+            return self._send_json(response)
+        if path == '/api/chat':
+            response = ollama_chat(self.state, data)
+            # Ollama 未指定 stream 時預設為串流
+            if data.get('stream', True):
+                return self._stream_ollama(response)
+            self._simulate_generation(response['eval_count'])
+            return self._send_json(response)
+        if path == '/api/generate':
+            return self._ollama_generate(data)
+        if path.endswith('/batches'):
+            return self._create_openai_batch(data)
+        self._not_found()
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+
+        match = re.search(r'/messages/batches/([^/]+)(/results)?$', path)
+        if match:
+            batch = self.state.batches.get(match.group(1))
+            if batch is None:
+                return self._not_found()
+            if match.group(2):
+                return self._anthropic_results(batch)
+            return self._send_json(self._anthropic_batch_view(batch))
+
+        match = re.search(r'/batches/([^/]+)$', path)
+        if match:
+            batch = self.state.batches.get(match.group(1))
+            if batch is None:
+                return self._not_found()
+            return self._send_json(self._openai_batch_view(batch))
+
+        match = re.search(r'/files/([^/]+)(/content)?$', path)
+        if match:
+            stored = self.state.files.get(match.group(1))
+            if stored is None:
+                return self._not_found()
+            if match.group(2):
+                return self._send_bytes(stored['content'], 'application/octet-stream')
+            return self._send_json(stored['meta'])
+        self._not_found()
+
+    # ---- OpenAI 文件與批次
+
+    def _store_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-{uuid.uuid4().hex[:16]}"
+        meta = {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                'filename': filename, 'purpose': purpose, 'status': 'processed'}
+        with self.state.lock:
+            self.state.files[file_id] = {'meta': meta, 'content': content}
+        return meta
+
+    def _upload_file(self, body: bytes):
+        message = email.message_from_bytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + body)
+        content, filename, purpose = b'', 'upload.jsonl', 'batch'
+        for part in message.walk():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'file':
+                content = part.get_payload(decode=True) or b''
+                filename = part.get_filename() or filename
+            elif name == 'purpose':
+                purpose = (part.get_payload(decode=True) or b'batch').decode()
+        self._send_json(self._store_file(content, filename, purpose))
+
+    def _create_openai_batch(self, data: dict):
+        stored = self.state.files.get(data.get('input_file_id'))
+        if stored is None:
+            return self._send_json({'error': {'message': '找不到 input_file_id'}}, 400)
+        requests = [json.loads(line) for line in stored['content'].decode('utf-8').splitlines() if line.strip()]
+        batch = {
+            'id': f"batch_{uuid.uuid4().hex[:16]}", 'object': 'batch', 'endpoint': data.get('endpoint'),
+            'input_file_id': data['input_file_id'], 'completion_window': data.get('completion_window', '24h'),
+            'created_at': int(time.time()), '_created': time.time(), '_kind': 'openai',
+            '_requests': requests, 'output_file_id': None,
+        }
+        with self.state.lock:
+            self.state.batches[batch['id']] = batch
+        self._send_json(self._openai_batch_view(batch))
+
+    def _openai_batch_view(self, batch: dict) -> dict:
+        total = len(batch['_requests'])
+        ready = self._batch_ready(batch)
+        if ready and batch['output_file_id'] is None:
+            lines = []
+            for request in batch['_requests']:
+                lines.append(json.dumps({
+                    'id': f"batch_req_{uuid.uuid4().hex[:12]}",
+                    'custom_id': request['custom_id'],
+                    'response': {'status_code': 200, 'request_id': uuid.uuid4().hex,
+                                 'body': openai_completion(self.state, request['body'])},
+                    'error': None,
+                }, ensure_ascii=False))
+            meta = self._store_file("\n".join(lines).encode('utf-8'), 'batch_output.jsonl', 'batch_output')
+            batch['output_file_id'] = meta['id']
+            batch['completed_at'] = int(time.time())
+        view = {key: value for key, value in batch.items() if not key.startswith('_')}
+        view.update({
+            'status': 'completed' if ready else 'in_progress',
+            'error_file_id': None,
+            'request_counts': {'total': total, 'completed': total if ready else 0, 'failed': 0},
+        })
+        return view
+
+    # ---- Anthropic 批次
+
+    def _create_anthropic_batch(self, data: dict):
+        batch = {
+            'id': f"msgbatch_{uuid.uuid4().hex[:16]}", '_created': time.time(), '_kind': 'anthropic',
+            '_requests': data.get('requests', []), '_results': None,
+        }
+        with self.state.lock:
+            self.state.batches[batch['id']] = batch
+        self._send_json(self._anthropic_batch_view(batch))
+
+    def _anthropic_batch_view(self, batch: dict) -> dict:
+        total = len(batch['_requests'])
+        ready = self._batch_ready(batch)
+        created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(batch['_created']))
+        host = self.headers.get('Host', '127.0.0.1')
+        return {
+            'id': batch['id'], 'type': 'message_batch',
+            'processing_status': 'ended' if ready else 'in_progress',
+            'request_counts': {'processing': 0 if ready else total, 'succeeded': total if ready else 0,
+                               'errored': 0, 'canceled': 0, 'expired': 0},
+            'created_at': created,
+            'expires_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(batch['_created'] + 86400)),
+            'ended_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()) if ready else None,
+            'cancel_initiated_at': None,
+            'archived_at': None,
+            'results_url': f"http://{host}/v1/messages/batches/{batch['id']}/results" if ready else None,
+        }
+
+    def _anthropic_results(self, batch: dict):
+        if not self._batch_ready(batch):
+            return self._send_json({'error': {'type': 'invalid_request_error',
+                                              'message': '批次尚未完成'}}, 400)
+        if batch['_results'] is None:
+            batch['_results'] = "\n".join(json.dumps({
+                'custom_id': request['custom_id'],
+                'result': {'type': 'succeeded', 'message': anthropic_message(self.state, request['params'])},
+            }, ensure_ascii=False) for request in batch['_requests']).encode('utf-8')
+        self._send_bytes(batch['_results'], 'application/binary')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模擬 OpenAI / Anthropic (含 Batch API) 與 Ollama API 的本機伺服器')
+    parser.add_argument('--host', default='127.0.0.1', help='監聽位址 (預設: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='監聽埠 (預設: 8765)')
+    parser.add_argument('--batch-delay', type=float, default=5,
+                        help='批次提交後多少秒完成 (預設: 5)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='一般請求的模擬延遲秒數 (預設: 0)')
+    parser.add_argument('--tokens-per-second', type=float,
+                        help='模擬的輸出 token 生成速度, 回應時間另加上 輸出 token 數 / 速度 (預設: 不模擬)')
+    parser.add_argument('--trailing-tokens', type=int, default=0,
+                        help='串流回應在 JSON 之後附加的說明文字量, 用於測量提前結束生成 (預設: 0)')
+    args = parser.parse_args()
+
+    StubHandler.state = StubState(args.batch_delay, args.latency, args.tokens_per_second, args.trailing_tokens)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"✓ LLM 模擬伺服器: http://{args.host}:{args.port}")
+    print(f"  OpenAI base URL:    http://{args.host}:{args.port}/v1")
+    print(f"  Anthropic base URL: http://{args.host}:{args.port}")
+    print(f"  Ollama base URL:    http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
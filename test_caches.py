@@ -0,0 +1,112 @@
+"""AnalysisCache 與 ConversionCache 的測試"""
+
+import os
+import time
+
+import pytest
+
+from fa_report_analyzer_v2 import AnalysisCache, ConversionCache, FAReportAnalyzer, ImageRecord
+
+
+def put_entries(cache, count, written=None):
+    """寫入 count 筆結果, 第 n 筆的寫入/使用時間為 written + n 秒"""
+    written = written or time.time() - 600
+    for n in range(count):
+        cache.put(f'k{n}', {'total_score': n, 'summary': 'x' * 100})
+        os.utime(cache._path(f'k{n}'), (written + n, written + n))
+
+
+def test_analysis_cache_evicts_least_recently_used_beyond_max_entries(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_entries=2)
+    put_entries(cache, 3)
+    assert cache.get('k0') is not None  # 讀取更新 atime, k0 變為最近使用
+    cache.evict()
+    assert cache.get('k0') is not None and cache.get('k2') is not None
+    assert cache.get('k1') is None
+
+
+def test_analysis_cache_evicts_beyond_size_limit(tmp_path):
+    cache = AnalysisCache(str(tmp_path))
+    put_entries(cache, 4)
+    cache.max_size = cache._path('k0').stat().st_size * 2
+    cache.evict()
+    assert [n for n in range(4) if cache.get(f'k{n}') is not None] == [2, 3]
+
+
+def test_analysis_cache_expires_by_write_time(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_age_days=1)
+    put_entries(cache, 2, written=time.time() - 2 * 86400)
+    cache.put('fresh', {'total_score': 1})
+    # 讀取不延長保留期限
+    assert cache.get('k0') is None
+    cache.evict()
+    assert sorted(path.stem for path in tmp_path.glob('*.json')) == ['fresh']
+
+
+def test_analysis_cache_removes_only_stale_temporary_files(tmp_path):
+    stale, writing = tmp_path / 'stale.tmp', tmp_path / 'writing.tmp'
+    stale.write_text('{')
+    writing.write_text('{')
+    old = time.time() - AnalysisCache.STALE_TMP_SECONDS - 60
+    os.utime(stale, (old, old))
+    AnalysisCache(str(tmp_path))
+    assert not stale.exists() and writing.exists()
+
+
+def produce(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+def test_conversion_cache_evicts_least_recently_used(tmp_path):
+    cache = ConversionCache(str(tmp_path / 'cache'))
+    paths = [cache.put(f'k{n}', produce(tmp_path, f'{n}.pptx', 1024), 'pptx') for n in range(3)]
+    for age, path in enumerate(reversed(paths)):
+        os.utime(path, (1000 - age, 1000 - age))
+    cache.max_size = 2500
+    cache.evict()
+    assert cache.get('k2', 'pptx') and cache.get('k1', 'pptx')
+    assert cache.get('k0', 'pptx') is None
+
+
+def test_pinned_conversions_survive_until_release(tmp_path):
+    cache = ConversionCache(str(tmp_path / 'cache'), max_size_mb=1.5 / 1024)  # 只容得下一個文件
+    cache.pin(['k0', 'k1', 'k2'])
+    for n in range(3):
+        cache.put(f'k{n}', produce(tmp_path, f'{n}.pptx', 1024), 'pptx')
+    assert all(cache.get(f'k{n}', 'pptx') for n in range(3))
+
+    cache.release()
+    assert sum(1 for n in range(3) if cache.get(f'k{n}', 'pptx')) == 1
+
+
+IMAGE = ImageRecord(b'\x89PNG\r\n\x1a\n', mime='image/png', width=10, height=10)
+
+
+def analysis_key(tmp_path, **options):
+    analyzer = FAReportAnalyzer(backend='openai', api_key='test', cache_dir=str(tmp_path), **options)
+    *_, cache_key, cached = analyzer._prepare_analysis("失效分析報告內容", [IMAGE])
+    assert cached is None
+    return cache_key
+
+
+@pytest.mark.parametrize('options', [
+    {'image_max_edge': 512},
+    {'image_quality': 60},
+    {'image_format': 'png'},
+    {'preprocess_images': False},
+    {'structured_output': False},
+    {'analysis_mode': 'mapreduce'},
+])
+def test_analysis_key_depends_on_settings(tmp_path, monkeypatch, options):
+    monkeypatch.setattr(FAReportAnalyzer, '_ensure_supported_images', lambda self, images: images)
+    monkeypatch.setattr(FAReportAnalyzer, '_prepare_images', lambda self, images: images)
+    assert analysis_key(tmp_path, **options) != analysis_key(tmp_path)
+
+
+def test_analysis_key_for_mapreduce_depends_on_chunk_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(FAReportAnalyzer, '_ensure_supported_images', lambda self, images: images)
+    monkeypatch.setattr(FAReportAnalyzer, '_prepare_images', lambda self, images: images)
+    assert (analysis_key(tmp_path, analysis_mode='mapreduce', chunk_chars=4000)
+            != analysis_key(tmp_path, analysis_mode='mapreduce'))
@@ -0,0 +1,42 @@
+"""共用 LLM 客戶端的關閉測試"""
+
+import asyncio
+
+import fa_report_analyzer_v2 as analyzer_module
+
+
+class SDKClient:
+    """OpenAI / Anthropic 風格: close() 為 coroutine"""
+
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class HttpxClient:
+    closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class OllamaClient:
+    """Ollama 風格: 只有內部 httpx 客戶端可關閉"""
+
+    def __init__(self):
+        self._client = HttpxClient()
+
+
+def test_aclose_async_clients_closes_clients_of_running_loop(monkeypatch):
+    clients = [SDKClient(), OllamaClient()]
+    monkeypatch.setattr(analyzer_module, '_create_client', lambda *args, **kwargs: clients.pop(0))
+
+    async def run():
+        sdk = analyzer_module.get_async_client('openai', 'http://sdk')
+        ollama = analyzer_module.get_async_client('ollama', 'http://ollama')
+        await analyzer_module.aclose_async_clients()
+        return sdk, ollama
+
+    sdk, ollama = asyncio.run(run())
+    assert sdk.closed and ollama._client.closed
@@ -0,0 +1,45 @@
+"""compact_report_text 的頁碼移除測試"""
+
+from fa_report_analyzer_v2 import PAGE_BREAK, compact_report_text
+
+
+def test_single_page_keeps_number_lines():
+    text = "量測結果\n2024\n失效率\n3/1000\n結論: 污染"
+    compacted, stats = compact_report_text(text)
+    assert compacted == text
+    assert stats['page_numbers'] == 0
+
+
+def test_single_page_keeps_explicit_markers():
+    text = "失效分析報告\n第 1 頁"
+    compacted, stats = compact_report_text(text)
+    assert compacted == text
+    assert stats['page_numbers'] == 0
+
+
+def test_increasing_page_numbers_are_removed():
+    pages = [f"第 {n} 章內容\n量測值 {n * 7}\n{n} / 4" for n in range(1, 5)]
+    compacted, stats = compact_report_text(PAGE_BREAK.join(pages))
+    assert stats['page_numbers'] == 4
+    assert all(f"{n} / 4" not in compacted for n in range(1, 5))
+    assert "量測值 28" in compacted
+
+
+def test_data_numbers_at_page_edges_are_kept():
+    pages = ["量測結果\n2024", "失效率\n3/1000", "結論\n2024"]
+    compacted, stats = compact_report_text(PAGE_BREAK.join(pages))
+    assert stats['page_numbers'] == 0
+    assert "2024" in compacted and "3/1000" in compacted
+
+
+def test_bare_numbers_on_two_pages_are_kept():
+    compacted, stats = compact_report_text(PAGE_BREAK.join(["前言\n1", "結論\n2"]))
+    assert stats['page_numbers'] == 0
+    assert compacted.split(PAGE_BREAK) == ["前言\n1", "結論\n2"]
+
+
+def test_explicit_markers_are_removed_on_multi_page_input():
+    pages = ["前言\nPage 1 of 2", "- 2 -\n結論"]
+    compacted, stats = compact_report_text(PAGE_BREAK.join(pages))
+    assert stats['page_numbers'] == 2
+    assert compacted.split(PAGE_BREAK) == ["前言", "結論"]
@@ -0,0 +1,38 @@
+"""sniff_image_mime 依檔頭判斷圖片格式的測試"""
+
+import pytest
+
+from fa_report_analyzer_v2 import ImageRecord, sniff_image_mime
+
+
+@pytest.mark.parametrize('head, mime', [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'RIFF\x24\x00\x00\x00WEBPVP8 ', 'image/webp'),
+    (b'BM\x36\x00', 'image/bmp'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'\x01\x00\x00\x00' + b'\x00' * 36 + b' EMF', 'image/emf'),
+    (b'\xd7\xcd\xc6\x9a', 'image/wmf'),
+    (b'\x01\x00\x09\x00', 'image/wmf'),
+    (b'\x00\x00\x00\x0cjP  \r\n\x87\n', 'image/jp2'),
+    (b'\xff\x4f\xff\x51', 'image/jp2'),
+])
+def test_known_signatures(head, mime):
+    assert sniff_image_mime(head + b'\x00' * 32) == mime
+
+
+@pytest.mark.parametrize('data', [b'', b'RIFF\x24\x00\x00\x00WAVEfmt ', b'%PDF-1.7', b'<svg'])
+def test_unknown_data_is_octet_stream(data):
+    assert sniff_image_mime(data) == 'application/octet-stream'
+
+
+def test_memoryview_is_accepted():
+    assert sniff_image_mime(memoryview(b'\x89PNG\r\n\x1a\n' + b'\x00' * 8)) == 'image/png'
+
+
+def test_image_record_mime_comes_from_data():
+    assert ImageRecord(b'\xff\xd8\xff\xe0' + b'\x00' * 16).format == 'jpeg'
+    assert not ImageRecord(b'BM' + b'\x00' * 16).is_supported
@@ -0,0 +1,90 @@
+"""_ImageSelector 圖片篩選與重複引用計數的測試"""
+
+import io
+import random
+
+import pytest
+
+from fa_report_analyzer_v2 import FAReportAnalyzer, ImageRecord, _ImageSelector
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def noisy_image(seed: int, size=(320, 240)) -> bytes:
+    """有資訊量的圖片 (雜訊, 不會被當作裝飾性或近似重複)"""
+    rng = random.Random(seed)
+    image = Image.frombytes('RGB', size, rng.randbytes(size[0] * size[1] * 3))
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def encode(image, format='PNG', **options) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=format, **options)
+    return output.getvalue()
+
+
+def test_icons_and_banners_are_decorative():
+    selector = _ImageSelector(limit=5)
+    selector.add_image(ImageRecord(noisy_image(1, (48, 48))))
+    selector.add_image(ImageRecord(noisy_image(2, (1200, 100))))
+    selector.add_image(ImageRecord(encode(Image.new('RGB', (400, 300), 'white'))))  # 小於 MIN_BYTES
+    assert selector.result() == []
+    assert selector.stats['decorative'] == 3
+
+
+def test_exact_and_near_duplicates_are_counted_once():
+    selector = _ImageSelector(limit=5)
+    original = noisy_image(1)
+    reencoded = encode(Image.open(io.BytesIO(original)).convert('RGB'), 'JPEG', quality=90)
+    for data in (original, original, reencoded):
+        selector.add_image(ImageRecord(data))
+    assert len(selector.result()) == 1
+    assert selector.stats == {'scanned': 3, 'duplicates': 2, 'decorative': 0, 'selected': 1}
+
+
+def test_images_on_analysis_pages_rank_higher():
+    selector = _ImageSelector(limit=1)
+    selector.add_text(2, "SEM 截面顯示 crack, 失效位置位於焊點")
+    selector.add_image(ImageRecord(noisy_image(1), page=1))
+    evidence = ImageRecord(noisy_image(2), page=2)
+    selector.add_image(evidence)
+    assert selector.result() == [evidence]
+
+
+def test_memory_limit_drops_lowest_scoring_image_and_keeps_document_order():
+    images = [ImageRecord(noisy_image(n, (320 + 80 * n, 240)), page=n) for n in range(3)]
+    selector = _ImageSelector(limit=3, max_bytes=images[1].size + images[2].size)
+    selector.add_text(1, "SEM")
+    selector.add_text(2, "SEM crack")
+    for image in images:
+        selector.add_image(image)
+    assert selector.result() == images[1:]
+
+
+def test_repeated_references_rank_below_unique_image():
+    selector = _ImageSelector(limit=1)
+    selector.add_image(ImageRecord(noisy_image(1, (640, 480)), page=1, occurrences=5))
+    unique = ImageRecord(noisy_image(2), page=2)
+    selector.add_image(unique)
+    assert selector.result() == [unique]
+    assert selector.stats['duplicates'] == 4
+
+
+def test_pdf_shared_xref_is_read_once_with_occurrence_count(tmp_path):
+    fitz = pytest.importorskip('fitz')
+    path = tmp_path / 'report.pdf'
+    document = fitz.open()
+    logo = None
+    for _ in range(3):
+        page = document.new_page()
+        rect = fitz.Rect(40, 40, 200, 160)
+        logo = page.insert_image(rect, xref=logo) if logo else page.insert_image(rect, stream=noisy_image(1))
+    document[1].insert_image(fitz.Rect(40, 300, 360, 540), stream=noisy_image(2))
+    document.save(str(path))
+    document.close()
+
+    analyzer = FAReportAnalyzer(backend='openai', api_key='test', use_cache=False)
+    images = [part for part in analyzer.iter_report_parts(str(path)) if isinstance(part, ImageRecord)]
+    assert sorted((img.page, img.occurrences) for img in images) == [(1, 3), (2, 1)]
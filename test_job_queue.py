@@ -0,0 +1,100 @@
+"""JobQueue 租約、中斷恢復與重試退避的測試"""
+
+import sqlite3
+import time
+
+import pytest
+
+from fa_report_analyzer_v2 import JobQueue
+
+
+@pytest.fixture
+def reports(tmp_path):
+    paths = []
+    for n in range(2):
+        path = tmp_path / f"report{n}.txt"
+        path.write_text(f"報告 {n}", encoding='utf-8')
+        paths.append(path)
+    return paths
+
+
+def make_queue(tmp_path, reports, **options):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), **options)
+    queue.enqueue({path: str(path.with_suffix('.md')) for path in reports})
+    return queue
+
+
+def test_claim_hands_out_each_job_once(tmp_path, reports):
+    queue = make_queue(tmp_path, reports)
+    first, second = queue.claim('a'), queue.claim('b')
+    assert {first['path'], second['path']} == {str(path.resolve()) for path in reports}
+    assert queue.claim('c') is None
+
+
+def test_expired_lease_is_reclaimed(tmp_path, reports):
+    queue = make_queue(tmp_path, reports[:1], lease_seconds=-1)
+    job = queue.claim('a')
+    again = queue.claim('b')
+    assert again['id'] == job['id'] and again['attempts'] == 2
+
+
+def test_completed_jobs_are_skipped_on_resume(tmp_path, reports):
+    queue = make_queue(tmp_path, reports)
+    job = queue.claim('a')
+    queue.complete(job['id'], {'total_score': 80, 'grade': 'B'}, 1.0)
+
+    resumed = make_queue(tmp_path, reports)
+    remaining = resumed.claim('b')
+    assert remaining['id'] != job['id']
+    assert resumed.claim('c') is None
+    assert resumed.counts() == {'done': 1, 'running': 1}
+
+
+def test_changed_report_is_requeued(tmp_path, reports):
+    queue = make_queue(tmp_path, reports[:1])
+    job = queue.claim('a')
+    queue.complete(job['id'], {'total_score': 80, 'grade': 'B'}, 1.0)
+    reports[0].write_text("修改後的報告", encoding='utf-8')
+    assert make_queue(tmp_path, reports[:1]).counts() == {'pending': 1}
+
+
+def test_failed_job_waits_for_backoff(tmp_path, reports):
+    queue = make_queue(tmp_path, reports[:1], retry_delay=30)
+    job = queue.claim('a')
+    before = time.time()
+    queue.fail(job['id'], RuntimeError("逾時"), 1.0)
+
+    assert queue.claim('a') is None
+    assert before + 30 <= queue.next_retry() <= time.time() + 30
+
+
+def test_backoff_doubles_with_attempts(tmp_path, reports):
+    queue = make_queue(tmp_path, reports[:1], retry_delay=10, max_attempts=5)
+    job = queue.claim('a')
+    queue.fail(job['id'], RuntimeError("錯誤"), 1.0)
+    with sqlite3.connect(queue.db_path) as conn:
+        conn.execute("UPDATE jobs SET retry_at = 0")
+    job = queue.claim('a')
+    start = time.time()
+    queue.fail(job['id'], RuntimeError("錯誤"), 1.0)
+    assert queue.next_retry() == pytest.approx(start + 20, abs=1)
+
+
+def test_failed_job_is_not_retried_after_max_attempts(tmp_path, reports):
+    queue = make_queue(tmp_path, reports[:1], retry_delay=0, max_attempts=2)
+    for _ in range(2):
+        job = queue.claim('a')
+        queue.fail(job['id'], RuntimeError("錯誤"), 1.0)
+    assert queue.claim('a') is None
+    assert queue.next_retry() is None
+
+
+def test_existing_queue_without_retry_column_is_migrated(tmp_path, reports):
+    legacy_schema = JobQueue.SCHEMA.replace(",\n            retry_at REAL", "")
+    assert 'retry_at' not in legacy_schema
+    with sqlite3.connect(tmp_path / 'jobs.db') as conn:
+        conn.executescript(legacy_schema)
+    queue = make_queue(tmp_path, reports[:1], retry_delay=0)
+    job = queue.claim('a')
+    queue.fail(job['id'], RuntimeError("錯誤"), 1.0)
+    assert queue.claim('a')['attempts'] == 2
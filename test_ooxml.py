@@ -0,0 +1,148 @@
+"""OOXMLPackage 文字與圖片提取的測試 (以 zipfile 建立最小的 DOCX/PPTX)"""
+
+import zipfile
+
+import pytest
+
+from fa_report_analyzer_v2 import FAReportAnalyzer, ImageRecord, OOXMLPackage
+
+NS = ('xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+      'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+      'xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+      'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+      'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"')
+REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 32
+
+
+def rels(*relations):
+    """關係部分 XML; relations 為 (rId, 類型, 目標[, 'External'])"""
+    items = ''.join(
+        f'<Relationship Id="{rid}" Type="{REL_TYPE}{kind}" Target="{target}"'
+        + (' TargetMode="External"' if external else '') + '/>'
+        for rid, kind, target, *external in relations)
+    return ('<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{items}</Relationships>')
+
+
+def build(path, parts):
+    with zipfile.ZipFile(path, 'w') as package:
+        for name, data in parts.items():
+            package.writestr(name, data)
+    return str(path)
+
+
+def run(text):
+    return f'<w:r><w:t>{text}</w:t></w:r>'
+
+
+def blip(rid):
+    return f'<w:r><w:drawing><a:blip r:embed="{rid}"/></w:drawing></w:r>'
+
+
+@pytest.fixture
+def docx(tmp_path):
+    body = (
+        f'<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="720"/></w:tabs></w:pPr>'
+        f'{run("失效")}<w:r><w:tab/></w:r>{run("分析")}</w:p>'
+        f'<w:p>{run("第一行")}<w:r><w:br/></w:r>{run("第二行")}</w:p>'
+        '<w:tbl>'
+        f'<w:tr><w:tc><w:p>{run("項目")}</w:p></w:tc><w:tc><w:p>{run("結果")}</w:p></w:tc></w:tr>'
+        f'<w:tr><w:tc><w:p>{run("電壓")}</w:p></w:tc><w:tc><w:p>{run("3.3")}</w:p><w:p>{run("V")}</w:p></w:tc></w:tr>'
+        '</w:tbl>'
+        '<mc:AlternateContent><mc:Choice Requires="wps">'
+        f'<w:p>{run("文字方塊")}</w:p></mc:Choice>'
+        f'<mc:Fallback><w:p>{run("文字方塊")}</w:p></mc:Fallback></mc:AlternateContent>'
+        f'<w:p>{blip("rId2")}{blip("rId1")}{blip("rId2")}{blip("rId9")}</w:p>'
+        '<w:p><w:r><w:t>  </w:t></w:r></w:p>'
+    )
+    return build(tmp_path / 'report.docx', {
+        '_rels/.rels': rels(('rId1', 'officeDocument', 'word/main.xml')),
+        'word/main.xml': f'<w:document {NS}><w:body>{body}</w:body></w:document>',
+        'word/_rels/main.xml.rels': rels(
+            ('rId1', 'image', 'media/image1.png'),
+            ('rId2', 'image', '/word/media/image2.jpeg'),
+            ('rId3', 'image', 'media/unused.png'),
+            ('rId4', 'hyperlink', 'https://example.com', 'External')),
+        'word/media/image1.png': PNG,
+        'word/media/image2.jpeg': JPEG,
+        'word/media/unused.png': PNG + b'unused',
+    })
+
+
+def test_docx_text_paragraphs_tables_and_text_boxes(docx):
+    with OOXMLPackage(docx) as package:
+        document = package.main_part('word/document.xml')
+        lines, images = package.text(document)
+    assert document == 'word/main.xml'
+    assert lines == ['失效\t分析', '第一行\n第二行', '項目 | 結果', '電壓 | 3.3 V', '文字方塊']
+    assert images == ['word/media/image2.jpeg', 'word/media/image1.png']
+
+
+def test_rels_skip_external_targets(docx):
+    with OOXMLPackage(docx) as package:
+        relations = package.rels('word/main.xml')
+        assert 'rId4' not in relations
+        assert package.related('word/main.xml', 'image') == [
+            'word/media/image1.png', 'word/media/image2.jpeg', 'word/media/unused.png']
+
+
+def test_docx_reader_yields_referenced_images_first(docx):
+    analyzer = FAReportAnalyzer(backend='openai', api_key='test', use_cache=False)
+    parts = list(analyzer._iter_docx_parts(docx))
+    assert parts[0][1].startswith('失效\t分析')
+    assert [images[0][0] for _, _, images in parts[1:]] == [JPEG, PNG, PNG + b'unused']
+
+
+def shape(text, placeholder=None):
+    ph = f'<p:nvSpPr><p:nvPr><p:ph type="{placeholder}"/></p:nvPr></p:nvSpPr>' if placeholder else ''
+    return f'<p:sp>{ph}<p:txBody><a:p><a:r><a:t>{text}</a:t></a:r></a:p></p:txBody></p:sp>'
+
+
+def slide(*content):
+    return f'<p:sld {NS}><p:cSld><p:spTree>{"".join(content)}</p:spTree></p:cSld></p:sld>'
+
+
+@pytest.fixture
+def pptx(tmp_path):
+    picture = '<p:pic><p:blipFill><a:blip r:embed="rId2"/></p:blipFill></p:pic>'
+    table = ('<a:tbl><a:tr><a:tc><a:txBody><a:p><a:r><a:t>Vth</a:t></a:r></a:p></a:txBody></a:tc>'
+             '<a:tc><a:txBody><a:p><a:r><a:t>0.7</a:t></a:r></a:p></a:txBody></a:tc></a:tr></a:tbl>')
+    notes = (f'<p:notes {NS}><p:cSld><p:spTree>{shape("投影片縮圖", "sldImg")}'
+             f'{shape("講者備註", "body")}{shape("2", "sldNum")}</p:spTree></p:cSld></p:notes>')
+    return build(tmp_path / 'deck.pptx', {
+        '_rels/.rels': rels(('rId1', 'officeDocument', 'ppt/presentation.xml')),
+        # 投影片順序依 presentation.xml, 而非部分名稱
+        'ppt/presentation.xml': (f'<p:presentation {NS}><p:sldIdLst>'
+                                 '<p:sldId id="256" r:id="rId3"/><p:sldId id="257" r:id="rId2"/>'
+                                 '</p:sldIdLst></p:presentation>'),
+        'ppt/_rels/presentation.xml.rels': rels(('rId2', 'slide', 'slides/slide2.xml'),
+                                                ('rId3', 'slide', 'slides/slide1.xml')),
+        'ppt/slides/slide1.xml': slide(shape("標題"), picture, table),
+        'ppt/slides/_rels/slide1.xml.rels': rels(('rId2', 'image', '../media/logo.png'),
+                                                 ('rId3', 'notesSlide', '../notesSlides/notesSlide1.xml')),
+        'ppt/slides/slide2.xml': slide(shape("結論"), picture),
+        'ppt/slides/_rels/slide2.xml.rels': rels(('rId2', 'image', '../media/logo.png')),
+        'ppt/notesSlides/notesSlide1.xml': notes,
+        'ppt/media/logo.png': PNG,
+    })
+
+
+def test_pptx_notes_keep_only_body_placeholder(pptx):
+    with OOXMLPackage(pptx) as package:
+        lines, images = package.text('ppt/notesSlides/notesSlide1.xml', body_placeholders_only=True)
+    assert lines == ['講者備註'] and images == []
+
+
+def test_pptx_reader_follows_slide_order_and_reads_shared_image_once(pptx):
+    analyzer = FAReportAnalyzer(backend='openai', api_key='test', use_cache=False)
+    parts = list(analyzer._iter_pptx_parts(pptx))
+    assert [(page, text) for page, text, _ in parts] == [(1, '標題\nVth | 0.7\n[備註] 講者備註'), (2, '結論')]
+    assert parts[0][2] == [(PNG, 2)] and parts[1][2] == []
+
+
+def test_pptx_images_become_records_with_occurrences(pptx):
+    analyzer = FAReportAnalyzer(backend='openai', api_key='test', use_cache=False)
+    images = [part for part in analyzer.iter_report_parts(pptx) if isinstance(part, ImageRecord)]
+    assert [(img.page, img.mime, img.occurrences) for img in images] == [(1, 'image/png', 2)]
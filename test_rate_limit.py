@@ -0,0 +1,140 @@
+"""RateLimitScheduler 重試退避與 rate-limit 標頭處理的測試 (不連線)"""
+
+import time
+from email.utils import formatdate
+
+import pytest
+
+from fa_report_analyzer_v2 import RateLimitScheduler, _parse_reset_time, _parse_retry_after
+
+
+class Response:
+    def __init__(self, status_code=429, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class APIError(Exception):
+    def __init__(self, status_code=429, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = Response(status_code, headers)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """記錄重試前 time.sleep 的秒數而不實際等待 (同時推進 time.monotonic)"""
+    clock = [time.monotonic()]
+    calls = []
+
+    def sleep(seconds):
+        calls.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return calls
+
+
+def failing(errors, result='ok'):
+    def func():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return func
+
+
+def test_retry_after_header_sets_retry_delay(sleeps):
+    scheduler = RateLimitScheduler('test', max_delay=60)
+    errors = [APIError(429, {'retry-after': '7'})]
+    assert scheduler.call(failing(errors)) == 'ok'
+    assert sleeps[0] == 7
+    assert scheduler.stats['retries'] == 1
+
+
+def test_retry_after_is_capped_by_max_delay(sleeps):
+    scheduler = RateLimitScheduler('test', max_delay=5)
+    scheduler.call(failing([APIError(503, {'retry-after': '120'})]))
+    assert sleeps[0] == 5
+
+
+def test_exponential_backoff_with_jitter(sleeps):
+    scheduler = RateLimitScheduler('test', base_delay=1.0, max_delay=60)
+    scheduler.call(failing([APIError(500) for _ in range(4)]))
+    # 第 n 次重試等待 base_delay * 2**n 的一半到全部
+    assert [2 ** n / 2 <= delay <= 2 ** n for n, delay in enumerate(sleeps)] == [True] * 4
+
+
+def test_gives_up_after_max_retries(sleeps):
+    scheduler = RateLimitScheduler('test', max_retries=2)
+    with pytest.raises(APIError):
+        scheduler.call(failing([APIError(429) for _ in range(3)]))
+    assert len(sleeps) == 2
+
+
+@pytest.mark.parametrize('error', [APIError(400), ValueError("格式錯誤")])
+def test_non_retryable_errors_are_raised_immediately(sleeps, error):
+    scheduler = RateLimitScheduler('test')
+    with pytest.raises(type(error)):
+        scheduler.call(failing([error]))
+    assert sleeps == []
+
+
+def test_connection_errors_are_retried(sleeps):
+    scheduler = RateLimitScheduler('test')
+    assert scheduler.call(failing([ConnectionResetError(), TimeoutError()])) == 'ok'
+    assert len(sleeps) == 2
+
+
+def test_retry_after_pauses_later_requests():
+    scheduler = RateLimitScheduler('test')
+    scheduler.update_from_headers({'retry-after': '30'})
+    assert 29 < scheduler._reserve(0) <= 30
+
+
+def test_exhausted_quota_pauses_until_reset():
+    scheduler = RateLimitScheduler('test')
+    scheduler.update_from_headers({'x-ratelimit-limit-requests': '100',
+                                   'x-ratelimit-remaining-requests': '0',
+                                   'x-ratelimit-reset-requests': '6m0s'})
+    assert scheduler.requests_per_minute == 95
+    assert 359 < scheduler._reserve(0) <= 360
+
+
+def test_requests_per_minute_limit():
+    scheduler = RateLimitScheduler('test', requests_per_minute=2)
+    assert scheduler._reserve(0) == 0 and scheduler._reserve(0) == 0
+    assert 59 < scheduler._reserve(0) <= 60
+
+
+def test_tokens_per_minute_limit():
+    scheduler = RateLimitScheduler('test', tokens_per_minute=1000)
+    assert scheduler._reserve(600) == 0
+    assert scheduler._reserve(300) == 0
+    assert scheduler._reserve(200) > 59
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('12', 12.0),
+    ('1.5', 1.5),
+    ('-3', 0.0),
+    (None, None),
+    ('soon', None),
+])
+def test_parse_retry_after(value, expected):
+    assert _parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    assert 25 < _parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1s', 1.0),
+    ('20ms', 0.02),
+    ('6m0s', 360.0),
+    ('1h2m', 3720.0),
+    ('1970-01-01T00:00:00Z', 0.0),
+    ('later', None),
+])
+def test_parse_reset_time(value, expected):
+    assert _parse_reset_time(value) == (pytest.approx(expected) if expected is not None else None)
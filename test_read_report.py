@@ -0,0 +1,52 @@
+"""read_report 公開返回格式與分頁符號處理的測試"""
+
+import base64
+
+import pytest
+
+from fa_report_analyzer_v2 import PAGE_BREAK, FAReportAnalyzer, split_report_sections
+
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+
+@pytest.fixture
+def analyzer():
+    return FAReportAnalyzer(backend='openai', api_key='test', use_cache=False)
+
+
+def test_read_report_returns_base64_image_dicts(analyzer, tmp_path):
+    path = tmp_path / 'photo.png'
+    path.write_bytes(PNG)
+    text, images = analyzer.read_report(str(path))
+    assert images == [{'type': 'image', 'data': base64.b64encode(PNG).decode('ascii'),
+                       'format': 'png', 'page': 1}]
+
+
+def test_read_report_separates_pages_without_form_feed(analyzer, tmp_path):
+    fitz = pytest.importorskip('fitz')
+    path = tmp_path / 'report.pdf'
+    document = fitz.open()
+    for text in ("Page one", "Page two"):
+        document.new_page().insert_text((72, 72), text)
+    document.save(str(path))
+    document.close()
+
+    text, _ = analyzer.read_report(str(path))
+    assert PAGE_BREAK not in text
+    assert "Page one" in text and "Page two" in text
+
+
+@pytest.mark.parametrize('compact_prompt', [True, False])
+def test_prompt_does_not_contain_page_breaks(tmp_path, compact_prompt):
+    analyzer = FAReportAnalyzer(backend='openai', api_key='test', use_cache=False,
+                                compact_prompt=compact_prompt)
+    report = PAGE_BREAK.join(["第一頁\n量測結果", "第二頁\n根因分析"])
+    content, prompt, *_ = analyzer._prepare_analysis(report)
+    assert PAGE_BREAK not in content and PAGE_BREAK not in prompt
+    assert "量測結果\n\n第二頁" in prompt
+
+
+def test_map_reduce_chunks_do_not_contain_page_breaks():
+    chunks = split_report_sections(PAGE_BREAK.join(["第一頁\n量測結果", "第二頁\n根因分析"]), 1000)
+    assert chunks and not any(PAGE_BREAK in chunk for chunk in chunks)
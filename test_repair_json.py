@@ -0,0 +1,39 @@
+"""repair_json 常見 JSON 格式錯誤修復的測試"""
+
+import json
+
+import pytest
+
+from fa_report_analyzer_v2 import repair_json
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"a": 1, "b": [1, 2,],}', {'a': 1, 'b': [1, 2]}),
+    ('{"a": [1, 2 ,\n ]\n}', {'a': [1, 2]}),
+    ('{"summary": "第一行\n第二行\t結束"}', {'summary': '第一行\n第二行\t結束'}),
+    ('{"summary": "a\r\nb"}', {'summary': 'a\nb'}),
+    ('{"ok": True, "bad": False, "none": None}', {'ok': True, 'bad': False, 'none': None}),
+])
+def test_common_errors_are_repaired(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_python_literals_inside_strings_are_kept():
+    assert json.loads(repair_json('{"note": "True, None]"}')) == {'note': 'True, None]'}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"a": {"b": [1, 2', {'a': {'b': [1, 2]}}),
+    ('{"a": "截斷的字', {'a': '截斷的字'}),
+    ('{"a": "x\\', {'a': 'x'}),
+    ('{"a": 1,', {'a': 1}),
+    ('{"a": 1, "b":', {'a': 1}),
+    ('{"a": 1, "b"', {'a': 1}),
+])
+def test_truncated_response_is_closed(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_valid_json_is_unchanged():
+    text = '{"a": [1, {"b": "c,]"}], "d": "\\"quoted\\""}'
+    assert repair_json(text) == text
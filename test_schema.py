@@ -0,0 +1,68 @@
+"""schema_problems 結果格式檢查的測試"""
+
+import pytest
+
+from fa_report_analyzer_v2 import build_result_schema, schema_problems
+
+SCHEMA = build_result_schema({'數據完整性': 60, '根因分析': 40})
+
+
+def valid_result():
+    return {
+        'total_score': 85,
+        'grade': 'B',
+        'dimension_scores': {
+            '數據完整性': {'score': 50, 'percentage': 83.3, 'comment': '完整'},
+            '根因分析': {'score': 35, 'percentage': 87.5, 'comment': '清楚'},
+        },
+        'strengths': ['數據充分'],
+        'improvements': [{'priority': '高', 'item': '根因', 'suggestion': '補充驗證'}],
+        'summary': '良好',
+    }
+
+
+def test_valid_result_has_no_problems():
+    assert schema_problems(valid_result(), SCHEMA) == []
+
+
+def test_numeric_strings_are_converted_in_place():
+    result = valid_result()
+    result['total_score'] = ' 85.5分'
+    assert schema_problems(result, SCHEMA) == []
+    assert result['total_score'] == 85.5
+
+
+@pytest.mark.parametrize('path, value', [
+    (('grade',), 'Z'),
+    (('improvements', 0, 'priority'), 'urgent'),
+])
+def test_value_outside_enum_is_reported(path, value):
+    result = valid_result()
+    target = result
+    for key in path[:-1]:
+        target = target[key]
+    target[path[-1]] = value
+    problems = schema_problems(result, SCHEMA)
+    assert len(problems) == 1 and path[-1] in problems[0]
+
+
+def test_enum_match_ignores_whitespace_and_case():
+    result = valid_result()
+    result['grade'] = ' b '
+    assert schema_problems(result, SCHEMA) == []
+    assert result['grade'] == 'B'
+
+
+def test_unexpected_properties_are_reported():
+    result = valid_result()
+    result['confidence'] = 0.9
+    result['dimension_scores']['根因分析']['note'] = '額外欄位'
+    problems = schema_problems(result, SCHEMA)
+    assert sorted(problems) == ['$.confidence 不在 schema 中', '$.dimension_scores.根因分析.note 不在 schema 中']
+
+
+def test_missing_and_mistyped_fields_are_reported():
+    result = valid_result()
+    del result['summary']
+    result['strengths'] = '數據充分'
+    assert sorted(schema_problems(result, SCHEMA)) == ['$.strengths 應為陣列', '$.summary 缺少']
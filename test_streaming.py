@@ -0,0 +1,80 @@
+"""串流回應 (_JSONStreamScanner 與 _run_stream) 的測試"""
+
+import pytest
+
+from fa_report_analyzer_v2 import FAReportAnalyzer, _JSONStreamScanner
+
+
+def feed_all(chunks):
+    scanner = _JSONStreamScanner()
+    for chunk in chunks:
+        scanner.feed(chunk)
+        if scanner.complete or scanner.refused:
+            break
+    return scanner
+
+
+def test_scanner_stops_at_closing_brace_across_chunks():
+    scanner = feed_all(['說明文字 {"a": {"b"', ': [1, 2]}, "c": "x}"', '} 之後的文字', '{"ignored": 1}'])
+    assert scanner.complete
+    assert scanner.json_text == '{"a": {"b": [1, 2]}, "c": "x}"}'
+
+
+def test_scanner_ignores_escaped_quotes_in_strings():
+    scanner = feed_all(['{"a": "say \\"}\\" now"', '}'])
+    assert scanner.json_text == '{"a": "say \\"}\\" now"}'
+
+
+def test_scanner_waits_for_unclosed_object():
+    scanner = feed_all(['```json\n{"a": [{"b": 1}', ', {"c": "{"}'])
+    assert not scanner.complete and scanner.json_text is None
+    scanner.feed(']}\n```')
+    assert scanner.json_text == '{"a": [{"b": 1}, {"c": "{"}]}'
+
+
+def test_scanner_keeps_text_after_object():
+    scanner = feed_all(['{"a": 1}', ' 多餘的文字'])
+    assert scanner.text == '{"a": 1}' and scanner.json_text == '{"a": 1}'
+    scanner.feed('尾端')
+    assert scanner.text.endswith('尾端') and scanner.json_text == '{"a": 1}'
+
+
+def test_scanner_ignores_refusal_words_outside_window():
+    scanner = feed_all(['x' * (_JSONStreamScanner.REFUSAL_WINDOW + 10), "I'm sorry"])
+    assert not scanner.refused
+
+
+def test_scanner_detects_refusal_before_json():
+    scanner = feed_all(["I'm sorry, but I can't help", " with that."])
+    assert scanner.refused and not scanner.complete
+
+
+def test_scanner_does_not_flag_refusal_after_json_starts():
+    scanner = feed_all(['{"summary": "抱歉', '"}'])
+    assert scanner.complete and not scanner.refused
+
+
+def stream(chunks):
+    yield from chunks
+
+
+@pytest.fixture
+def analyzer():
+    return FAReportAnalyzer(backend='openai', api_key='test', use_cache=False, stream=True)
+
+
+def test_run_stream_returns_complete_object(analyzer):
+    text = analyzer._run_stream(stream(['{"total_score": ', '80}', ' trailing']), 'OpenAI')
+    assert text == '{"total_score": 80}'
+
+
+def test_empty_stream_raises_without_fix_request(analyzer, monkeypatch):
+    monkeypatch.setattr(analyzer, '_stream_openai', lambda *args: stream([]))
+    monkeypatch.setattr(analyzer, '_fix_json', lambda *args: pytest.fail("不應送出格式修正請求"))
+    with pytest.raises(ValueError, match='沒有任何內容'):
+        analyzer._dispatch('報告', schema=analyzer.result_schema)
+
+
+def test_refused_stream_raises(analyzer):
+    with pytest.raises(ValueError, match='拒絕'):
+        analyzer._run_stream(stream(["I'm sorry, I cannot evaluate this report."]), 'OpenAI')